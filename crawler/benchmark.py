@@ -0,0 +1,124 @@
+import shlex
+import typing
+
+import click
+import pandas as pd
+
+from src import benchmarks, log_utils, standin, synthetic
+from src.constants import Files
+
+LOG = log_utils.configure_logger()
+
+
+def print_results(results: typing.List[dict]):
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', None):
+        print(pd.DataFrame(results).to_string(index=False))
+
+
+@click.group(help="Benchmarks of the crawler and the normalization")
+@click.option("--history", type=str, default=Files.BENCHMARKS, show_default=True,
+              help="json file to which the results are appended")
+@click.option("--no-history", is_flag=True, help="only prints the results, nothing is appended to the history")
+@click.pass_context
+def cli(ctx, history: str, no_history: bool):
+    ctx.ensure_object(dict)
+    ctx.obj['history'] = history
+    ctx.obj['record'] = not no_history
+
+
+@cli.command(help="runs the download commands against a local stand-in of the github api and reports records/s, "
+                  "requests/s, page latency and peak memory")
+@click.option("cases", "-c", "--case", type=click.Choice(list(benchmarks.CRAWL_CASES)), multiple=True,
+              help="case to run (repeatable, default: all)")
+@click.option("--commits", type=int, default=2000, show_default=True, help="commits of the synthetic repository")
+@click.option("--prs", type=int, default=500, show_default=True, help="PRs of the synthetic repository")
+@click.option("--reviews", type=int, default=3, show_default=True, help="average reviews per PR")
+@click.option("--review-threads", type=int, default=2, show_default=True, help="average review threads per PR")
+@click.option("--comments", type=int, default=3, show_default=True,
+              help="average comments per PR and per review thread")
+@click.option("--latency", type=float, default=0., show_default=True, help="mean response latency in milliseconds")
+@click.option("--error-rate", type=float, default=0., show_default=True,
+              help="share of requests that fail with a secondary rate limit (403)")
+@click.option("--retry-after", type=float, default=1., show_default=True,
+              help="seconds in the Retry-After header of rate limit errors")
+@click.option("--options", type=str, default='', help="options of download.py for every case, e.g., '-p -n'")
+@click.pass_context
+def crawl(ctx, cases: typing.Tuple[str], commits: int, prs: int, reviews: int, review_threads: int, comments: int,
+          latency: float, error_rate: float, retry_after: float, options: str):
+    cases = list(cases or benchmarks.CRAWL_CASES)
+    sizes = standin.Sizes(commits=commits, prs=prs, reviews=reviews, review_threads=review_threads,
+                          comments=comments)
+    results = benchmarks.benchmark_crawl(cases, sizes, latency / 1000, error_rate, retry_after, shlex.split(options))
+    print_results(results)
+    if ctx.obj['record']:
+        parameters = dict(commits=commits, prs=prs, reviews=reviews, review_threads=review_threads,
+                          comments=comments, latency=latency, error_rate=error_rate, retry_after=retry_after,
+                          options=options)
+        benchmarks.append_history(ctx.obj['history'], 'crawl', parameters, results)
+    if not all(result['ok'] for result in results):
+        raise click.ClickException("some cases failed, see log for details")
+
+
+@cli.command(help="times the extractors (micro) and the normalize.py commands (macro) on synthetic PRs, reviews and "
+                  "commits drawn from the PRs in pr_info_small.txt and ../notebooks/data/prs_kafka.txt")
+@click.option("scales", "-s", "--scale", type=int, multiple=True, default=(1000, 10000, 100000), show_default=True,
+              help="number of input records of the normalize.py commands (repeatable)")
+@click.option("cases", "-c", "--case", type=click.Choice(list(benchmarks.NORMALIZE_CASES)), multiple=True,
+              help="normalize.py command (repeatable, default: all)")
+@click.option("micro_cases", "-m", "--micro", type=click.Choice(list(benchmarks.MICRO_CASES)), multiple=True,
+              help="function to time (repeatable, default: all)")
+@click.option("--no-micro", is_flag=True, help="skips the micro benchmarks")
+@click.option("--no-macro", is_flag=True, help="skips the normalize.py commands")
+@click.option("--micro-records", type=int, default=10000, show_default=True,
+              help="number of records of the micro benchmarks")
+@click.option("--repeat", type=int, default=3, show_default=True, help="repetitions of the micro benchmarks")
+@click.option("--seed", type=int, default=0, show_default=True, help="seed of the synthetic records")
+@click.option("--data-dir", type=str, default=Files.BENCHMARK_DATA, show_default=True,
+              help="directory of the synthetic inputs (generated once per kind, scale and seed)")
+@click.option("--options", type=str, default='', help="options of normalize.py for every command, e.g., '-w 4'")
+@click.pass_context
+def normalize(ctx, scales: typing.Tuple[int], cases: typing.Tuple[str], micro_cases: typing.Tuple[str],
+              no_micro: bool, no_macro: bool, micro_records: int, repeat: int, seed: int, data_dir: str,
+              options: str):
+    cases = [] if no_macro else list(cases or benchmarks.NORMALIZE_CASES)
+    micro_cases = [] if no_micro else list(micro_cases or benchmarks.MICRO_CASES)
+    results = benchmarks.benchmark_normalize(data_dir, scales, cases, micro_cases, micro_records, repeat,
+                                             shlex.split(options), seed)
+    print_results(results)
+    if ctx.obj['record']:
+        parameters = dict(scales=list(scales), micro_records=micro_records, repeat=repeat, seed=seed,
+                          options=options)
+        benchmarks.append_history(ctx.obj['history'], 'normalize', parameters, results)
+    if not all(result.get('ok', True) for result in results):
+        raise click.ClickException("some cases failed, see log for details")
+
+
+@cli.command(help="generates a file of synthetic records (as downloaded by get-prs-long, get-pr-reviews or "
+                  "get-commits)")
+@click.option("-k", "--kind", type=click.Choice(synthetic.KINDS), required=True)
+@click.option("-n", "--records", type=int, required=True, help="number of records")
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--data-dir", type=str, default=Files.BENCHMARK_DATA, show_default=True)
+def generate(kind: str, records: int, seed: int, data_dir: str):
+    print(synthetic.generate(data_dir, kind, records, seed))
+
+
+@cli.command(help="compares the recorded runs of a benchmark, one column per run")
+@click.option("-b", "--benchmark", type=click.Choice(['crawl', 'normalize']), required=True)
+@click.option("--value", type=str, default='records_per_s', show_default=True, help="result to compare")
+@click.option("-n", "--last", type=int, default=5, show_default=True, help="number of most recent runs")
+@click.pass_context
+def history(ctx, benchmark: str, value: str, last: int):
+    runs = [run for run in benchmarks.load_history(ctx.obj['history']) if run['benchmark'] == benchmark][-last:]
+    if not runs:
+        raise click.ClickException(f"no '{benchmark}' runs in {ctx.obj['history']}")
+    rows = [dict(run=f"{run['time']} {run['revision'] or ''}".strip(), case=result['case'],
+                 records=result.get('records'), value=result.get(value))
+            for run in runs for result in run['results']]
+    table = pd.DataFrame(rows).pivot_table(index=['case', 'records'], columns='run', values='value', sort=False)
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', None):
+        print(table)
+
+
+if __name__ == '__main__':
+    cli()
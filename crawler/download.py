@@ -1,37 +1,94 @@
+import datetime
+import json
 import logging
+import re
+import typing
 
 import click
 
-from src import data_access, log_utils, utils, traversal
-from src.collector import JsonWriter, DataCollectorBuilder
-from src.constants import queries, keys
+from src import files, log_utils, jobs, tables, users
 from src.graphl_client import GraphQLClient
-from datetime import datetime
+from src.rate_limit import RateLimitBudget
 from collections import OrderedDict
 
 LOG = log_utils.configure_logger()
 
-
-def init_builder(config: dict, resume: bool) -> DataCollectorBuilder:
-    gql_client = GraphQLClient(config)
-    builder = DataCollectorBuilder() \
-        .add_client(gql_client)
-    if resume:
-        builder = builder.enable_resume()
-    return builder
+# commands that do not need '--orga' and '--proj'
+REPOSITORY_FREE_COMMANDS = ['crawl-many', 'refresh-schema', 'get-user-ids']
+
+
+def parse_time(ctx, param, value: typing.Optional[str]) -> typing.Optional[str]:
+    """ '2022-06-01', '2022-06-01T12:00:00Z' or '<n>d' (n days ago) as ISO 8601 timestamp (UTC) """
+    if not value:
+        return None
+    days = re.fullmatch(r'(\d+)d', value)
+    if days:
+        date = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=int(days.group(1)))
+        return f"{date.isoformat()}T00:00:00Z"
+    try:
+        timestamp = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise click.BadParameter(f"'{value}' is neither a date, an ISO 8601 timestamp nor a number of days (e.g., 60d)")
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(datetime.timezone.utc)
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_truncate(ctx, param, values: typing.Tuple[str]) -> typing.Dict[str, int]:
+    """ 'message=200' -> {'message': 200} """
+    truncate = {}
+    for value in values:
+        path, _, length = value.partition('=')
+        if not path or not length.isdigit():
+            raise click.BadParameter(f"'{value}' is not of the form <field>=<length> (e.g., message=200)")
+        truncate[path] = int(length)
+    return truncate
 
 
 @click.group(help="Downloads github analytics data")
 @click.option("-v", "--verbose", is_flag=True)
-@click.option("-r", "--resume", is_flag=True, help="resumes from last cursor and appends to file")
-@click.option("organization", "--orga", type=str, required=True, help="organization (e.g., apache)")
-@click.option("project", "--proj", type=str, required=True, help="project (e.g., flink)")
+@click.option("-r", "--resume", is_flag=True,
+              help="resumes from the job's last checkpoint and appends to file (without a checkpoint the file is "
+                   "replaced)")
+@click.option("-d", "--delta", is_flag=True,
+              help="downloads only new or updated records and merges them into the existing file")
+@click.option("-p", "--pipeline", is_flag=True, help="fetches the next page while writing the previous one")
+@click.option("organization", "--orga", type=str, help="organization (e.g., apache)")
+@click.option("project", "--proj", type=str, help="project (e.g., flink)")
 @click.option("--branch", type=str, required=True, default='master', help="branch (main, master, trunk, etc.)")
 @click.option("-l", "--limit", type=int, default=0)
+@click.option("--checkpoint-interval", type=int, default=1, show_default=True,
+              help="number of pages between two checkpoints (used by '-r')")
+@click.option("-z", "--compression", type=click.Choice(files.COMPRESSIONS),
+              help="compresses the output (adds .gz or .zst to the file name)")
+@click.option("-n", "--normalize", is_flag=True, help="writes the normalized tables while downloading")
+@click.option("--no-raw", is_flag=True, help="writes only the normalized tables (requires '-n', no '-r' and '-d')")
+@click.option("--table-format", type=click.Choice(list(tables.FORMATS)), default=tables.JSON, show_default=True,
+              help="format of the normalized tables")
+@click.option("--since", type=str, callback=parse_time,
+              help="only commits (PRs) committed (updated) since, e.g., 2022-06-01 or 60d (60 days ago)")
+@click.option("--until", type=str, callback=parse_time, help="only commits (PRs) committed (updated) before")
+@click.option("exclude_authors", "--exclude-author", type=str, multiple=True,
+              help="drops the commits and PRs of this login and its comments and reviews (repeatable, e.g., flinkbot)")
+@click.option("exclude_fields", "--exclude-field", type=str, multiple=True,
+              help="removes the field from every record (repeatable, e.g., node/labels)")
+@click.option("--truncate", type=str, multiple=True, callback=parse_truncate,
+              help="shortens the text field to a number of characters (repeatable, e.g., message=200)")
 @click.pass_context
-def cli(ctx, verbose: bool, resume: bool, organization: str, project: str, branch: str, limit: int):
+def cli(ctx, verbose: bool, resume: bool, delta: bool, pipeline: bool, organization: str, project: str, branch: str,
+        limit: int, checkpoint_interval: int, compression: typing.Optional[str], normalize: bool, no_raw: bool,
+        table_format: str, since: typing.Optional[str], until: typing.Optional[str],
+        exclude_authors: typing.Tuple[str], exclude_fields: typing.Tuple[str], truncate: typing.Dict[str, int]):
     if verbose:
         log_utils.change_log_level(logging.DEBUG)
+    if ctx.invoked_subcommand not in REPOSITORY_FREE_COMMANDS and not (organization and project):
+        raise click.UsageError("'--orga' and '--proj' are required")
+    if no_raw and not normalize:
+        raise click.UsageError("'--no-raw' requires '--normalize'")
+    if no_raw and (resume or delta):
+        raise click.UsageError("'--no-raw' cannot be combined with '--resume' or '--delta'")
+    if delta and (since or until):
+        raise click.UsageError("'--since' and '--until' cannot be combined with '--delta'")
     ctx.ensure_object(dict)
     ctx.obj['config'] = OrderedDict()
     ctx.obj['config']['owner'] = organization
@@ -39,223 +96,157 @@ def cli(ctx, verbose: bool, resume: bool, organization: str, project: str, branc
     ctx.obj['config']['branch'] = branch
     ctx.obj['limit'] = limit
     ctx.obj['resume'] = resume
+    ctx.obj['delta'] = delta
+    ctx.obj['pipeline'] = pipeline
+    ctx.obj['checkpoint_interval'] = checkpoint_interval
+    ctx.obj['compression'] = compression
+    ctx.obj['normalize'] = normalize
+    ctx.obj['raw'] = not no_raw
+    ctx.obj['table_format'] = table_format
+    ctx.obj['since'] = since
+    ctx.obj['until'] = until
+    ctx.obj['exclude_authors'] = exclude_authors
+    ctx.obj['exclude_fields'] = exclude_fields
+    ctx.obj['truncate'] = truncate
 
 
 def create_output_path(ctx) -> str:
-    # let's try it without date
-    # date = datetime.now().strftime("%Y%m%d-%Hh%Mm%Ss")
-    command = ctx.command.name
-    if command.startswith('get-'):
-        command = command[4:]
-    config = ctx.obj['config']
-    elements = [command]
-    for k, v in config.items():
-        elements.append(f'{k}-{v}')
-    if ctx.obj['limit']:
-        elements.append("limit{ctx.obj['limit']}")
-    filename = "_".join(elements)
-    return f"data/{filename}.txt"
+    return jobs.create_output_path(ctx.command.name, ctx.obj['config'], ctx.obj['limit'], ctx.obj['compression'],
+                                   ctx.obj['since'], ctx.obj['until'])
+
+
+def job_options(ctx) -> dict:
+    """ options of the group that apply to every job """
+    return {name: ctx.obj[name] for name in ['limit', 'resume', 'delta', 'pipeline', 'checkpoint_interval',
+                                             'compression', 'normalize', 'raw', 'table_format', 'since', 'until',
+                                             'exclude_authors', 'exclude_fields', 'truncate']}
+
+
+def run_command(ctx, **kwargs):
+    jobs.run(jobs.Job(ctx.command.name, ctx.obj['config'], **job_options(ctx), **kwargs))
+
+
+def fan_out_options(fun):
+    fun = click.option("--batch-size", type=int, default=25, show_default=True,
+                       help="number of PRs per request when fanning out")(fun)
+    fun = click.option("-w", "--workers", type=int, default=4, show_default=True,
+                       help="number of concurrent requests when fanning out")(fun)
+    fun = click.option("--fan-out", is_flag=True,
+                       help="lists all PRs first and then downloads many PRs per request (fast)")(fun)
+    return fun
+
+
+def run_fan_out_command(ctx, fan_out: bool, workers: int, batch_size: int):
+    if fan_out and (ctx.obj['delta'] or ctx.obj['pipeline']):
+        raise click.UsageError("'--fan-out' cannot be combined with '--delta' or '--pipeline'")
+    run_command(ctx, fan_out_workers=workers if fan_out else 0, fan_out_batch_size=batch_size)
 
 
 @cli.command(help="download commits (fast, from most recent)")
 @click.pass_context
 def get_commits(ctx):
-    builder = init_builder(ctx.obj['config'], ctx.obj['resume'])
-    path = create_output_path(ctx)
-    query = utils.load_query(queries.COMMITS)
-    LOG.debug('query: %s', query)
-    writer = JsonWriter(path, append=ctx.obj['resume'])
-    LOG.info("create collector")
-    builder: DataCollectorBuilder = builder
-    base_path = data_access.AccessPathBuilder().add(keys.REPOSITORY).add(keys.REF).add(keys.TARGET).add(keys.HISTORY)
-    record_path = base_path.copy().add(keys.NODES).build()
-    cursor = traversal.Cursor(base_path.copy().add(keys.PAGE_INFO).build())
-    traverser = traversal.CursorGenerator(cursor)
-    collector = builder \
-        .add_query(query)\
-        .add_record_callback(writer.add)\
-        .add_records_access(record_path)\
-        .add_cursor_generator(traverser)\
-        .add_limit(ctx.obj['limit'])\
-        .build()
-    collector.run()
-    writer.close()
+    run_command(ctx)
 
 
 @cli.command(help="download PRs with only very limited information per PR (fast, from oldest)")
 @click.pass_context
 def get_prs_brief(ctx):
-    builder = init_builder(ctx.obj['config'], ctx.obj['resume'])
-    path = create_output_path(ctx)
-    query = utils.load_query(queries.PRS)
-    LOG.debug('query: %s', query)
-    writer = JsonWriter(path, append=ctx.obj['resume'])
-    LOG.info("create collector")
-    builder = builder
-    base_path = data_access.AccessPathBuilder().add(keys.REPOSITORY).add(keys.PULL_REQUESTS)
-    record_path = base_path.copy().add(keys.EDGES).build()
-    cursor = traversal.Cursor(base_path.copy().add(keys.PAGE_INFO).build())
-    traverser = traversal.CursorGenerator(cursor)
-    collector = builder \
-        .add_query(query) \
-        .add_record_callback(writer.add) \
-        .add_records_access(record_path) \
-        .add_cursor_generator(traverser) \
-        .add_limit(ctx.obj['limit']) \
-        .build()
-    collector.run()
-    writer.close()
-
-
-def get_user_id(login: str) -> None:
-    # TODO: Move somewhere else
-    from gql import gql, Client
-    from gql.transport.requests import RequestsHTTPTransport
-    from src.constants import constants
-
-    with open('graphql/query_user.graphql', 'r') as f:
-        query = f.read()
-
-    token = utils.load_secret()
-    transport = RequestsHTTPTransport(
-        url=constants.URL_GITHUB_GRAPHQL, headers={"Authorization": "bearer " + token}, verify=True, retries=3,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-    result = client.execute(gql(query), variable_values={'userLogin': login})
-    return result['user']['id']
+    run_command(ctx)
 
 
 @cli.command(help="download user info")
 @click.option("--login", type=str)
-@click.option("--since", default="", type=str)
+@click.option("--since", type=str, callback=parse_time, help="overrides the '--since' of the group")
 @click.pass_context
-def get_user_commits(ctx, login: str, since: str) -> None:
+def get_user_commits(ctx, login: str, since: typing.Optional[str]) -> None:
+    since = since or ctx.obj['since']
     config = ctx.obj['config']
     config['login'] = login
-    path = create_output_path(ctx)
-    user_id = get_user_id(login)
-    config['userId'] = {'id': user_id}
-    if since:
-        config['since'] = since
-    builder = init_builder(config, ctx.obj['resume'])
-    query = utils.load_query("query_commits_by_user.graphql")
-    LOG.debug('query: %s', query)
-    writer = JsonWriter(path, append=ctx.obj['resume'])
-    LOG.info("create collector")
-    builder = builder
-    base_path = data_access.AccessPathBuilder().add(keys.REPOSITORY).add(keys.REF).add(keys.TARGET).add(keys.HISTORY)
-    record_path = base_path.copy().add(keys.NODES).build()
-    cursor = traversal.Cursor(base_path.copy().add(keys.PAGE_INFO).build())
-    traverser = traversal.CursorGenerator(cursor)
-    collector = builder \
-        .add_query(query) \
-        .add_record_callback(writer.add) \
-        .add_records_access(record_path) \
-        .add_cursor_generator(traverser) \
-        .add_limit(ctx.obj['limit']) \
-        .build()
-    collector.run()
-    writer.close()
+    # the file name has the window of the query, including the since of this command
+    path = jobs.create_output_path(ctx.command.name, config, ctx.obj['limit'], ctx.obj['compression'], since,
+                                   ctx.obj['until'])
+    # the client uses the config as default variables, so it picks up the user id and since
+    with GraphQLClient(config) as client:
+        config['userId'] = {'id': users.get_user_id(client, login)}
+        if since:
+            config['since'] = since
+        jobs.run(jobs.Job(ctx.command.name, config, path=path, **dict(job_options(ctx), delta=False, since=since)),
+                 client=client)
+
+
+@cli.command(help="resolve the ids (and basic info) of many users with few requests")
+@click.option("-i", "--input", "input_file", type=click.File('r'), help="file with one login per line")
+@click.option("-o", "--output", type=str, default="data/users.txt", show_default=True)
+@click.argument("logins", nargs=-1)
+def get_user_ids(input_file: typing.Optional[typing.TextIO], output: str, logins: typing.Tuple[str]):
+    logins = list(logins)
+    if input_file:
+        logins += [line.strip() for line in input_file if line.strip()]
+    if not logins:
+        raise click.UsageError("no logins given")
+    with GraphQLClient() as client:
+        result = users.get_users(client, logins)
+    LOG.info("Writing to %s", output)
+    with open(output, 'w') as f:
+        for user in result.values():
+            if user:
+                json.dump(user, f)
+                f.write('\n')
 
 
 @cli.command(help="download PRs with extensive information on comments, reviews, etc. (slow, from oldest)")
 @click.pass_context
 def get_prs_long(ctx):
-    builder = init_builder(ctx.obj['config'], ctx.obj['resume'])
-    path = create_output_path(ctx)
-    query = utils.load_query(queries.PRS_FULL)
-    LOG.debug('query: %s', query)
-    writer = JsonWriter(path, append=ctx.obj['resume'])
-    LOG.info("create collector")
-    builder = builder
-    base_path = data_access.AccessPathBuilder().add(keys.REPOSITORY).add(keys.PULL_REQUESTS)
-    record_path = base_path.copy().add(keys.EDGES).build()
-    cursor = traversal.Cursor(base_path.copy().add(keys.PAGE_INFO).build())
-    traverser = traversal.CursorGenerator(cursor)
-    collector = builder \
-        .add_query(query) \
-        .add_record_callback(writer.add) \
-        .add_records_access(record_path) \
-        .add_cursor_generator(traverser) \
-        .add_limit(ctx.obj['limit'])\
-        .build()
-    collector.run()
-    writer.close()
-
-
-@cli.command(help="download only review metadata for each PR (slow, from most recent)")
+    run_command(ctx)
+
+
+@cli.command(help="download only review metadata for each PR (slow unless --fan-out, from most recent)")
+@fan_out_options
+@click.pass_context
+def get_pr_reviews(ctx, fan_out: bool, workers: int, batch_size: int):
+    run_fan_out_command(ctx, fan_out, workers, batch_size)
+
+
+@cli.command(help="download only review thread metadata for each PR (slow unless --fan-out, from most recent)")
+@fan_out_options
 @click.pass_context
-def get_pr_reviews(ctx):
-    builder = init_builder(ctx.obj['config'], ctx.obj['resume'])
-    path = create_output_path(ctx)
-    query = utils.load_query(queries.PRS_REVIEWS)
-    LOG.debug('query: %s', query)
-    writer = JsonWriter(path, append=ctx.obj['resume'])
-    base_path = data_access.AccessPathBuilder().add(keys.REPOSITORY).add(keys.PULL_REQUESTS)
-    review_path = base_path.copy().add(keys.EDGES).add(0).add(keys.NODE).add(keys.REVIEWS)
-    cursor_root = traversal.Cursor(
-        base_path.copy().add(keys.PAGE_INFO).build(),
-        has_next='hasPreviousPage',
-        cursor_name='startCursor',
-        variable_name='cursorTop'
-    )
-    traversal.Cursor(
-        review_path.add(keys.PAGE_INFO).build(),
-        variable_name='cursorReviews',
-        parent=cursor_root
-    )
-    traverser = traversal.CursorGenerator(cursor_root)
-    LOG.info("create collector")
-    builder: DataCollectorBuilder = builder
-    collector = builder \
-        .add_query(query) \
-        .add_record_callback(writer.add) \
-        .add_records_access(base_path.copy().add(keys.EDGES).build()) \
-        .add_cursor_generator(traverser) \
-        .add_limit(ctx.obj['limit']) \
-        .build()
-    collector.run()
-    writer.close()
-
-
-@cli.command(help="download only review thread metadata for each PR (slow, from most recent)")
+def get_pr_review_threads(ctx, fan_out: bool, workers: int, batch_size: int):
+    run_fan_out_command(ctx, fan_out, workers, batch_size)
+
+
+def parse_repository(repository: str, default_branch: str) -> OrderedDict:
+    """ parses '<owner>/<repository>[@<branch>]' into a config """
+    name, _, branch = repository.partition('@')
+    owner, _, project = name.partition('/')
+    if not owner or not project:
+        raise click.BadParameter(f"'{repository}' is not of the form <owner>/<repository>[@<branch>]")
+    config = OrderedDict()
+    config['owner'] = owner
+    config['repository'] = project
+    config['branch'] = branch or default_branch
+    return config
+
+
+@cli.command(help="download several data sets for several repositories concurrently "
+                  "(e.g., crawl-many -c get-commits apache/flink apache/kafka@trunk)")
+@click.option("commands", "-c", "--command", type=click.Choice(jobs.REPOSITORY_COMMANDS), multiple=True,
+              required=True, help="download command to run for every repository (repeatable)")
+@click.option("-w", "--workers", type=int, default=4, help="number of concurrent crawls")
+@click.option("--max-in-flight", type=int, default=4, help="maximum number of concurrent requests to github")
+@click.argument("repositories", nargs=-1, required=True)
 @click.pass_context
-def get_pr_review_threads(ctx):
-    builder = init_builder(ctx.obj['config'], ctx.obj['resume'])
-    path = create_output_path(ctx)
-    query = utils.load_query(queries.PRS_REVIEW_THREADS)
-    LOG.debug('query: %s', query)
-    writer = JsonWriter(path, append=ctx.obj['resume'])
-    base_path = data_access.AccessPathBuilder().add(keys.REPOSITORY).add(keys.PULL_REQUESTS)
-    review_thread_path = base_path.copy().add(keys.EDGES).add(0).add(keys.NODE).add(keys.REVIEW_THREADS)
-    cursor_root = traversal.Cursor(
-        base_path.copy().add(keys.PAGE_INFO).build(),
-        has_next='hasPreviousPage',
-        cursor_name='startCursor',
-        variable_name='cursorTop'
-    )
-    cursor_review_threads = traversal.Cursor(
-        review_thread_path.copy().add(keys.PAGE_INFO).build(),
-        variable_name='cursorReviewThreads',
-        parent=cursor_root
-    )
-    traversal.Cursor(
-        review_thread_path.copy().add(keys.NODES).add(0).add(keys.COMMENTS).add(keys.PAGE_INFO).build(),
-        variable_name='cursorReviewThreadComments',
-        parent=cursor_review_threads
-    )
-    traverser = traversal.CursorGenerator(cursor_root)
-    LOG.info("create collector")
-    builder: DataCollectorBuilder = builder
-    collector = builder \
-        .add_query(query) \
-        .add_record_callback(writer.add) \
-        .add_records_access(base_path.copy().add(keys.EDGES).build()) \
-        .add_cursor_generator(traverser) \
-        .add_limit(ctx.obj['limit']) \
-        .build()
-    collector.run()
-    writer.close()
+def crawl_many(ctx, commands: typing.Tuple[str], workers: int, max_in_flight: int,
+               repositories: typing.Tuple[str]):
+    configs = [parse_repository(repository, ctx.obj['config']['branch']) for repository in repositories]
+    job_list = [jobs.Job(command, config.copy(), **job_options(ctx)) for config in configs for command in commands]
+    budget = RateLimitBudget(max_in_flight=max_in_flight)
+    if not jobs.run_many(job_list, max_workers=workers, budget=budget):
+        raise click.ClickException("some jobs failed, see log for details")
+
+
+@cli.command(help="replaces the local github schema (graphql/schema.docs.graphql) with the current one")
+def refresh_schema():
+    GraphQLClient().refresh_schema()
 
 
 if __name__ == '__main__':
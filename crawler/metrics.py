@@ -0,0 +1,50 @@
+import typing
+
+import click
+import pandas as pd
+
+from src import files, log_utils
+from src.constants import Files
+from src.metrics import MetricsStore
+
+LOG = log_utils.configure_logger()
+
+
+@click.group(help="Maintains per-month project health metrics computed from the normalized tables")
+@click.option("--db", type=str, default=Files.METRICS_DB, show_default=True, help="metrics database")
+@click.pass_context
+def cli(ctx, db: str):
+    ctx.ensure_object(dict)
+    ctx.obj['db'] = db
+
+
+@cli.command(help="adds new or updated commits and PRs and recomputes the metrics of the months they touch")
+@click.option("-p", "--project", type=str, required=True, help="project (e.g., apache/flink)")
+@click.option("--commits", type=str, help="normalized commits table (extract-commits)")
+@click.option("--prs", type=str, help="normalized PR table (extract-pr-flat)")
+@click.pass_context
+def update(ctx, project: str, commits: typing.Optional[str], prs: typing.Optional[str]):
+    if not commits and not prs:
+        raise click.UsageError("neither '--commits' nor '--prs' given")
+    with MetricsStore(ctx.obj['db']) as store:
+        months = set()
+        if commits:
+            months |= store.add_commits(project, files.read_records(commits))
+        if prs:
+            months |= store.add_prs(project, files.read_records(prs))
+        store.update(project, months)
+
+
+@cli.command(help="prints the metrics of a project")
+@click.option("-p", "--project", type=str, required=True, help="project (e.g., apache/flink)")
+@click.option("--components", is_flag=True, help="prints the metrics per component")
+@click.pass_context
+def show(ctx, project: str, components: bool):
+    with MetricsStore(ctx.obj['db']) as store:
+        rows = store.monthly(project, components)
+    with pd.option_context('display.max_rows', None, 'display.width', None):
+        print(pd.DataFrame(rows))
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,140 +1,121 @@
-import json
 import typing
-import os
 
 import click
-import pandas as pd
 
-from src import normalization, log_utils
-from src.constants import keys
+from src import files, normalization, log_utils, parallel, tables
+from src.constants import Files
+from src.identities import IdentityIndex
 
 LOG = log_utils.configure_logger()
 
+# number of rows that are kept in memory before they are written
+CHUNK_SIZE = 10000
 
-@click.group(help="Normalizes and unpacks the github data into a flat JSON format")
-def cli():
-    pass
-
-
-def create_output_path(input_path: str, command: str) -> str:
-    filename = os.path.splitext(os.path.basename(input_path))[0]
-    if filename.startswith('raw_'):
-        filename = filename[4:]
-    return f"data/{command}_{filename}.txt"
-
-
-def normalize_this(input: str, output: str, fun: typing.Callable[[dict], pd.DataFrame]):
-    dfs = []
-    with open(input, 'r') as f:
-        for line in f.readlines():
-            obj = json.loads(line)
-            df = fun(obj)
-            if not df.empty:
-                dfs.append(df)
 
-    if not dfs:
-        LOG.info('No output data')
-        return
-    full_df = pd.concat(dfs)
-    print(f"Writing '{output}'")
-    full_df.to_json(output, lines=True, orient='records')
+@click.group(help="Normalizes and unpacks the github data into a flat JSON format")
+@click.option("-w", "--workers", type=int, default=1, show_default=True,
+              help="number of processes that normalize parts of the input file in parallel")
+@click.option("-f", "--format", type=click.Choice(list(tables.FORMATS)), default=tables.JSON, show_default=True,
+              help="json lines (.txt) or typed parquet (.parquet, requires pyarrow)")
+@click.option("--identities", type=str, default=None,
+              help=f"adds interned person ids (<role>Id) for all logins and keeps the aliases of every person in this "
+                   f"file across runs, e.g., {Files.IDENTITIES}")
+@click.pass_context
+def cli(ctx, workers: int, format: str, identities: typing.Optional[str]):
+    ctx.ensure_object(dict)
+    ctx.obj['workers'] = workers
+    ctx.obj['format'] = format
+    ctx.obj['identities'] = identities
+
+
+def create_output_path(input_path: str, command: str, format: str = tables.JSON) -> str:
+    return tables.create_output_path(input_path, command, format)
+
+
+def normalize_this(ctx, input: str, *names: str):
+    """ writes the rows of each table (see normalization.EXTRACTORS) of all records of the input file """
+    format = ctx.obj['format']
+    outputs = {table: create_output_path(input, table, format) for table in names}
+    workers = ctx.obj['workers']
+    for output in outputs.values():
+        print(f"Writing '{output}'")
+    if workers > 1 and files.detect_compression(input):
+        LOG.warning("compressed input cannot be split, normalizing with a single process")
+        workers = 1
+    if workers > 1 and ctx.obj['identities']:
+        LOG.warning("ids are assigned in order, normalizing with a single process")
+        workers = 1
+    if workers > 1:
+        rows = parallel.normalize_parallel(input, outputs, workers, CHUNK_SIZE, format)
+    elif ctx.obj['identities']:
+        identities = IdentityIndex.load(ctx.obj['identities'])
+        rows = normalization.normalize_records(files.read_records(input), outputs, CHUNK_SIZE, format, identities)
+        identities.save(ctx.obj['identities'])
+    else:
+        rows = normalization.normalize_records(files.read_records(input), outputs, CHUNK_SIZE, format)
+    for table, n in rows.items():
+        if not n:
+            LOG.info('No output data for %s', table)
 
 
 @cli.command(help='extracts flat commit data')
 @click.argument("input", type=str)
-def extract_commits(input: str):
-    output = create_output_path(input, "commits")
-
-    def fun(record: dict) -> pd.DataFrame:
-        record['author'] = record['author']['user']
-        record['committer'] = record['committer']['user']
-        normalization.flatten_recursively_inplace(record, ['author'])
-        normalization.flatten_recursively_inplace(record, ['committer'])
-        return pd.Series(record).to_frame().T
-
-    normalize_this(input, output, fun)
+@click.pass_context
+def extract_commits(ctx, input: str):
+    normalize_this(ctx, input, "commits")
 
 
 @cli.command(help='extracts all comments from each PR')
 @click.argument("input", type=str)
-def extract_pr_comments(input: str):
-    output = create_output_path(input, "comments")
-
-    def fun(obj: dict) -> pd.DataFrame:
-        record = obj['node']
-        normalization.flatten_recursively_inplace(record, ['author'])
-        return normalization.pr_extract_comments(record)
-
-    normalize_this(input, output, fun)
+@click.pass_context
+def extract_pr_comments(ctx, input: str):
+    normalize_this(ctx, input, "comments")
 
 
 @cli.command(help='extracts all review info from each PR')
 @click.argument("input", type=str)
-def extract_pr_reviews(input: str):
-    output = create_output_path(input, "reviews")
-
-    def fun(obj: dict) -> pd.DataFrame:
-        record = obj[keys.NODE]
-        normalization.flatten_recursively_inplace(record, [keys.AUTHOR])
-        return normalization.pr_extract_reviews(record)
-
-    normalize_this(input, output, fun)
+@click.pass_context
+def extract_pr_reviews(ctx, input: str):
+    normalize_this(ctx, input, "reviews")
 
 
 @cli.command(help='extracts all review thread info from each PR')
 @click.option("-i", "input", type=str, required=True)
-def extract_pr_review_threads(input: str):
-    output = create_output_path(input, "threads")
-
-    def fun(obj: dict) -> pd.DataFrame:
-        record = obj['node']
-        normalization.flatten_recursively_inplace(record, ['author'])
-        return normalization.pr_extract_review_threads(record)
-
-    normalize_this(input, output, fun)
+@click.pass_context
+def extract_pr_review_threads(ctx, input: str):
+    normalize_this(ctx, input, "threads")
 
 
 @cli.command(help='extracts all review and review thread info from each PR')
 @click.argument("input", type=str)
-def extract_pr_all_reviews(input: str):
-    output = create_output_path(input, "all-reviews")
-
-    def fun(obj: dict) -> pd.DataFrame:
-        record = obj['node']
-        normalization.flatten_recursively_inplace(record, ['author'])
-        reviews_df = normalization.pr_extract_reviews(record)
-        review_threads_df = normalization.pr_extract_review_threads(record)
-        return pd.concat([reviews_df, review_threads_df])
-
+@click.pass_context
+def extract_pr_all_reviews(ctx, input: str):
     LOG.warning('Due to Github\'s rate limiting we collect only a subset of all review & review threads')
-    normalize_this(input, output, fun)
+    normalize_this(ctx, input, "all-reviews")
 
 
 @cli.command(help="extracts labels associated with a PR")
 @click.argument("input", type=str)
-def extract_pr_labels(input: str):
-    output = create_output_path(input, "labels")
-
-    def fun(obj: dict) -> pd.DataFrame:
-        record = obj['node']
-        normalization.flatten_recursively_inplace(record, ['author'])
-        return normalization.pr_extract_labels(record)
-
-    normalize_this(input, output, fun)
+@click.pass_context
+def extract_pr_labels(ctx, input: str):
+    normalize_this(ctx, input, "labels")
 
 
 @cli.command(help="extracts a single line per PR")
 @click.argument("input", type=str)
-def extract_pr_flat(input: str):
-    output = create_output_path(input, "pr-flat")
+@click.pass_context
+def extract_pr_flat(ctx, input: str):
+    normalize_this(ctx, input, "pr-flat")
 
-    def fun(obj: dict) -> pd.DataFrame:
-        record = obj['node']
-        normalization.flatten_recursively_inplace(record, ['author'])
-        return normalization.extract_pr_flat(record)
 
-    normalize_this(input, output, fun)
+@cli.command(help="extracts PRs, comments, reviews, review threads and labels in a single pass")
+@click.option("names", "-t", "--table", type=click.Choice(list(normalization.PR_EXTRACTORS)), multiple=True,
+              help="table to extract (repeatable, default: all)")
+@click.argument("input", type=str)
+@click.pass_context
+def extract_all(ctx, names: typing.Tuple[str], input: str):
+    normalize_this(ctx, input, *(names if names else normalization.PR_EXTRACTORS))
 
 
 if __name__ == '__main__':
-    cli()
\ No newline at end of file
+    cli()
@@ -1,7 +1,7 @@
 import json
 import os
+import tempfile
 import typing
-from typing import Optional
 
 from . import log_utils
 from .constants import Files
@@ -9,39 +9,74 @@ from .constants import Files
 LOG = log_utils.configure_logger()
 
 
-class Backup:
-    KEY = 'cursor'
+def _umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
 
-    @staticmethod
-    def _load_file() -> typing.Optional[dict]:
-        if not os.path.exists(Files.BACKUP_FILE):
-            LOG.info("backup file does not exist")
-            return None
-        with open(Files.BACKUP_FILE, 'r') as f:
-            return json.load(f)
-
-    @staticmethod
-    def _save_file(content: dict):
-        with open(Files.BACKUP_FILE, 'w') as f:
-            json.dump(content, f)
-
-    @classmethod
-    def load(cls) -> Optional[dict]:
-        LOG.info("loading cursor")
-        content = cls._load_file()
-        if not content or cls.KEY not in content:
-            LOG.info("cannot load backup")
+
+# read once, setting the umask (to read it) is not thread-safe
+UMASK = _umask()
+
+
+def atomic_write_json(path: str, content: dict, **kwargs):
+    """ writes the file via a temporary file so that a crash never leaves a partially written file behind """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path), suffix='.tmp', dir=directory)
+    try:
+        # mkstemp creates the file with 0600, the file gets the usual permissions
+        os.chmod(tmp_path, 0o666 & ~UMASK)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(content, f, **kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CheckpointState:
+    def __init__(self, cursors: typing.Optional[dict], offset: typing.Optional[int]):
+        self.cursors = cursors
+        # size of the output file after the last completely written page
+        self.offset = offset
+
+    def __str__(self):
+        return f"CheckpointState(cursors={self.cursors}, offset={self.offset})"
+
+
+class Checkpoint:
+    """ cursors (and output file offset) of one download job for resuming it """
+    KEY_CURSOR = 'cursor'
+    KEY_OFFSET = 'offset'
+
+    def __init__(self, name: str, interval: int = 1, directory: str = Files.CHECKPOINT_DIR):
+        self._path = os.path.join(directory, f"{name}.json")
+        # number of pages between two checkpoints
+        self.interval = max(1, interval)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def load(self) -> typing.Optional[CheckpointState]:
+        if not os.path.exists(self._path):
+            LOG.info("checkpoint %s does not exist", self._path)
             return None
-        cursor = content[cls.KEY]
-        LOG.info("loaded cursor %s", cursor)
-        return cursor
-
-    @classmethod
-    def save(cls, cursors: dict):
-        LOG.info("save cursor %s", cursors)
-        content = cls._load_file()
-        if content:
-            content[cls.KEY] = cursors
-        else:
-            content = {cls.KEY: cursors}
-        cls._save_file(content)
+        with open(self._path, 'r') as f:
+            content = json.load(f)
+        state = CheckpointState(content.get(self.KEY_CURSOR), content.get(self.KEY_OFFSET))
+        LOG.info("loaded checkpoint %s", state)
+        return state
+
+    def save(self, cursors: dict, offset: typing.Optional[int] = None):
+        LOG.debug("save checkpoint %s (offset %s)", cursors, offset)
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        atomic_write_json(self._path, {self.KEY_CURSOR: cursors, self.KEY_OFFSET: offset})
+
+    def remove(self):
+        if os.path.exists(self._path):
+            LOG.info("removing checkpoint %s", self._path)
+            os.remove(self._path)
@@ -0,0 +1,260 @@
+import datetime
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+from collections import OrderedDict
+
+from . import files, log_utils, normalization, standin, synthetic
+from .constants import constants, keys
+
+LOG = log_utils.configure_logger()
+
+CRAWLER_DIR = synthetic.CRAWLER_DIR
+REPOSITORY_OPTIONS = ['--orga', 'benchmark', '--proj', 'repository']
+
+# name -> arguments of the download.py command (refresh-schema would replace the local schema)
+CRAWL_CASES = OrderedDict([
+    ('get-commits', ['get-commits']),
+    ('get-prs-brief', ['get-prs-brief']),
+    ('get-prs-long', ['get-prs-long']),
+    ('get-pr-reviews', ['get-pr-reviews']),
+    ('get-pr-reviews --fan-out', ['get-pr-reviews', '--fan-out']),
+    ('get-pr-review-threads', ['get-pr-review-threads']),
+    ('get-pr-review-threads --fan-out', ['get-pr-review-threads', '--fan-out']),
+    # the query only lists commits since 2022-07-04 by default
+    ('get-user-commits', ['get-user-commits', '--login', 'user1', '--since', '2000-01-01']),
+    ('get-user-ids', ['get-user-ids', *[f'user{i}' for i in range(100)]]),
+    ('crawl-many', ['crawl-many', '-c', 'get-commits', '-c', 'get-prs-brief', 'benchmark/a', 'benchmark/b']),
+])
+
+# name -> (kind of input, preparation of a record (not timed), timed function that returns the number of rows)
+MICRO_CASES = OrderedDict([
+    ('flatten_recursively_inplace', (synthetic.PRS, lambda record: record[keys.NODE],
+                                     lambda pr: normalization.flatten_recursively_inplace(pr, [keys.AUTHOR]) or 1)),
+    *[(f'extractor {table}', (synthetic.COMMITS if table == 'commits' else synthetic.PRS, lambda record: record,
+                              lambda record, extractor=extractor: len(extractor(record))))
+      for table, extractor in normalization.EXTRACTORS.items()],
+    ('extract_tables (all PR tables)', (synthetic.PRS, lambda record: record, lambda record: sum(
+        len(rows) for rows in normalization.extract_tables(record, list(normalization.PR_EXTRACTORS)).values()))),
+    ('pr_extract_review_threads', (synthetic.PRS, normalization._pr,
+                                   lambda pr: len(normalization.pr_extract_review_threads(pr)))),
+    ('extract_pr_flat', (synthetic.PRS, normalization._pr, lambda pr: len(normalization.extract_pr_flat(pr)))),
+])
+
+# name -> (kind of input, arguments of the normalize.py command, the input file is appended)
+NORMALIZE_CASES = OrderedDict([
+    ('extract-commits', (synthetic.COMMITS, ['extract-commits'])),
+    ('extract-pr-comments', (synthetic.PRS, ['extract-pr-comments'])),
+    ('extract-pr-reviews', (synthetic.REVIEWS, ['extract-pr-reviews'])),
+    ('extract-pr-review-threads', (synthetic.PRS, ['extract-pr-review-threads', '-i'])),
+    ('extract-pr-all-reviews', (synthetic.PRS, ['extract-pr-all-reviews'])),
+    ('extract-pr-labels', (synthetic.PRS, ['extract-pr-labels'])),
+    ('extract-pr-flat', (synthetic.PRS, ['extract-pr-flat'])),
+    ('extract-all', (synthetic.PRS, ['extract-all'])),
+])
+
+
+def percentile(values: typing.List[float], q: float) -> typing.Optional[float]:
+    """ nearest-rank percentile (0 < q <= 100) """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def run_process(args: typing.List[str], cwd: str, env: typing.Optional[dict] = None,
+                log_path: typing.Optional[str] = None) -> typing.Tuple[int, float, float]:
+    """ runs the command and returns its exit code, the seconds it took and its peak memory (RSS) in MB """
+    with open(log_path or os.devnull, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on linux
+    return process.returncode, seconds, usage.ru_maxrss / 1024
+
+
+def count_records(directory: str) -> int:
+    """ the number of records (or rows) in the json lines and parquet files of the directory """
+    records = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path) or name.endswith('.json'):
+            continue
+        if name.endswith('.parquet'):
+            import pyarrow.parquet
+            records += pyarrow.parquet.ParquetFile(path).metadata.num_rows
+        else:
+            with files.open_text(path) as f:
+                records += sum(1 for _ in f)
+    return records
+
+
+def _workspace(directory: str):
+    """ a working directory for download.py with its queries, a dummy secret and an empty data directory """
+    os.symlink(os.path.join(CRAWLER_DIR, 'graphql'), os.path.join(directory, 'graphql'))
+    os.mkdir(os.path.join(directory, 'data'))
+    with open(os.path.join(directory, constants.FILE_NAME_SECRET), 'w') as f:
+        f.write("OAUTH_TOKEN: benchmark\n")
+
+
+def run_crawl(server: standin.StandInServer, name: str, options: typing.Sequence[str] = ()) -> dict:
+    """ runs the download command of the case against the running stand-in server """
+    with tempfile.TemporaryDirectory() as directory:
+        _workspace(directory)
+        env = dict(os.environ, **{constants.URL_VARIABLE: server.url})
+        args = [sys.executable, os.path.join(CRAWLER_DIR, 'download.py'), *REPOSITORY_OPTIONS, *options,
+                *CRAWL_CASES[name]]
+        server.stats()
+        LOG.info("running %s", name)
+        log_path = os.path.join(directory, 'download.log')
+        returncode, seconds, peak_rss = run_process(args, directory, env, log_path)
+        if returncode:
+            with open(log_path) as f:
+                LOG.error("%s failed with exit code %d:\n%s", name, returncode, f.read()[-2000:])
+        records = count_records(os.path.join(directory, 'data'))
+    requests = server.stats()['requests']
+    pages = [end - start for start, end, error in requests if not error]
+    # from the first request to the last response, i.e., without the start of the interpreter
+    crawl_seconds = max(end for _, end, _ in requests) - min(start for start, _, _ in requests) if requests else 0.
+    return OrderedDict([
+        ('case', name),
+        ('ok', returncode == 0),
+        ('records', records),
+        ('requests', len(requests)),
+        ('rate_limited', sum(1 for _, _, error in requests if error)),
+        ('seconds', round(seconds, 3)),
+        ('crawl_seconds', round(crawl_seconds, 3)),
+        ('records_per_s', round(records / crawl_seconds, 1) if crawl_seconds else None),
+        ('requests_per_s', round(len(requests) / crawl_seconds, 1) if crawl_seconds else None),
+        ('p50_page_ms', round(percentile(pages, 50) * 1000, 1) if pages else None),
+        ('p99_page_ms', round(percentile(pages, 99) * 1000, 1) if pages else None),
+        ('peak_rss_mb', round(peak_rss, 1)),
+    ])
+
+
+def benchmark_crawl(cases: typing.Sequence[str], sizes: standin.Sizes, latency: float = 0., error_rate: float = 0.,
+                    retry_after: float = 1., options: typing.Sequence[str] = ()) -> typing.List[dict]:
+    """ runs the cases one after the other against one stand-in server (latency in seconds) """
+    with standin.StandInServer(sizes, latency, error_rate, retry_after) as server:
+        return [run_crawl(server, name, options) for name in cases]
+
+
+def _revision() -> typing.Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CRAWLER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: str) -> typing.List[dict]:
+    """ the recorded runs, oldest first """
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def append_history(path: str, benchmark: str, parameters: dict, results: typing.List[dict]):
+    """ appends a run to the json history (a list of runs), so that runs of different revisions can be compared """
+    history = load_history(path)
+    history.append(OrderedDict([
+        ('benchmark', benchmark),
+        ('time', datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')),
+        ('revision', _revision()),
+        ('python', platform.python_version()),
+        ('parameters', parameters),
+        ('results', results),
+    ]))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp, path)
+    LOG.info("appended %d results to %s", len(results), path)
+
+
+def _read_lines(path: str, n: int) -> typing.List[str]:
+    lines = []
+    with files.open_text(path) as f:
+        for line in f:
+            if len(lines) == n:
+                break
+            lines.append(line)
+    return lines
+
+
+def run_micro(name: str, lines: typing.List[str], repeat: int = 3) -> dict:
+    """ times the function of the case on the parsed records (every repetition parses them again) """
+    _, prepare, function = MICRO_CASES[name]
+    times = []
+    rows = 0
+    for _ in range(repeat):
+        # the extractors change the records
+        inputs = [prepare(files.loads(line)) for line in lines]
+        start = time.perf_counter()
+        rows = sum(function(record) for record in inputs)
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return OrderedDict([
+        ('case', name),
+        ('type', 'micro'),
+        ('records', len(lines)),
+        ('rows', rows),
+        ('seconds', round(best, 4)),
+        ('median_seconds', round(statistics.median(times), 4)),
+        ('records_per_s', round(len(lines) / best, 1) if best else None),
+    ])
+
+
+def run_normalize(name: str, input: str, records: int, options: typing.Sequence[str] = ()) -> dict:
+    """ runs the normalize.py command of the case on the input file (in a temporary working directory) """
+    _, command = NORMALIZE_CASES[name]
+    with tempfile.TemporaryDirectory() as directory:
+        os.mkdir(os.path.join(directory, 'data'))
+        args = [sys.executable, os.path.join(CRAWLER_DIR, 'normalize.py'), *options, *command, os.path.abspath(input)]
+        LOG.info("running %s on %s", name, input)
+        log_path = os.path.join(directory, 'normalize.log')
+        returncode, seconds, peak_rss = run_process(args, directory, log_path=log_path)
+        if returncode:
+            with open(log_path) as f:
+                LOG.error("%s failed with exit code %d:\n%s", name, returncode, f.read()[-2000:])
+        rows = count_records(os.path.join(directory, 'data'))
+    return OrderedDict([
+        ('case', name),
+        ('type', 'macro'),
+        ('ok', returncode == 0),
+        ('records', records),
+        ('rows', rows),
+        ('seconds', round(seconds, 3)),
+        ('records_per_s', round(records / seconds, 1)),
+        ('peak_rss_mb', round(peak_rss, 1)),
+    ])
+
+
+def benchmark_normalize(data_dir: str, scales: typing.Sequence[int], cases: typing.Sequence[str],
+                        micro_cases: typing.Sequence[str], micro_records: int = 10000, repeat: int = 3,
+                        options: typing.Sequence[str] = (), seed: int = 0) -> typing.List[dict]:
+    """
+    micro benchmarks of the extractors on `micro_records` records and the normalize.py commands on every scale, the
+    synthetic inputs are generated in data_dir once and reused by later runs
+    """
+    results = []
+    for name in micro_cases:
+        kind = MICRO_CASES[name][0]
+        lines = _read_lines(synthetic.generate(data_dir, kind, micro_records, seed), micro_records)
+        results.append(run_micro(name, lines, repeat))
+    for scale in scales:
+        for name in cases:
+            input = synthetic.generate(data_dir, NORMALIZE_CASES[name][0], scale, seed)
+            results.append(run_normalize(name, input, scale, options))
+    return results
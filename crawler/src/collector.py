@@ -1,14 +1,21 @@
 import json
 import logging
+import os
+import queue
+import threading
+import time
 import typing
 from typing import Callable, NoReturn, Optional
 
 from . import data_access
+from . import files
 from . import log_utils
-from .backup import Backup
+from .backup import Checkpoint
 from .constants import keys
 from .custom_types import FormatterType
 from .graphl_client import GraphQLClient
+from .rate_limit import AdaptiveStepSize
+from .record_filter import RecordFilter
 from .traversal import CursorGenerator
 
 LOG = log_utils.configure_logger()
@@ -18,63 +25,200 @@ class DataCollector:
     def __init__(self, client: GraphQLClient, query: str, cursor_generator: CursorGenerator,
                  records_extractor: data_access.AccessPath, record_callback: Callable[[dict], NoReturn], limit: int = 0,
                  step_size: int = 100,
-                 resume: bool = False):
+                 resume: bool = False,
+                 pipeline_size: int = 0,
+                 adaptive_step_size: bool = False,
+                 max_retries: int = 5,
+                 variables: typing.Optional[dict] = None,
+                 start_cursors: typing.Optional[typing.Dict[str, str]] = None,
+                 checkpoint: typing.Optional[Checkpoint] = None,
+                 offset_callback: typing.Optional[Callable[[], int]] = None,
+                 page_callback: typing.Optional[Callable[[], None]] = None,
+                 record_filter: typing.Optional[RecordFilter] = None):
         self._client = client
         self._query = query
         self._cursor_generator = cursor_generator
         self._records_extractor = records_extractor
         self._record_callback = record_callback
-        self._step_size = step_size
+        # without adaptation the step size stays fixed
+        self._step = AdaptiveStepSize(step_size, max_step_size=step_size) if adaptive_step_size \
+            else AdaptiveStepSize(step_size, min_step_size=step_size, max_step_size=step_size)
+        self._max_retries = max_retries
+        self._variables = variables if variables else {}
         self._limit = limit  # used for testing
         self._n = 0
         self._cursor_name = keys.END_CURSOR
         self._has_next_name = keys.HAS_NEXT_PAGE
         self._resume = resume
+        # number of fetched pages that may wait for the writer, 0 disables pipelining
+        self._pipeline_size = pipeline_size
+        # cursors to continue from after all written records
+        self._cursors: typing.Optional[typing.Dict[str, str]] = start_cursors if start_cursors else {}
+        self._checkpoint = checkpoint
+        # returns the output offset that is stored with the checkpoint
+        self._offset_callback = offset_callback
+        # called after all records of a page have been passed on (e.g., to flush the output)
+        self._page_callback = page_callback
+        # projects and filters the records of each page and may end the pagination
+        self._record_filter = record_filter
+        self._pages = 0
+        self._offset: typing.Optional[int] = None
+        self._last_cursors: typing.Optional[typing.Dict[str, str]] = None
+
+    @property
+    def last_cursors(self) -> typing.Optional[typing.Dict[str, str]]:
+        """ the cursors after the last fetched page """
+        return self._last_cursors
 
     def _compile_params(self, cursors: typing.Optional[typing.Dict[str, str]]) -> dict:
         if self._limit > 0:
-            step_size = max(0, min(self._limit - self._n, self._step_size))
+            step_size = max(0, min(self._limit - self._n, self._step.value))
         else:
-            step_size = self._step_size
+            step_size = self._step.value
         params = {'step': step_size}
+        params.update(self._variables)
         if cursors:
             params.update(cursors)
         return params
 
-    def run(self):
-        LOG.info("data collection start")
+    def _below_limit(self) -> bool:
+        return self._limit <= 0 or self._n < self._limit
+
+    def _send(self, cursors: typing.Optional[typing.Dict[str, str]]) -> dict:
+        """ sends the query and retries it with a smaller step size if it failed due to timeouts or rate limits """
+        start = time.monotonic()
+
+        def on_retry() -> dict:
+            nonlocal start
+            self._step.failed()
+            start = time.monotonic()
+            return self._compile_params(cursors)
+
+        params = self._compile_params(cursors)
+        LOG.debug("parameters: %s", params)
+        data = self._client.send_graphql_query_with_retries(self._query, params, self._max_retries, on_retry)
+        rate_limit = data.get(GraphQLClient.RATE_LIMIT) or {}
+        self._step.succeeded(time.monotonic() - start, rate_limit.get('cost'))
+        return data
+
+    def _fetch(self, cursors: typing.Optional[typing.Dict[str, str]]) \
+            -> typing.Tuple[typing.Optional[typing.Dict[str, str]], typing.List[dict]]:
+        """ fetches the page for the given cursors and returns the cursors of the next page and the records """
+        data = self._send(cursors)
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("data: %s", json.dumps(data, indent=2))
+        cursors = self._cursor_generator.next_cursors(data)
+        records = self._records_extractor.run(data)
+        if self._record_filter:
+            records, stop = self._record_filter.apply(records)
+            if stop:
+                return None, records
+        if cursors is not None:
+            self._last_cursors = cursors
+        else:
+            # the end of the last page, so that a later download does not fetch the page again
+            self._last_cursors = self._cursor_generator.end_cursors(data) or self._last_cursors
+        return cursors, records
+
+    def _add_records(self, records: typing.List[dict]) -> bool:
+        """ returns false if the record callback does not accept more records """
+        for record in records:
+            if not self._record_callback(record):
+                LOG.info("cannot add more entries")
+                return False
+        return True
+
+    def _save_checkpoint(self):
+        if not self._checkpoint:
+            return
+        if self._cursors:
+            self._checkpoint.save(self._cursors, self._offset)
+        else:
+            # there is nothing left to resume
+            self._checkpoint.remove()
+
+    def _page_written(self, cursors: typing.Optional[typing.Dict[str, str]]):
+        """ registers that all records of the page before `cursors` have been passed on """
+        self._cursors = cursors
+        self._pages += 1
+        if self._page_callback:
+            self._page_callback()
+        if self._checkpoint and self._offset_callback:
+            self._offset = self._offset_callback()
+        if self._checkpoint and self._pages % self._checkpoint.interval == 0:
+            self._save_checkpoint()
+
+    def _run_serial(self):
         has_next = True
-        cursors = {}
-        if self._resume:
-            cursors = Backup.load()
-            LOG.info(f"starting from cursor '{cursors}'")
+        while has_next and self._below_limit():
+            cursors, records = self._fetch(self._cursors)
+            accepted = self._add_records(records)
+            has_next = cursors is not None and accepted
+            self._page_written(cursors)
+            self._n += len(records)
+            LOG.info("Collected %d records", self._n)
+
+    def _run_pipelined(self):
+        """ fetches the next page while the writer thread passes the records of the previous pages on """
+        pages = queue.Queue(maxsize=self._pipeline_size)
+        stop = threading.Event()
+        errors = []
+
+        def write():
+            while True:
+                page = pages.get()
+                if page is None:
+                    return
+                if stop.is_set():
+                    continue
+                records, cursors = page
+                try:
+                    if not self._add_records(records):
+                        stop.set()
+                    self._page_written(cursors)
+                except Exception as ex:
+                    errors.append(ex)
+                    stop.set()
+
+        writer = threading.Thread(target=write, name=f'{threading.current_thread().name}-writer', daemon=True)
+        writer.start()
         try:
-            while has_next and (self._limit <= 0 or self._n < self._limit):
-                params = self._compile_params(cursors)
-                LOG.debug("parameters: %s", params)
-                data = self._client.send_graphql_query(self._query, variable_values=params)
-                if LOG.isEnabledFor(logging.DEBUG):
-                    LOG.debug(f"data: %s", json.dumps(data, indent=2))
-                cursors = self._cursor_generator.next_cursors(data)
+            has_next = True
+            cursors = self._cursors
+            while has_next and self._below_limit() and not stop.is_set():
+                cursors, records = self._fetch(cursors)
                 has_next = cursors is not None
-                records = self._records_extractor.run(data)
-                for record in records:
-                    ret = self._record_callback(record)
-                    if not ret:
-                        LOG.info("cannot add more entries")
-                        break
                 self._n += len(records)
+                pages.put((records, cursors))
                 LOG.info("Collected %d records", self._n)
+        finally:
+            pages.put(None)
+            writer.join()
+        if errors:
+            raise errors[0]
+
+    def run(self):
+        LOG.info("data collection start")
+        if self._resume and self._checkpoint:
+            state = self._checkpoint.load()
+            self._cursors = state.cursors if state else {}
+            self._offset = state.offset if state else None
+            LOG.info(f"starting from cursor '{self._cursors}'")
+        # the cursors of the next pages are derived from the current ones (e.g., the outer cursor of nested pages)
+        self._cursor_generator.restore(self._cursors)
+        try:
+            if self._pipeline_size > 0:
+                self._run_pipelined()
+            else:
+                self._run_serial()
         except Exception as ex:
             LOG.error(
                 "encountered error with cursor '%s' after %d records. You can resume from this positon via the '-r' argument",
-                cursors, self._n)
+                self._cursors, self._n)
             LOG.exception(ex)
             raise
         finally:
-            if cursors:
-                LOG.debug("storing cursor %s", cursors)
-                Backup.save(cursors)
+            self._save_checkpoint()
 
 
 class DataCollectorBuilderException(Exception):
@@ -91,6 +235,14 @@ class DataCollectorBuilder:
         self._limit: int = 0
         self._step_size: int = 100
         self._resume = False
+        self._pipeline_size: int = 0
+        self._adaptive_step_size = False
+        self._variables = {}
+        self._start_cursors: typing.Optional[typing.Dict[str, str]] = None
+        self._checkpoint: Optional[Checkpoint] = None
+        self._offset_callback: Optional[Callable[[], int]] = None
+        self._page_callback: Optional[Callable[[], None]] = None
+        self._record_filter: Optional[RecordFilter] = None
 
     def add_client(self, client: GraphQLClient) -> 'DataCollectorBuilder':
         self._client = client
@@ -112,6 +264,11 @@ class DataCollectorBuilder:
         self._record_callback = record_callback
         return self
 
+    def add_variables(self, variables: dict) -> 'DataCollectorBuilder':
+        """ additional query variables (e.g., a different order) """
+        self._variables.update(variables)
+        return self
+
     def add_limit(self, limit: int) -> 'DataCollectorBuilder':
         self._limit = limit
         return self
@@ -124,6 +281,37 @@ class DataCollectorBuilder:
         self._resume = True
         return self
 
+    def add_start_cursors(self, cursors: typing.Dict[str, str]) -> 'DataCollectorBuilder':
+        self._start_cursors = cursors
+        return self
+
+    def add_checkpoint(self, checkpoint: Checkpoint,
+                       offset_callback: Optional[Callable[[], int]] = None) -> 'DataCollectorBuilder':
+        """ stores the cursors (and the output offset) every `checkpoint.interval` pages for resuming """
+        self._checkpoint = checkpoint
+        self._offset_callback = offset_callback
+        return self
+
+    def add_page_callback(self, page_callback: Callable[[], None]) -> 'DataCollectorBuilder':
+        """ called after all records of a page have been passed on to the record callback """
+        self._page_callback = page_callback
+        return self
+
+    def add_record_filter(self, record_filter: RecordFilter) -> 'DataCollectorBuilder':
+        """ projects and filters the records of each page before they are passed on to the record callback """
+        self._record_filter = record_filter
+        return self
+
+    def enable_adaptive_step_size(self) -> 'DataCollectorBuilder':
+        """ reduces the step size when requests time out or become slow and increases it up to the set step size """
+        self._adaptive_step_size = True
+        return self
+
+    def enable_pipelining(self, pipeline_size: int = 4) -> 'DataCollectorBuilder':
+        """ fetches the next page while up to pipeline_size pages are written """
+        self._pipeline_size = pipeline_size
+        return self
+
     def build(self):
         if not self._client:
             raise DataCollectorBuilderException("'client' not set")
@@ -138,28 +326,42 @@ class DataCollectorBuilder:
 
         return DataCollector(self._client, self._query, self._cursor_generator,
                              self._records_access, self._record_callback, limit=self._limit,
-                             step_size=self._step_size, resume=self._resume)
+                             step_size=self._step_size, resume=self._resume,
+                             pipeline_size=self._pipeline_size, adaptive_step_size=self._adaptive_step_size,
+                             variables=self._variables, start_cursors=self._start_cursors,
+                             checkpoint=self._checkpoint, offset_callback=self._offset_callback,
+                             page_callback=self._page_callback, record_filter=self._record_filter)
 
 
 class JsonWriter:
+    """
+    Writes the records as json lines. The serialized records are buffered and written (and optionally compressed)
+    at page boundaries (see `flush`), when the buffer is full or after `flush_interval` seconds.
+    """
     def __init__(self, path: str, formatter: typing.Optional[FormatterType] =
-                 None, append: bool = False) -> None:
+                 None, append: bool = False, offset: typing.Optional[int] = None,
+                 compression: typing.Optional[str] = None, flush_interval: float = 5.) -> None:
+        """ when appending, the file is first truncated to `offset` (e.g., to drop a partially written page) """
         LOG.info(f"Writing to {path}")
         self._has_last = False
         self._last_key = None
         self._last_value = None
-        if append:
-            if os.path.exists(path):
-                self._maybe_register_last_record()
-            self._f = open(path, 'a')
-        else:
-            self._f = open(path, 'w')
+        if append and os.path.exists(path):
+            if offset is not None and os.path.getsize(path) > offset:
+                LOG.info("truncating %s to %d bytes", path, offset)
+                os.truncate(path, offset)
+            self._maybe_register_last_record(path)
+        self._f = files.BlockWriter(path, append=append, compression=compression, flush_interval=flush_interval)
         self._formatter = formatter
 
-    def _maybe_register_last_record(self):
+    def _maybe_register_last_record(self, path: str):
         # we assume that the last entry has the oldest timestamp
-        with open(path, 'r') as f:
-            last_line = f.readlines()[-1]
+        last_line = None
+        with files.open_text(path) as f:
+            for line in f:
+                last_line = line
+        if not last_line:
+            return
         last_record = json.loads(last_line)
         if 'id' in last_record:
             self._last_key = 'id'
@@ -177,13 +379,20 @@ class JsonWriter:
             self._last_key in record and
             record[self._last_key] == self._last_value):
             return False
-        json.dump(record, self._f)
-        self._f.write('\n')
-        self._f.flush()
+        self._f.write(files.dumps(record))
         return True
 
+    def flush(self):
+        """ writes the buffered records, called at page boundaries """
+        self._f.flush()
+
+    def tell(self) -> int:
+        """ returns the size of the written file """
+        return self._f.tell()
+
     def __del__(self):
-        self._f.close()
+        if hasattr(self, '_f'):
+            self._f.close()
 
     def close(self):
         self._f.close()
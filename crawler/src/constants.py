@@ -2,6 +2,8 @@ class constants:
     FILE_NAME_SECRET = "secret"
     SECRET_REGEX = r"[\t\s]*OAUTH_TOKEN[\t\s]*:[\t\s]*(.*)"
     URL_GITHUB_GRAPHQL = "https://api.github.com/graphql"
+    # overrides the endpoint, e.g., with the stand-in server of the benchmarks
+    URL_VARIABLE = "GITHUB_GRAPHQL_URL"
 
 
 class queries:
@@ -10,6 +12,14 @@ class queries:
     PRS_FULL = "query_pull_requests_long.graphql"
     PRS_REVIEWS = "query_pull_requests_reviews.graphql"
     PRS_REVIEW_THREADS = "query_pull_requests_review_threads.graphql"
+    PR_NUMBERS = "query_pull_request_numbers.graphql"
+    PR_REVIEWS_BY_NUMBER = "query_pull_request_reviews_by_number.graphql"
+    PR_REVIEW_THREADS_BY_NUMBER = "query_pull_request_review_threads_by_number.graphql"
+    REVIEW_THREAD_COMMENTS = "query_review_thread_comments.graphql"
+    FRAGMENT_PR_REVIEWS = "fragment_pull_request_reviews.graphql"
+    FRAGMENT_PR_REVIEW_THREADS = "fragment_pull_request_review_threads.graphql"
+    USER = "query_user.graphql"
+    USER_COMMITS = "query_commits_by_user.graphql"
     COLLABORATORS = "query_collaborators.graphql"
     COLLABORATOR = "query_collaborator.graphql"
 
@@ -40,6 +50,9 @@ class keys:
     USER = 'user'
     HAS_NEXT_PAGE = 'hasNextPage'
     CREATED_AT = 'createdAt'
+    UPDATED_AT = 'updatedAt'
+    COMMITTED_DATE = 'committedDate'
+    OID = 'oid'
     PUBLISHED_AT = 'createdAt'
     COMMENTS = 'comments'
     HAS_REVIEW = 'hasReviews'
@@ -52,4 +65,10 @@ class keys:
 
 
 class Files:
-    BACKUP_FILE = 'backup.json'
+    CHECKPOINT_DIR = 'checkpoints'
+    SCHEMA_FILE = 'graphql/schema.docs.graphql'
+    METRICS_DB = 'data/metrics.sqlite'
+    STORE_DB = 'data/github.sqlite'
+    IDENTITIES = 'data/identities.json'
+    BENCHMARKS = 'data/benchmarks.json'
+    BENCHMARK_DATA = 'data/benchmark'
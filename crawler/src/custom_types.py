@@ -3,3 +3,4 @@ from typing import Callable
 
 ExtractorType = Callable[[dict], dict]
 FormatterType = Callable[[dict], typing.NoReturn]
+RowsExtractorType = Callable[[dict], typing.List[dict]]
@@ -8,6 +8,10 @@ class AccessPath:
     def __init__(self, segments: typing.List[typing.Union[str, int]]):
         self._segments = segments
 
+    @property
+    def segments(self) -> typing.List[typing.Union[str, int]]:
+        return self._segments
+
     def run(self, data: dict) -> dict:
         content = data
         for el in self._segments:
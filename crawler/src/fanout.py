@@ -0,0 +1,171 @@
+import threading
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from gql.transport.exceptions import TransportQueryError
+
+from . import data_access, log_utils, traversal, utils
+from .collector import DataCollectorBuilder
+from .constants import queries, keys
+from .graphl_client import GraphQLClient
+from .record_filter import RecordFilter, updated_window
+
+LOG = log_utils.configure_logger()
+
+
+def _connection(*segments: str) -> data_access.AccessPathBuilder:
+    path = data_access.AccessPathBuilder()
+    for segment in segments:
+        path.add(segment)
+    return path
+
+
+def collect_connection(client: GraphQLClient, query: str, connection: data_access.AccessPathBuilder,
+                       variables: typing.Optional[dict] = None, cursor: typing.Optional[str] = None,
+                       limit: int = 0, record_filter: typing.Optional[RecordFilter] = None) -> typing.List[dict]:
+    """ collects all nodes of a (single level) connection, optionally starting after the given cursor """
+    nodes = []
+
+    def add(record: dict) -> bool:
+        nodes.append(record)
+        return True
+
+    cursor_generator = traversal.CursorGenerator(traversal.Cursor(connection.copy().add(keys.PAGE_INFO).build()))
+    builder = DataCollectorBuilder() \
+        .add_client(client) \
+        .add_query(query) \
+        .add_records_access(connection.copy().add(keys.NODES).build()) \
+        .add_cursor_generator(cursor_generator) \
+        .add_record_callback(add) \
+        .add_variables(variables if variables else {}) \
+        .add_limit(limit)
+    if cursor:
+        builder = builder.add_start_cursors({'cursor': cursor})
+    if record_filter:
+        builder = builder.add_record_filter(record_filter)
+    builder.build().run()
+    return nodes
+
+
+def _complete(client: GraphQLClient, query: str, connection_holder: dict, name: str,
+              connection: data_access.AccessPathBuilder, variables: dict):
+    """ adds the remaining nodes of the connection `name` of `connection_holder` """
+    page_info = connection_holder[name][keys.PAGE_INFO]
+    if page_info[keys.HAS_NEXT_PAGE]:
+        connection_holder[name][keys.NODES] += collect_connection(
+            client, query, connection, variables, page_info[keys.END_CURSOR])
+        page_info[keys.HAS_NEXT_PAGE] = False
+
+
+class PullRequestFanOut:
+    """
+    Downloads reviews or review threads for many PRs per request: lists the PR numbers first and then looks up
+    `batch_size` PRs at once via aliased `pullRequest(number: N)` fields. Only the PRs with more reviews (threads or
+    comments) than fit into the first page are paginated individually. With `since` or `until` only the PRs updated
+    in [since, until) are listed.
+    """
+    FRAGMENTS = {
+        'get-pr-reviews': (queries.FRAGMENT_PR_REVIEWS, 'prReviews', 100),
+        'get-pr-review-threads': (queries.FRAGMENT_PR_REVIEW_THREADS, 'prReviewThreads', 20),
+    }
+
+    def __init__(self, command: str, client_factory: typing.Callable[[], GraphQLClient], batch_size: int = 25,
+                 workers: int = 4, since: typing.Optional[str] = None, until: typing.Optional[str] = None):
+        fragment_file, self._fragment_name, self._step = self.FRAGMENTS[command]
+        self._fragment = utils.load_query(fragment_file)
+        self._command = command
+        self._client_factory = client_factory
+        self._batch_size = batch_size
+        self._workers = workers
+        self._since = since
+        self._until = until
+        self._local = threading.local()
+        self._clients: typing.List[GraphQLClient] = []
+        self._lock = threading.Lock()
+        self._queries = {name: utils.load_query(name) for name in [
+            queries.PR_NUMBERS, queries.PR_REVIEWS_BY_NUMBER, queries.PR_REVIEW_THREADS_BY_NUMBER,
+            queries.REVIEW_THREAD_COMMENTS]}
+
+    def _client(self) -> GraphQLClient:
+        """ every worker thread uses its own client """
+        if not hasattr(self._local, 'client'):
+            self._local.client = self._client_factory()
+            with self._lock:
+                self._clients.append(self._local.client)
+        return self._local.client
+
+    def _batch_query(self, size: int) -> str:
+        variables = ", ".join(["$step: Int!", "$owner: String!", "$repository: String!"] +
+                              [f"$number{i}: Int!" for i in range(size)])
+        fields = "\n".join(f"        pr{i}: pullRequest(number: $number{i}) {{\n            ...{self._fragment_name}\n"
+                           f"        }}" for i in range(size))
+        return f"query getPRs({variables}) {{\n" \
+               f"    rateLimit {{\n        cost\n        remaining\n        resetAt\n    }}\n" \
+               f"    repository(owner: $owner, name: $repository) {{\n{fields}\n    }}\n}}\n{self._fragment}"
+
+    def list_numbers(self, limit: int = 0) -> typing.List[int]:
+        """ lists the numbers of all PRs (from most recent) """
+        variables, record_filter = updated_window(keys.UPDATED_AT, self._since, self._until) \
+            if self._since or self._until else ({}, None)
+        nodes = collect_connection(self._client(), self._queries[queries.PR_NUMBERS],
+                                   _connection(keys.REPOSITORY, keys.PULL_REQUESTS), variables, limit=limit,
+                                   record_filter=record_filter)
+        numbers = [node[keys.NUMBER] for node in nodes]
+        LOG.info("listed %d PRs", len(numbers))
+        return numbers[:limit] if limit > 0 else numbers
+
+    def _complete_reviews(self, client: GraphQLClient, pr: dict):
+        _complete(client, self._queries[queries.PR_REVIEWS_BY_NUMBER], pr, keys.REVIEWS,
+                  _connection(keys.REPOSITORY, keys.PULL_REQUEST, keys.REVIEWS), {keys.NUMBER: pr[keys.NUMBER]})
+
+    def _complete_review_threads(self, client: GraphQLClient, pr: dict):
+        _complete(client, self._queries[queries.PR_REVIEW_THREADS_BY_NUMBER], pr, keys.REVIEW_THREADS,
+                  _connection(keys.REPOSITORY, keys.PULL_REQUEST, keys.REVIEW_THREADS), {keys.NUMBER: pr[keys.NUMBER]})
+        for thread in pr[keys.REVIEW_THREADS][keys.NODES]:
+            _complete(client, self._queries[queries.REVIEW_THREAD_COMMENTS], thread, keys.COMMENTS,
+                      _connection(keys.NODE, keys.COMMENTS), {'id': thread['id']})
+
+    def fetch(self, numbers: typing.List[int]) -> typing.List[dict]:
+        """ fetches the PRs with the given numbers and returns them as records ({'node': pr}) """
+        client = self._client()
+        variables = {f'number{i}': number for i, number in enumerate(numbers)}
+        variables['step'] = self._step
+        try:
+            data = client.send_graphql_query_with_retries(self._batch_query(len(numbers)), variables)
+        except TransportQueryError as ex:
+            # deleted PRs result in NOT_FOUND errors, the data of all other PRs is still returned
+            if not ex.data or any(error.get('type') != 'NOT_FOUND' for error in ex.errors or []):
+                raise
+            data = ex.data
+        records = []
+        for i, number in enumerate(numbers):
+            pr = data[keys.REPOSITORY].get(f'pr{i}')
+            if not pr:
+                LOG.warning("cannot find PR %d", number)
+                continue
+            if self._command == 'get-pr-reviews':
+                self._complete_reviews(client, pr)
+            else:
+                self._complete_review_threads(client, pr)
+            records.append({keys.NODE: pr})
+        return records
+
+    def run(self, record_callback: typing.Callable[[dict], typing.Any], limit: int = 0,
+            page_callback: typing.Optional[typing.Callable[[], None]] = None):
+        """ passes the records to `record_callback` in order, `page_callback` is called after every batch """
+        try:
+            numbers = self.list_numbers(limit)
+            batches = [numbers[i:i + self._batch_size] for i in range(0, len(numbers), self._batch_size)]
+            n = 0
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                # map returns the batches in order
+                for records in executor.map(self.fetch, batches):
+                    for record in records:
+                        record_callback(record)
+                    if page_callback:
+                        page_callback()
+                    n += len(records)
+                    LOG.info("Collected %d of %d PRs", n, len(numbers))
+        finally:
+            for client in self._clients:
+                client.close()
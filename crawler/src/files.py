@@ -0,0 +1,130 @@
+import gzip
+import io
+import json
+import time
+import typing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+COMPRESSIONS = [GZIP, ZSTD]
+EXTENSIONS = {GZIP: '.gz', ZSTD: '.zst'}
+_MAGIC = {GZIP: b'\x1f\x8b', ZSTD: b'\x28\xb5\x2f\xfd'}
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression requires the 'zstandard' package") from None
+    return zstandard
+
+
+def dumps(record: dict) -> bytes:
+    """ serializes a record as a json line (with orjson if it is installed) """
+    if orjson:
+        return orjson.dumps(record) + b'\n'
+    return json.dumps(record).encode('utf-8') + b'\n'
+
+
+def loads(line: typing.Union[str, bytes]) -> dict:
+    return orjson.loads(line) if orjson else json.loads(line)
+
+
+def read_records(path: str) -> typing.Iterator[dict]:
+    """ reads the records of a (possibly compressed) json lines file one by one """
+    with open_text(path) as f:
+        for line in f:
+            yield loads(line)
+
+
+def add_extension(path: str, compression: typing.Optional[str]) -> str:
+    return path + EXTENSIONS[compression] if compression else path
+
+
+def strip_extension(path: str) -> str:
+    """ removes the compression extension (if any) """
+    for extension in EXTENSIONS.values():
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+
+def detect_compression(path: str) -> typing.Optional[str]:
+    with open(path, 'rb') as f:
+        start = f.read(4)
+    for compression, magic in _MAGIC.items():
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def open_text(path: str) -> typing.TextIO:
+    """ opens a (possibly gzip or zstd compressed) text file for reading """
+    compression = detect_compression(path)
+    if compression == GZIP:
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if compression == ZSTD:
+        reader = _zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True,
+                                                               closefd=True)
+        return io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+class BlockWriter:
+    """
+    Buffers the written data and appends it to the file in blocks. With compression, every block is an independent
+    gzip member or zstd frame, so the file can be truncated at any block boundary (see `tell`).
+    """
+    def __init__(self, path: str, append: bool = False, compression: typing.Optional[str] = None,
+                 max_buffer_size: int = 1 << 20, flush_interval: float = 5.):
+        if compression and compression not in COMPRESSIONS:
+            raise ValueError(f"unknown compression '{compression}'")
+        self._compression = compression
+        self._compressor = _zstandard().ZstdCompressor() if compression == ZSTD else None
+        self._f = open(path, 'ab' if append else 'wb')
+        self._buffer: typing.List[bytes] = []
+        self._buffer_size = 0
+        self._max_buffer_size = max_buffer_size
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def write(self, data: bytes):
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if self._buffer_size >= self._max_buffer_size or time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def _compress(self, data: bytes) -> bytes:
+        if self._compression == GZIP:
+            return gzip.compress(data, compresslevel=6)
+        if self._compression == ZSTD:
+            return self._compressor.compress(data)
+        return data
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        self._f.write(self._compress(b''.join(self._buffer)))
+        self._f.flush()
+        self._buffer = []
+        self._buffer_size = 0
+
+    def tell(self) -> int:
+        """ flushes the buffer and returns the size of the file """
+        self.flush()
+        return self._f.tell()
+
+    @property
+    def closed(self) -> bool:
+        return self._f.closed
+
+    def close(self):
+        if not self._f.closed:
+            self.flush()
+            self._f.close()
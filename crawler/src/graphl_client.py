@@ -1,26 +1,112 @@
-from typing import Dict, Any
+import os
+import time
+from typing import Dict, Any, Optional, Callable
 
+import requests
 from gql import gql, Client
+from gql.transport.exceptions import TransportQueryError, TransportServerError
 from gql.transport.requests import RequestsHTTPTransport
 
-from . import log_utils, utils
+from . import log_utils, schema, utils
 from .constants import constants
+from .rate_limit import RateLimitBudget
 
 LOG = log_utils.configure_logger()
 
 
 class GraphQLClient:
-    def __init__(self, default_variables: Dict[str, Any] = None):
+    """ github client that keeps one connection pool (session) open for all its queries """
+    RATE_LIMIT = 'rateLimit'
+    # forbidden & too many requests are returned for secondary rate limits, the rest are (gateway) timeouts
+    RETRYABLE_STATUS_CODES = [403, 429, 500, 502, 503, 504]
+    RETRYABLE_ERROR_TYPES = ['RATE_LIMITED', 'MAX_NODE_LIMIT_EXCEEDED']
+    # github recommends to wait at least a minute after hitting a secondary rate limit
+    RATE_LIMIT_BACKOFF = 60.
+    ERROR_BACKOFF = 5.
+
+    def __init__(self, default_variables: Dict[str, Any] = None, budget: Optional[RateLimitBudget] = None):
         LOG.debug("initialize")
         token = utils.load_secret()
-        transport = RequestsHTTPTransport(
-            url=constants.URL_GITHUB_GRAPHQL, headers={"Authorization": "bearer " + token}, verify=True, retries=3,
+        # failed requests are retried by send_graphql_query_with_retries, which knows the rate limits
+        self._transport = RequestsHTTPTransport(
+            url=os.environ.get(constants.URL_VARIABLE, constants.URL_GITHUB_GRAPHQL),
+            headers={"Authorization": "bearer " + token}, verify=True, retries=0,
         )
         self._default_variables = default_variables if default_variables else {}
-        self._client = Client(transport=transport, fetch_schema_from_transport=True)
+        self._budget = budget if budget else RateLimitBudget()
+        self._client = Client(transport=self._transport, schema=schema.load())
+        # without an open session, gql would create a new http session (and connection) for every query
+        self._session = self._client.connect_sync()
+
+    def close(self):
+        if self._session:
+            self._client.close_sync()
+            self._session = None
+
+    def __enter__(self) -> 'GraphQLClient':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def send_graphql_query(self, query: str, variable_values: dict = None, *args, **kwargs) -> dict:
         LOG.debug("send query %s", query)
+        variable_values = variable_values if variable_values is not None else {}
         variable_values.update(self._default_variables)
-        LOG.debug(f"variable values {variable_values}")
-        return self._client.execute(gql(query), variable_values=variable_values, *args, **kwargs)
+        LOG.debug("variable values %s", variable_values)
+        with self._budget.slot():
+            result = self._session.execute(gql(query), variable_values=variable_values, *args, **kwargs)
+        self._budget.update_from_headers(getattr(self._transport, 'response_headers', None))
+        self._budget.update_from_response(result.get(self.RATE_LIMIT))
+        return result
+
+    def send_graphql_query_with_retries(self, query: str, variable_values: dict, max_retries: int = 5,
+                                        on_retry: Optional[Callable[[], dict]] = None) -> dict:
+        """
+        Retries the query after transient failures (see retry_delay). `on_retry` is called before every retry and
+        returns the variable values for the next attempt (e.g., with a smaller step size).
+        """
+        attempt = 0
+        while True:
+            try:
+                return self.send_graphql_query(query, variable_values=dict(variable_values))
+            except Exception as ex:
+                delay = self.retry_delay(ex, attempt)
+                if delay is None or attempt >= max_retries:
+                    raise
+                attempt += 1
+                LOG.warning("request failed (%s), retrying in %.0f seconds (attempt %d/%d)",
+                            ex, delay, attempt, max_retries)
+                time.sleep(delay)
+                if on_retry:
+                    variable_values = on_retry()
+
+    def refresh_schema(self):
+        """ replaces the local schema with github's current schema """
+        schema.refresh(self._session)
+
+    def _rate_limit_delay(self, attempt: int) -> float:
+        headers = getattr(self._transport, 'response_headers', None) or {}
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+        self._budget.update_from_headers(headers)
+        if self._budget.remaining == 0:
+            return self._budget.seconds_until_reset() + 1
+        return self.RATE_LIMIT_BACKOFF * 2 ** attempt
+
+    def retry_delay(self, ex: Exception, attempt: int) -> Optional[float]:
+        """ returns the seconds to wait before the failed query can be retried or None if it cannot be retried """
+        if isinstance(ex, TransportServerError):
+            if ex.code not in self.RETRYABLE_STATUS_CODES:
+                return None
+            if ex.code in [403, 429]:
+                return self._rate_limit_delay(attempt)
+        elif isinstance(ex, TransportQueryError):
+            error_type = utils.error_type(ex)
+            if error_type == 'RATE_LIMITED':
+                return self._rate_limit_delay(attempt)
+            if error_type not in self.RETRYABLE_ERROR_TYPES and 'timeout' not in str(ex):
+                return None
+        elif not isinstance(ex, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+            return None
+        return self.ERROR_BACKOFF * 2 ** attempt
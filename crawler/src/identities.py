@@ -0,0 +1,137 @@
+import json
+import os
+import typing
+
+from . import log_utils
+
+LOG = log_utils.configure_logger()
+
+# aliases of a person, a row has them as <role><Suffix>, e.g., authorLogin, authorDatabaseId (commits only)
+DATABASE_ID = 'databaseId'
+LOGIN = 'login'
+EMAIL = 'email'
+NAME = 'name'
+ALIASES = (DATABASE_ID, LOGIN, EMAIL, NAME)
+# aliases that identify a person, names are only used to look up identities
+UNIQUE_ALIASES = (DATABASE_ID, LOGIN, EMAIL)
+
+
+def _suffix(alias: str) -> str:
+    return alias[0].upper() + alias[1:]
+
+
+def _roles(columns: typing.Iterable[str]) -> typing.List[str]:
+    """ the roles of the <role>Login columns """
+    return [column[:-len(LOGIN)] for column in columns if column.endswith(_suffix(LOGIN)) and len(column) > len(LOGIN)]
+
+
+def id_columns(columns: typing.Iterable[str]) -> typing.List[str]:
+    """ the <role>Id columns that `annotate` added to a row or table with these columns """
+    columns = list(columns)
+    return [role + 'Id' for role in _roles(columns) if role + 'Id' in columns]
+
+
+def _value(alias: str, value) -> typing.Optional[typing.Union[int, str]]:
+    if value is None or value == '':
+        return None
+    return value.lower() if alias == EMAIL else value
+
+
+class IdentityIndex:
+    """
+    Interns people to integer ids by their database id, login, email and name. Rows that share a database id, login
+    or email get the same id; when a row connects two known identities (e.g., a renamed login of the same database
+    id), they are merged and `canonical` maps the ids of both to the remaining one.
+    """
+    def __init__(self):
+        self._parents: typing.List[int] = []
+        self._aliases: typing.Dict[str, dict] = {alias: {} for alias in ALIASES}
+        # number of merges, ids that were handed out before a merge may no longer be canonical
+        self.merges = 0
+
+    def __len__(self) -> int:
+        """ the number of distinct identities """
+        return sum(1 for i, parent in enumerate(self._parents) if i == parent)
+
+    def canonical(self, id: int) -> int:
+        root = id
+        while self._parents[root] != root:
+            root = self._parents[root]
+        while self._parents[id] != root:
+            self._parents[id], id = root, self._parents[id]
+        return root
+
+    def _merge(self, ids: typing.Set[int]) -> int:
+        roots = {self.canonical(id) for id in ids}
+        root = min(roots)
+        for other in roots - {root}:
+            self._parents[other] = root
+        if len(roots) > 1:
+            self.merges += 1
+            LOG.debug("merged identities %s into %d", sorted(roots), root)
+        return root
+
+    def find(self, database_id: typing.Optional[int] = None, login: typing.Optional[str] = None,
+             email: typing.Optional[str] = None, name: typing.Optional[str] = None) -> typing.Optional[int]:
+        """ the id of the person with any of the aliases or None """
+        for alias, value in zip(ALIASES, (database_id, login, email, name)):
+            value = _value(alias, value)
+            if value is not None and value in self._aliases[alias]:
+                return self.canonical(self._aliases[alias][value])
+        return None
+
+    def resolve(self, database_id: typing.Optional[int] = None, login: typing.Optional[str] = None,
+                email: typing.Optional[str] = None, name: typing.Optional[str] = None) -> typing.Optional[int]:
+        """ the id of the person with these aliases, new aliases are added to the person """
+        values = {alias: _value(alias, value) for alias, value in zip(ALIASES, (database_id, login, email, name))}
+        values = {alias: value for alias, value in values.items() if value is not None}
+        unique = [alias for alias in UNIQUE_ALIASES if alias in values]
+        if not unique:
+            return self.find(name=values.get(NAME))
+        ids = {self._aliases[alias][values[alias]] for alias in unique if values[alias] in self._aliases[alias]}
+        if ids:
+            id = self._merge(ids)
+        else:
+            id = len(self._parents)
+            self._parents.append(id)
+        for alias, value in values.items():
+            # a name keeps pointing to the first person with that name
+            if alias != NAME or value not in self._aliases[NAME]:
+                self._aliases[alias][value] = id
+        return id
+
+    def annotate(self, row: dict) -> dict:
+        """ adds <role>Id for every <role>Login of the row (in place) """
+        for role in _roles(row):
+            row[role + 'Id'] = self.resolve(*(row.get(role + _suffix(alias)) for alias in ALIASES))
+        return row
+
+    def identities(self) -> typing.List[dict]:
+        """ all aliases per id """
+        identities: typing.Dict[int, dict] = {}
+        for alias, values in self._aliases.items():
+            for value, id in values.items():
+                id = self.canonical(id)
+                identity = identities.setdefault(id, {'id': id, **{alias + 's': [] for alias in ALIASES}})
+                identity[alias + 's'].append(value)
+        return [identities[id] for id in sorted(identities)]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'parents': self._parents,
+                       'aliases': {alias: list(values.items()) for alias, values in self._aliases.items()}}, f)
+        os.replace(tmp, path)
+        LOG.info("saved %d identities to %s", len(self), path)
+
+    @classmethod
+    def load(cls, path: str) -> 'IdentityIndex':
+        """ the index saved at path or an empty index if the file does not exist """
+        index = cls()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            index._parents = data['parents']
+            index._aliases = {alias: dict(data['aliases'].get(alias, [])) for alias in ALIASES}
+        return index
@@ -0,0 +1,400 @@
+import os
+import threading
+import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import data_access, files, log_utils, normalization, tables, traversal, utils
+from .backup import Checkpoint
+from .collector import DataCollectorBuilder, JsonWriter
+from .constants import queries, keys
+from .fanout import PullRequestFanOut
+from .graphl_client import GraphQLClient
+from .manifest import Manifest, SPECS, merge
+from .rate_limit import RateLimitBudget
+from .record_filter import RecordFilter, get_value, updated_window
+
+LOG = log_utils.configure_logger()
+
+
+def create_output_path(command: str, config: dict, limit: int = 0, compression: typing.Optional[str] = None,
+                       since: typing.Optional[str] = None, until: typing.Optional[str] = None) -> str:
+    # let's try it without date
+    # date = datetime.now().strftime("%Y%m%d-%Hh%Mm%Ss")
+    if command.startswith('get-'):
+        command = command[4:]
+    elements = [command]
+    for k, v in config.items():
+        elements.append(f'{k}-{v}')
+    if limit:
+        elements.append(f"limit{limit}")
+    if since:
+        elements.append(f"since{since[:10]}")
+    if until:
+        elements.append(f"until{until[:10]}")
+    filename = "_".join(elements)
+    return files.add_extension(f"data/{filename}.txt", compression)
+
+
+class Job:
+    """ a single download of one data set (command) for one repository """
+    def __init__(self, command: str, config: OrderedDict, limit: int = 0, resume: bool = False,
+                 path: typing.Optional[str] = None, delta: bool = False, pipeline: bool = False,
+                 fan_out_workers: int = 0, fan_out_batch_size: int = 25, checkpoint_interval: int = 1,
+                 compression: typing.Optional[str] = None, normalize: bool = False, raw: bool = True,
+                 table_format: str = tables.JSON, since: typing.Optional[str] = None,
+                 until: typing.Optional[str] = None, exclude_authors: typing.Sequence[str] = (),
+                 exclude_fields: typing.Sequence[str] = (), truncate: typing.Optional[typing.Dict[str, int]] = None):
+        if command not in COLLECTORS:
+            raise ValueError(f"unknown command '{command}'")
+        if not raw and (resume or delta):
+            raise ValueError("resuming and delta downloads require the raw data")
+        if delta and (since or until):
+            raise ValueError("delta downloads cannot be limited to a time window")
+        if fan_out_workers > 0 and (delta or pipeline):
+            raise ValueError("fanning out cannot be combined with delta downloads or pipelining")
+        self.command = command
+        self.config = config
+        self.limit = limit
+        self.resume = resume
+        self.delta = delta
+        self.pipeline = pipeline
+        # number of workers for downloading reviews of many PRs per request, 0 disables the fan out
+        self.fan_out_workers = fan_out_workers
+        self.fan_out_batch_size = fan_out_batch_size
+        self.compression = compression
+        # downloads only the records of [since, until) (ISO 8601 timestamps)
+        self.since = since
+        self.until = until
+        self.path = path if path else create_output_path(command, config, limit, compression, since, until)
+        # number of pages between two checkpoints
+        self.checkpoint_interval = checkpoint_interval
+        # writes the normalized tables (see TABLES) while downloading, optionally without the raw data
+        self.normalize = normalize
+        self.raw = raw
+        self.table_format = table_format
+        # the records (and the comments and reviews in them) of these logins are dropped
+        self.exclude_authors = list(exclude_authors)
+        # fields that are removed from the records or shortened (path -> maximum length), e.g., 'message'
+        self.exclude_fields = list(exclude_fields)
+        self.truncate = truncate if truncate else {}
+
+    def record_filter(self, record_filter: typing.Optional[RecordFilter] = None) -> typing.Optional[RecordFilter]:
+        """ adds the excluded authors and the excluded and truncated fields to the filter (or to a new filter) """
+        if not (self.exclude_authors or self.exclude_fields or self.truncate):
+            return record_filter
+        record_filter = record_filter if record_filter else RecordFilter()
+        if self.exclude_authors:
+            excluded = set(self.exclude_authors)
+            author, authored_lists = AUTHORS[self.command]
+            record_filter.where(lambda record: get_value(record, author) not in excluded)
+            for path in authored_lists:
+                record_filter.where_items(path, lambda item: get_value(item, 'author/login') not in excluded)
+        record_filter.exclude(*self.exclude_fields)
+        for path, length in self.truncate.items():
+            record_filter.truncate(path, length)
+        return record_filter
+
+    @property
+    def table_outputs(self) -> typing.Dict[str, str]:
+        """ output path by normalized table """
+        return {table: tables.create_output_path(self.path, table, self.table_format)
+                for table in TABLES[self.command]}
+
+    @property
+    def key(self) -> str:
+        """ identifies the job's checkpoint (command, owner, repository, branch, etc.) """
+        return os.path.splitext(os.path.basename(files.strip_extension(self.path)))[0]
+
+    @property
+    def name(self) -> str:
+        return f"{self.command}:{self.config['owner']}/{self.config['repository']}"
+
+    def __str__(self):
+        return self.name
+
+
+def _history_path() -> data_access.AccessPathBuilder:
+    return data_access.AccessPathBuilder().add(keys.REPOSITORY).add(keys.REF).add(keys.TARGET).add(keys.HISTORY)
+
+
+def _pull_requests_path() -> data_access.AccessPathBuilder:
+    return data_access.AccessPathBuilder().add(keys.REPOSITORY).add(keys.PULL_REQUESTS)
+
+
+def _commits(builder: DataCollectorBuilder, query_name: str) -> DataCollectorBuilder:
+    base_path = _history_path()
+    record_path = base_path.copy().add(keys.NODES).build()
+    cursor = traversal.Cursor(base_path.copy().add(keys.PAGE_INFO).build())
+    return builder \
+        .add_query(utils.load_query(query_name)) \
+        .add_records_access(record_path) \
+        .add_cursor_generator(traversal.CursorGenerator(cursor))
+
+
+def _pull_requests(builder: DataCollectorBuilder, query_name: str) -> DataCollectorBuilder:
+    base_path = _pull_requests_path()
+    record_path = base_path.copy().add(keys.EDGES).build()
+    cursor = traversal.Cursor(base_path.copy().add(keys.PAGE_INFO).build())
+    return builder \
+        .add_query(utils.load_query(query_name)) \
+        .add_records_access(record_path) \
+        .add_cursor_generator(traversal.CursorGenerator(cursor))
+
+
+def _pr_reviews(builder: DataCollectorBuilder) -> DataCollectorBuilder:
+    base_path = _pull_requests_path()
+    review_path = base_path.copy().add(keys.EDGES).add(0).add(keys.NODE).add(keys.REVIEWS)
+    cursor_root = traversal.Cursor(
+        base_path.copy().add(keys.PAGE_INFO).build(),
+        has_next='hasPreviousPage',
+        cursor_name='startCursor',
+        variable_name='cursorTop'
+    )
+    traversal.Cursor(
+        review_path.add(keys.PAGE_INFO).build(),
+        variable_name='cursorReviews',
+        parent=cursor_root
+    )
+    return builder \
+        .add_query(utils.load_query(queries.PRS_REVIEWS)) \
+        .add_records_access(base_path.copy().add(keys.EDGES).build()) \
+        .add_cursor_generator(traversal.CursorGenerator(cursor_root))
+
+
+def _pr_review_threads(builder: DataCollectorBuilder) -> DataCollectorBuilder:
+    base_path = _pull_requests_path()
+    review_thread_path = base_path.copy().add(keys.EDGES).add(0).add(keys.NODE).add(keys.REVIEW_THREADS)
+    cursor_root = traversal.Cursor(
+        base_path.copy().add(keys.PAGE_INFO).build(),
+        has_next='hasPreviousPage',
+        cursor_name='startCursor',
+        variable_name='cursorTop'
+    )
+    cursor_review_threads = traversal.Cursor(
+        review_thread_path.copy().add(keys.PAGE_INFO).build(),
+        variable_name='cursorReviewThreads',
+        parent=cursor_root
+    )
+    traversal.Cursor(
+        review_thread_path.copy().add(keys.NODES).add(0).add(keys.COMMENTS).add(keys.PAGE_INFO).build(),
+        variable_name='cursorReviewThreadComments',
+        parent=cursor_review_threads
+    )
+    return builder \
+        .add_query(utils.load_query(queries.PRS_REVIEW_THREADS)) \
+        .add_records_access(base_path.copy().add(keys.EDGES).build()) \
+        .add_cursor_generator(traversal.CursorGenerator(cursor_root))
+
+
+COLLECTORS: typing.Dict[str, typing.Callable[[DataCollectorBuilder], DataCollectorBuilder]] = OrderedDict([
+    ('get-commits', lambda builder: _commits(builder, queries.COMMITS)),
+    ('get-prs-brief', lambda builder: _pull_requests(builder, queries.PRS)),
+    ('get-user-commits', lambda builder: _commits(builder, queries.USER_COMMITS)),
+    ('get-prs-long', lambda builder: _pull_requests(builder, queries.PRS_FULL)),
+    ('get-pr-reviews', _pr_reviews),
+    ('get-pr-review-threads', _pr_review_threads),
+])
+
+
+def _history_window(since: typing.Optional[str], until: typing.Optional[str]) \
+        -> typing.Tuple[dict, typing.Optional[RecordFilter]]:
+    """ the commit history is limited by github """
+    variables = {}
+    if since:
+        variables['since'] = since
+    if until:
+        variables['until'] = until
+    return variables, None
+
+
+# query variables and record filter that limit the download to a time window [since, until) by command
+TIME_WINDOWS: typing.Dict[str, typing.Callable[[typing.Optional[str], typing.Optional[str]],
+                                               typing.Tuple[dict, typing.Optional[RecordFilter]]]] = {
+    'get-commits': _history_window,
+    'get-user-commits': _history_window,
+    'get-prs-brief': lambda since, until: updated_window(f'{keys.NODE}/{keys.UPDATED_AT}', since, until),
+    'get-prs-long': lambda since, until: updated_window(f'{keys.NODE}/{keys.UPDATED_AT}', since, until),
+    'get-pr-reviews': lambda since, until: updated_window(f'{keys.NODE}/{keys.UPDATED_AT}', since, until,
+                                                          backward=True),
+    'get-pr-review-threads': lambda since, until: updated_window(f'{keys.NODE}/{keys.UPDATED_AT}', since, until,
+                                                                 backward=True),
+}
+
+# path of the author's login of the records and the lists of comments and reviews in them by command
+AUTHORS: typing.Dict[str, typing.Tuple[str, typing.List[str]]] = {
+    'get-commits': ('author/user/login', []),
+    'get-prs-brief': (f'{keys.NODE}/author/login', []),
+    'get-user-commits': ('author/user/login', []),
+    'get-prs-long': (f'{keys.NODE}/author/login', [f'{keys.NODE}/comments/nodes', f'{keys.NODE}/reviews/nodes',
+                                                   f'{keys.NODE}/reviewThreads/nodes/*/comments/nodes']),
+    'get-pr-reviews': (f'{keys.NODE}/author/login', [f'{keys.NODE}/reviews/nodes']),
+    'get-pr-review-threads': (f'{keys.NODE}/author/login', [f'{keys.NODE}/reviewThreads/nodes/*/comments/nodes']),
+}
+
+
+# normalized tables by command
+TABLES: typing.Dict[str, typing.List[str]] = {
+    'get-commits': ['commits'],
+    'get-prs-brief': ['pr-flat'],
+    'get-user-commits': ['commits'],
+    'get-prs-long': list(normalization.PR_EXTRACTORS),
+    'get-pr-reviews': ['reviews'],
+    'get-pr-review-threads': ['threads'],
+}
+
+# commands that only need owner, repository and branch
+REPOSITORY_COMMANDS = [command for command in COLLECTORS if command != 'get-user-commits']
+
+
+def init_builder(gql_client: GraphQLClient, resume: bool) -> DataCollectorBuilder:
+    builder = DataCollectorBuilder() \
+        .add_client(gql_client) \
+        .enable_adaptive_step_size()
+    if resume:
+        builder = builder.enable_resume()
+    return builder
+
+
+def _run_fan_out(job: Job, budget: typing.Optional[RateLimitBudget] = None):
+    if job.command not in PullRequestFanOut.FRAGMENTS:
+        raise ValueError(f"{job.command} does not support fanning out")
+    if job.resume:
+        LOG.warning("fanning out does not support resuming, downloading everything")
+    fan_out = PullRequestFanOut(job.command, lambda: GraphQLClient(job.config, budget=budget),
+                                batch_size=job.fan_out_batch_size, workers=job.fan_out_workers,
+                                since=job.since, until=job.until)
+    writer = JsonWriter(job.path, compression=job.compression) if job.raw else None
+    normalizer = normalization.RecordNormalizer(job.table_outputs, format=job.table_format) \
+        if job.normalize else None
+    # the time window is applied when listing the PRs
+    record_filter = job.record_filter()
+
+    def add(record: dict):
+        for filtered in record_filter.apply([record])[0] if record_filter else [record]:
+            if writer:
+                writer.add(filtered)
+            if normalizer:
+                normalizer.add(filtered)
+
+    try:
+        fan_out.run(add, job.limit, page_callback=writer.flush if writer else None)
+    finally:
+        if writer:
+            writer.close()
+        if normalizer:
+            normalizer.close()
+
+
+def run(job: Job, budget: typing.Optional[RateLimitBudget] = None, client: typing.Optional[GraphQLClient] = None):
+    """ runs the job with the given client or with a new client that uses the job's config as default variables """
+    LOG.info("run job %s", job)
+    if job.fan_out_workers > 0:
+        _run_fan_out(job, budget)
+        return
+    path = job.path
+    previous: typing.Optional[Manifest] = None
+    if job.delta:
+        if job.command not in SPECS:
+            LOG.warning("%s does not support delta downloads, downloading everything", job.command)
+        elif job.resume:
+            LOG.warning("resuming the download, ignoring delta")
+        else:
+            previous = Manifest.load(job.path)
+    if previous:
+        LOG.info("downloading delta since %s (newest: %s)", previous.watermark, previous.newest)
+        path = job.path + '.delta'
+
+    owns_client = client is None
+    if owns_client:
+        client = GraphQLClient(job.config, budget=budget)
+    checkpoint = Checkpoint(job.key, interval=job.checkpoint_interval)
+    state = checkpoint.load() if job.resume else None
+    resume = job.resume and state is not None
+    if job.resume and not resume and os.path.exists(path):
+        LOG.warning("no checkpoint to resume %s from, downloading everything and overwriting %s", job, path)
+    builder = init_builder(client, resume)
+    if previous:
+        builder = builder.add_variables(previous.spec.delta_variables)
+    if job.pipeline:
+        builder = builder.enable_pipelining()
+    record_filter = None
+    if job.since or job.until:
+        variables, record_filter = TIME_WINDOWS[job.command](job.since, job.until)
+        builder = builder.add_variables(variables)
+    record_filter = job.record_filter(record_filter)
+    if record_filter:
+        builder = builder.add_record_filter(record_filter)
+    writer = JsonWriter(path, append=resume, offset=state.offset if state else None,
+                        compression=job.compression) if job.raw else None
+    if writer:
+        builder = builder.add_page_callback(writer.flush)
+    if writer and not previous:
+        # delta downloads are short and not resumed
+        builder = builder.add_checkpoint(checkpoint, writer.tell)
+    manifest = Manifest(job.path, job.command) if job.command in SPECS and job.raw and not resume else None
+    # resumed and delta downloads only write a part of the data, their tables are created from the complete file
+    normalizer = normalization.RecordNormalizer(job.table_outputs, format=job.table_format) \
+        if job.normalize and not (resume or previous) else None
+
+    def add(record: dict) -> bool:
+        if previous and previous.is_known(record):
+            LOG.info("reached already downloaded records")
+            return False
+        if writer and not writer.add(record):
+            return False
+        if manifest:
+            manifest.observe(record)
+        if normalizer:
+            # the extractors change the record, so it comes last
+            normalizer.add(record)
+        return True
+
+    LOG.info("create collector")
+    collector = COLLECTORS[job.command](builder) \
+        .add_record_callback(add) \
+        .add_limit(job.limit) \
+        .build()
+    try:
+        collector.run()
+    finally:
+        if writer:
+            writer.close()
+        if normalizer:
+            normalizer.close()
+        if owns_client:
+            client.close()
+
+    if previous:
+        merge(previous, path).save()
+    elif manifest:
+        manifest.cursor = collector.last_cursors
+        manifest.save()
+    elif job.command in SPECS and job.raw:
+        manifest = Manifest.scan(job.path, job.command)
+        manifest.cursor = collector.last_cursors
+        manifest.save()
+    if job.normalize and not normalizer:
+        LOG.info("normalizing %s", job.path)
+        normalization.normalize_records(files.read_records(job.path), job.table_outputs, format=job.table_format)
+
+
+def run_many(jobs: typing.List[Job], max_workers: int, budget: typing.Optional[RateLimitBudget] = None) -> bool:
+    """ runs the jobs concurrently and returns true if all jobs succeeded """
+    budget = budget if budget else RateLimitBudget()
+
+    def run_named(job: Job):
+        threading.current_thread().name = job.name
+        run(job, budget)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(job, executor.submit(run_named, job)) for job in jobs]
+    succeeded = True
+    for job, future in futures:
+        ex = future.exception()
+        if ex:
+            LOG.error("job %s failed: %s", job, ex)
+            succeeded = False
+        else:
+            LOG.info("job %s finished", job)
+    return succeeded
@@ -4,7 +4,7 @@ import sys
 
 log_level = logging.INFO
 loggers = []
-FORMATTER = logging.Formatter('%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+FORMATTER = logging.Formatter('%(asctime)s - %(levelname)s - %(threadName)s - %(module)s - %(message)s')
 STREAM_HANDLER = logging.StreamHandler(sys.stderr)
 STREAM_HANDLER.setLevel(log_level)
 STREAM_HANDLER.setFormatter(FORMATTER)
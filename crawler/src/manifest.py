@@ -0,0 +1,173 @@
+import json
+import os
+import typing
+from datetime import datetime, timezone
+
+from . import files, log_utils
+from .backup import atomic_write_json
+from .constants import keys
+
+LOG = log_utils.configure_logger()
+
+
+class RecordSpec:
+    """ describes how records of a data set are identified and ordered """
+    def __init__(self, key: str, timestamp: str, node: typing.Optional[str] = None, newest_first: bool = False,
+                 delta_variables: typing.Optional[dict] = None):
+        self.key = key
+        self.timestamp = timestamp
+        self._node = node
+        self.newest_first = newest_first
+        self.delta_variables = delta_variables if delta_variables else {}
+
+    def node(self, record: dict) -> dict:
+        return record[self._node] if self._node else record
+
+    def key_of(self, record: dict):
+        return self.node(record)[self.key]
+
+    def timestamp_of(self, record: dict) -> typing.Optional[str]:
+        return self.node(record).get(self.timestamp)
+
+
+_PRS = RecordSpec(keys.NUMBER, keys.UPDATED_AT, node=keys.NODE,
+                  delta_variables={'orderBy': {'field': 'UPDATED_AT', 'direction': 'DESC'}})
+
+# commands that support delta downloads
+SPECS: typing.Dict[str, RecordSpec] = {
+    'get-commits': RecordSpec(keys.OID, keys.COMMITTED_DATE, newest_first=True),
+    'get-prs-brief': _PRS,
+    'get-prs-long': _PRS,
+}
+
+
+class Manifest:
+    """
+    Description of a downloaded data set: last cursor, newest & oldest record and the watermark
+    (latest timestamp) that is used to download only the delta in the next run.
+    """
+    SUFFIX = '.manifest.json'
+
+    def __init__(self, path: str, command: str):
+        self.path = path
+        self.command = command
+        self.spec = SPECS[command]
+        self.cursor: typing.Optional[dict] = None
+        self.records = 0
+        self.newest = None
+        self.oldest = None
+        self.watermark: typing.Optional[str] = None
+        self.updated: typing.Optional[str] = None
+
+    @classmethod
+    def file_name(cls, path: str) -> str:
+        return path + cls.SUFFIX
+
+    @classmethod
+    def load(cls, path: str) -> typing.Optional['Manifest']:
+        file_name = cls.file_name(path)
+        if not os.path.exists(file_name) or not os.path.exists(path):
+            LOG.info("no manifest for %s", path)
+            return None
+        with open(file_name, 'r') as f:
+            content = json.load(f)
+        manifest = Manifest(content['path'], content['command'])
+        for name in ['cursor', 'records', 'newest', 'oldest', 'watermark', 'updated']:
+            setattr(manifest, name, content.get(name))
+        LOG.info("loaded manifest %s", file_name)
+        return manifest
+
+    @classmethod
+    def scan(cls, path: str, command: str) -> 'Manifest':
+        """ creates the manifest from an existing data file """
+        manifest = Manifest(path, command)
+        with files.open_text(path) as f:
+            for line in f:
+                manifest.observe(json.loads(line))
+        return manifest
+
+    def save(self):
+        self.updated = datetime.now(timezone.utc).isoformat()
+        content = {
+            'path': self.path,
+            'command': self.command,
+            'cursor': self.cursor,
+            'records': self.records,
+            'newest': self.newest,
+            'oldest': self.oldest,
+            'watermark': self.watermark,
+            'updated': self.updated,
+        }
+        atomic_write_json(self.file_name(self.path), content, indent=2)
+        LOG.info("saved manifest %s", self.file_name(self.path))
+
+    def observe(self, record: dict):
+        """ registers a record of the data file (in file order) """
+        key = self.spec.key_of(record)
+        timestamp = self.spec.timestamp_of(record)
+        self.records += 1
+        if self.spec.newest_first:
+            if self.newest is None:
+                self.newest = key
+            self.oldest = key
+        else:
+            if self.newest is None or key > self.newest:
+                self.newest = key
+            if self.oldest is None or key < self.oldest:
+                self.oldest = key
+        # ISO 8601 timestamps in UTC compare lexicographically
+        if timestamp and (self.watermark is None or timestamp > self.watermark):
+            self.watermark = timestamp
+
+    def is_known(self, record: dict) -> bool:
+        """ returns true if the record marks the end of the delta """
+        if self.spec.newest_first:
+            return self.spec.key_of(record) == self.newest
+        timestamp = self.spec.timestamp_of(record)
+        return bool(timestamp and self.watermark and timestamp < self.watermark)
+
+
+def merge(manifest: Manifest, delta_path: str) -> Manifest:
+    """
+    Merges the new or updated records of the delta file into the data file described by the manifest.
+    Returns the manifest of the merged file.
+    """
+    spec = manifest.spec
+    delta = {}
+    with files.open_text(delta_path) as f:
+        for line in f:
+            record = json.loads(line)
+            delta[spec.key_of(record)] = (line, record)
+    LOG.info("merging %d new or updated records into %s", len(delta), manifest.path)
+    if not delta:
+        os.remove(delta_path)
+        return manifest
+
+    merged = Manifest(manifest.path, manifest.command)
+    merged.cursor = manifest.cursor
+    tmp_path = manifest.path + '.tmp'
+    out = files.BlockWriter(tmp_path, compression=files.detect_compression(manifest.path))
+    try:
+        def write(line: str, record: dict):
+            out.write(line.encode('utf-8'))
+            merged.observe(record)
+
+        if spec.newest_first:
+            for line, record in delta.values():
+                write(line, record)
+        with files.open_text(manifest.path) as f:
+            for line in f:
+                record = json.loads(line)
+                key = spec.key_of(record)
+                if key not in delta:
+                    write(line, record)
+                elif not spec.newest_first:
+                    write(*delta.pop(key))
+        if not spec.newest_first:
+            for key in sorted(delta):
+                write(*delta[key])
+    finally:
+        out.close()
+    os.replace(tmp_path, manifest.path)
+    os.remove(delta_path)
+    return merged
@@ -0,0 +1,225 @@
+import json
+import os
+import sqlite3
+import typing
+
+from . import log_utils
+from .constants import Files, keys
+
+LOG = log_utils.configure_logger()
+
+COMPONENT_PREFIX = 'component='
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    project TEXT NOT NULL,
+    oid TEXT NOT NULL,
+    committed_at TEXT,
+    author TEXT,
+    committer TEXT,
+    PRIMARY KEY (project, oid)
+);
+CREATE INDEX IF NOT EXISTS commits_committed_at ON commits (project, committed_at);
+CREATE TABLE IF NOT EXISTS prs (
+    project TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    author TEXT,
+    created_at TEXT,
+    closed_at TEXT,
+    merged_at TEXT,
+    first_review_at TEXT,
+    components TEXT,
+    PRIMARY KEY (project, number)
+);
+CREATE INDEX IF NOT EXISTS prs_created_at ON prs (project, created_at);
+CREATE INDEX IF NOT EXISTS prs_closed_at ON prs (project, closed_at);
+CREATE INDEX IF NOT EXISTS prs_merged_at ON prs (project, merged_at);
+CREATE TABLE IF NOT EXISTS pr_components (
+    project TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    component TEXT NOT NULL,
+    PRIMARY KEY (project, number, component)
+);
+CREATE TABLE IF NOT EXISTS monthly (
+    project TEXT NOT NULL,
+    month TEXT NOT NULL,
+    commits INTEGER,
+    active_contributors INTEGER,
+    active_committers INTEGER,
+    contributor_committer_ratio REAL,
+    opened_prs INTEGER,
+    avg_time_to_first_review REAL,
+    merged_prs INTEGER,
+    merged_without_review INTEGER,
+    closed_prs INTEGER,
+    avg_lifetime REAL,
+    PRIMARY KEY (project, month)
+);
+CREATE TABLE IF NOT EXISTS monthly_components (
+    project TEXT NOT NULL,
+    month TEXT NOT NULL,
+    component TEXT NOT NULL,
+    opened_prs INTEGER,
+    avg_time_to_first_review REAL,
+    closed_prs INTEGER,
+    avg_lifetime REAL,
+    PRIMARY KEY (project, month, component)
+);
+"""
+
+# durations are in hours
+_TIME_TO_FIRST_REVIEW = "(julianday(first_review_at) - julianday(created_at)) * 24"
+_LIFETIME = "(julianday(closed_at) - julianday(created_at)) * 24"
+
+
+def month_of(timestamp: typing.Optional[str]) -> typing.Optional[str]:
+    """ 'YYYY-MM' of an ISO 8601 timestamp """
+    return timestamp[:7] if timestamp else None
+
+
+def next_month(month: str) -> str:
+    year, month = int(month[:4]), int(month[5:7])
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def _first_review(row: dict) -> typing.Optional[str]:
+    reviews = [row.get('firstReviewCreatedAt'), row.get('firstReviewThreadCreatedAt')]
+    reviews = [review for review in reviews if review]
+    return min(reviews) if reviews else None
+
+
+def _components(row: dict) -> typing.List[str]:
+    labels = row.get(keys.LABELS) or []
+    # a component is counted once per PR
+    return sorted({label[len(COMPONENT_PREFIX):] for label in labels if label.startswith(COMPONENT_PREFIX)})
+
+
+class MetricsStore:
+    """
+    Per-month project health metrics (see notes.md) in a SQLite database. The commits and PRs that the metrics are
+    computed from are stored as well, so that adding new data only recomputes the months that the data changed.
+    """
+    def __init__(self, path: str = Files.METRICS_DB):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self) -> 'MetricsStore':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_commits(self, project: str, rows: typing.Iterable[dict]) -> typing.Set[str]:
+        """ upserts the rows of a normalized commits table and returns the months with changed commits """
+        with self._db:
+            self._db.execute("CREATE TEMP TABLE IF NOT EXISTS new_commits "
+                             "(oid TEXT PRIMARY KEY, committed_at TEXT, author TEXT, committer TEXT)")
+            self._db.execute("DELETE FROM new_commits")
+            self._db.executemany("INSERT OR REPLACE INTO new_commits VALUES (?, ?, ?, ?)", (
+                (row[keys.OID], row.get(keys.COMMITTED_DATE), row.get('authorLogin'), row.get('committerLogin'))
+                for row in rows))
+            changed = self._db.execute("""
+                SELECT n.committed_at, c.committed_at FROM new_commits n
+                LEFT JOIN commits c ON c.project = ? AND c.oid = n.oid
+                WHERE c.oid IS NULL OR NOT (n.committed_at IS c.committed_at AND n.author IS c.author
+                                            AND n.committer IS c.committer)""", (project,)).fetchall()
+            self._db.execute("""
+                INSERT INTO commits (project, oid, committed_at, author, committer)
+                SELECT ?, oid, committed_at, author, committer FROM new_commits WHERE true
+                ON CONFLICT (project, oid) DO UPDATE SET
+                    committed_at = excluded.committed_at, author = excluded.author, committer = excluded.committer
+                """, (project,))
+        months = {month_of(timestamp) for row in changed for timestamp in row} - {None}
+        LOG.info("%d new or changed commits in %d months", len(changed), len(months))
+        return months
+
+    def add_prs(self, project: str, rows: typing.Iterable[dict]) -> typing.Set[str]:
+        """ upserts the rows of a normalized pr-flat table and returns the months with changed PRs """
+        with self._db:
+            self._db.execute("CREATE TEMP TABLE IF NOT EXISTS new_prs (number INTEGER PRIMARY KEY, author TEXT, "
+                             "created_at TEXT, closed_at TEXT, merged_at TEXT, first_review_at TEXT, components TEXT)")
+            self._db.execute("DELETE FROM new_prs")
+            self._db.executemany("INSERT OR REPLACE INTO new_prs VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                (row[keys.NUMBER], row.get('authorLogin'), row.get(keys.CREATED_AT), row.get('closedAt'),
+                 row.get('mergedAt'), _first_review(row), json.dumps(_components(row)))
+                for row in rows))
+            changed = self._db.execute("""
+                SELECT n.number, n.components, n.created_at, n.closed_at, n.merged_at,
+                       p.created_at, p.closed_at, p.merged_at
+                FROM new_prs n LEFT JOIN prs p ON p.project = ? AND p.number = n.number
+                WHERE p.number IS NULL OR NOT (n.author IS p.author AND n.created_at IS p.created_at
+                                               AND n.closed_at IS p.closed_at AND n.merged_at IS p.merged_at
+                                               AND n.first_review_at IS p.first_review_at
+                                               AND n.components IS p.components)""", (project,)).fetchall()
+            self._db.execute("""
+                INSERT INTO prs (project, number, author, created_at, closed_at, merged_at, first_review_at, components)
+                SELECT ?, number, author, created_at, closed_at, merged_at, first_review_at, components
+                FROM new_prs WHERE true
+                ON CONFLICT (project, number) DO UPDATE SET
+                    author = excluded.author, created_at = excluded.created_at, closed_at = excluded.closed_at,
+                    merged_at = excluded.merged_at, first_review_at = excluded.first_review_at,
+                    components = excluded.components
+                """, (project,))
+            self._db.executemany("DELETE FROM pr_components WHERE project = ? AND number = ?",
+                                 ((project, row[0]) for row in changed))
+            self._db.executemany("INSERT INTO pr_components VALUES (?, ?, ?)", (
+                (project, row[0], component) for row in changed for component in json.loads(row[1])))
+        months = {month_of(timestamp) for row in changed for timestamp in row[2:]} - {None}
+        LOG.info("%d new or changed PRs in %d months", len(changed), len(months))
+        return months
+
+    def _aggregate(self, query: str, project: str, month: str) -> tuple:
+        return self._db.execute(query, (project, month, next_month(month))).fetchone()
+
+    def update(self, project: str, months: typing.Iterable[str]):
+        """ recomputes the metrics of the given months """
+        months = sorted(months)
+        with self._db:
+            for month in months:
+                commits, contributors, committers = self._aggregate(
+                    "SELECT COUNT(*), COUNT(DISTINCT author), COUNT(DISTINCT committer) FROM commits "
+                    "WHERE project = ? AND committed_at >= ? AND committed_at < ?", project, month)
+                opened, time_to_first_review = self._aggregate(
+                    f"SELECT COUNT(*), AVG({_TIME_TO_FIRST_REVIEW}) FROM prs "
+                    f"WHERE project = ? AND created_at >= ? AND created_at < ?", project, month)
+                merged, without_review = self._aggregate(
+                    "SELECT COUNT(*), COALESCE(SUM(first_review_at IS NULL), 0) FROM prs "
+                    "WHERE project = ? AND merged_at >= ? AND merged_at < ?", project, month)
+                closed, lifetime = self._aggregate(
+                    f"SELECT COUNT(*), AVG({_LIFETIME}) FROM prs "
+                    f"WHERE project = ? AND closed_at >= ? AND closed_at < ?", project, month)
+                ratio = contributors / committers if committers else None
+                self._db.execute("INSERT OR REPLACE INTO monthly VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                    project, month, commits, contributors, committers, ratio, opened, time_to_first_review, merged,
+                    without_review, closed, lifetime))
+                self._update_components(project, month)
+        LOG.info("updated metrics of %d months of %s", len(months), project)
+
+    def _update_components(self, project: str, month: str):
+        bounds = (project, month, next_month(month))
+        components: typing.Dict[str, list] = {}
+        for component, opened, time_to_first_review in self._db.execute(f"""
+                SELECT c.component, COUNT(*), AVG({_TIME_TO_FIRST_REVIEW}) FROM pr_components c
+                JOIN prs p ON p.project = c.project AND p.number = c.number
+                WHERE p.project = ? AND p.created_at >= ? AND p.created_at < ? GROUP BY c.component""", bounds):
+            components[component] = [opened, time_to_first_review, 0, None]
+        for component, closed, lifetime in self._db.execute(f"""
+                SELECT c.component, COUNT(*), AVG({_LIFETIME}) FROM pr_components c
+                JOIN prs p ON p.project = c.project AND p.number = c.number
+                WHERE p.project = ? AND p.closed_at >= ? AND p.closed_at < ? GROUP BY c.component""", bounds):
+            components.setdefault(component, [0, None, 0, None])[2:] = [closed, lifetime]
+        self._db.execute("DELETE FROM monthly_components WHERE project = ? AND month = ?", (project, month))
+        self._db.executemany("INSERT INTO monthly_components VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             ((project, month, component, *values) for component, values in components.items()))
+
+    def monthly(self, project: str, components: bool = False) -> typing.List[dict]:
+        """ the metrics of all months (per component) of the project """
+        table = 'monthly_components' if components else 'monthly'
+        cursor = self._db.execute(f"SELECT * FROM {table} WHERE project = ? ORDER BY month", (project,))
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
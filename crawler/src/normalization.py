@@ -1,16 +1,17 @@
 import typing
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from functools import wraps, partial
 
 import pandas as pd
 
-from . import log_utils
+from . import log_utils, tables
 from .constants import keys
+from .custom_types import RowsExtractorType
+from .identities import IdentityIndex, id_columns
 
 LOG = log_utils.configure_logger()
 
 
-
 def _gated(fun: typing.Callable, exception: Exception):
     @wraps(fun)
     def wrapped_fun(*args, **kwargs):
@@ -60,39 +61,48 @@ def flatten_recursively_inplace(record, names):
 
 
 @gated
-def pr_extract_reviews(record) -> pd.DataFrame:
-    result = pd.DataFrame(record[keys.REVIEWS][keys.NODES])
-    if not result.empty:
-        result = result.rename(columns={'authorLogin': 'reviewerLogin'})
+def pr_review_rows(record) -> typing.List[dict]:
+    """ one row per review, the review's author is renamed to reviewerLogin """
+    rows = []
+    for review in record[keys.REVIEWS][keys.NODES]:
+        row = {('reviewerLogin' if key == 'authorLogin' else key): value for key, value in review.items()}
         if 'authorLogin' in record:
-            result['authorLogin'] = record['authorLogin']
-        result[keys.NUMBER] = record[keys.NUMBER]
-    return result
+            row['authorLogin'] = record['authorLogin']
+        row[keys.NUMBER] = record[keys.NUMBER]
+        rows.append(row)
+    return rows
 
 
 @gated
-def pr_extract_comments(record) -> pd.DataFrame:
-    result = pd.DataFrame(record[keys.COMMENTS][keys.NODES])
-    if not result.empty:
-        result[keys.NUMBER] = record[keys.NUMBER]
-    return result
+def pr_comment_rows(record) -> typing.List[dict]:
+    return [dict(comment, **{keys.NUMBER: record[keys.NUMBER]}) for comment in record[keys.COMMENTS][keys.NODES]]
 
 
 @gated
-def pr_extract_review_threads(record) -> pd.DataFrame:
+def pr_review_thread_rows(record) -> typing.List[dict]:
     rows = flatten(record[keys.REVIEW_THREADS][keys.NODES], lambda x: x[keys.COMMENTS][keys.NODES])
-    result = pd.DataFrame(rows)
-    if not result.empty:
-        result[keys.NUMBER] = record[keys.NUMBER]
-    return result
+    return [dict(row, **{keys.NUMBER: record[keys.NUMBER]}) for row in rows]
 
 
 @gated
+def pr_label_rows(record) -> typing.List[dict]:
+    return [dict(label, **{keys.NUMBER: record[keys.NUMBER]}) for label in record[keys.LABELS][keys.NODES]]
+
+
+def pr_extract_reviews(record) -> pd.DataFrame:
+    return pd.DataFrame(pr_review_rows(record))
+
+
+def pr_extract_comments(record) -> pd.DataFrame:
+    return pd.DataFrame(pr_comment_rows(record))
+
+
+def pr_extract_review_threads(record) -> pd.DataFrame:
+    return pd.DataFrame(pr_review_thread_rows(record))
+
+
 def pr_extract_labels(record) -> pd.DataFrame:
-    result = pd.DataFrame(record[keys.LABELS][keys.NODES])
-    if not result.empty:
-        result[keys.NUMBER] = record[keys.NUMBER]
-    return result
+    return pd.DataFrame(pr_label_rows(record))
 
 
 def delete_if_exists(record, key):
@@ -134,10 +144,109 @@ def extract_labels(record: dict):
 
 
 @gated
-def extract_pr_flat(record) -> pd.DataFrame:
-    """ creates a flat representation of a PR """
+def pr_flat_row(record) -> dict:
+    """ creates a flat representation of a PR (in place) """
     first_if_exists_and_delete(record, keys.COMMENTS, keys.FIRST_COMMENT_PREFIX)
     first_if_exists_and_delete(record, keys.REVIEWS, keys.FIRST_REVIEW_PREFIX)
     nested_first_if_exists_and_delete(record, keys.REVIEW_THREADS, keys.COMMENTS, keys.FIRST_REVIEW_THREAD_PREFIX)
     extract_labels(record)
-    return pd.Series(record).to_frame().T
+    return record
+
+
+def extract_pr_flat(record) -> pd.DataFrame:
+    """ creates a flat representation of a PR """
+    return pd.Series(pr_flat_row(record)).to_frame().T
+
+
+def commit_rows(record: dict) -> typing.List[dict]:
+    record[keys.AUTHOR] = record[keys.AUTHOR][keys.USER]
+    record[keys.COMMITTER] = record[keys.COMMITTER][keys.USER]
+    flatten_recursively_inplace(record, [keys.AUTHOR])
+    flatten_recursively_inplace(record, [keys.COMMITTER])
+    return [record]
+
+
+def _pr(record: dict) -> dict:
+    pr = record[keys.NODE]
+    flatten_recursively_inplace(pr, [keys.AUTHOR])
+    return pr
+
+
+def _all_review_rows(record: dict) -> typing.List[dict]:
+    pr = _pr(record)
+    return pr_review_rows(pr) + pr_review_thread_rows(pr)
+
+
+# extractors by output table (the name is used as prefix of the output file), each takes a downloaded record
+EXTRACTORS: typing.Dict[str, RowsExtractorType] = {
+    'commits': commit_rows,
+    'comments': lambda record: pr_comment_rows(_pr(record)),
+    'reviews': lambda record: pr_review_rows(_pr(record)),
+    'threads': lambda record: pr_review_thread_rows(_pr(record)),
+    'all-reviews': _all_review_rows,
+    'labels': lambda record: pr_label_rows(_pr(record)),
+    'pr-flat': lambda record: [pr_flat_row(_pr(record))],
+}
+
+# extractors of the tables of a PR (with flattened author) in the order in which they can share the PR,
+# pr-flat changes the PR and has to come last
+PR_EXTRACTORS: typing.Dict[str, RowsExtractorType] = OrderedDict([
+    ('comments', pr_comment_rows),
+    ('reviews', pr_review_rows),
+    ('threads', pr_review_thread_rows),
+    ('labels', pr_label_rows),
+    ('pr-flat', lambda pr: [pr_flat_row(pr)]),
+])
+
+
+def extract_tables(record: dict, names: typing.List[str]) -> typing.Dict[str, typing.List[dict]]:
+    """ extracts the rows of several tables from one record, several tables have to be PR tables """
+    if len(names) == 1:
+        return {names[0]: EXTRACTORS[names[0]](record)}
+    pr = _pr(record)
+    return {table: extractor(pr) for table, extractor in PR_EXTRACTORS.items() if table in names}
+
+
+class RecordNormalizer:
+    """
+    Writes the rows of several tables (table -> output path) incrementally, record by record. With an identity index,
+    every <role>Login column gets a <role>Id column with the interned id of the person (made canonical on closing).
+    """
+    def __init__(self, outputs: typing.Dict[str, str], chunk_size: int = 10000, format: str = tables.JSON,
+                 identities: typing.Optional[IdentityIndex] = None):
+        self._names = list(outputs)
+        self._writers = {table: tables.create_writer(path, format, chunk_size) for table, path in outputs.items()}
+        self._identities = identities
+        self._merges = identities.merges if identities is not None else 0
+
+    def add(self, record: dict):
+        """ note that the extractors change the record """
+        for table, rows in extract_tables(record, self._names).items():
+            if self._identities is not None:
+                for row in rows:
+                    self._identities.annotate(row)
+            self._writers[table].add_rows(rows)
+
+    def close(self) -> typing.Dict[str, int]:
+        """ returns the number of rows per table """
+        rows = {table: writer.close() for table, writer in self._writers.items()}
+        if self._identities is not None and self._identities.merges > self._merges:
+            # identities merged after their ids were written, the ids of the tables have to be canonical
+            LOG.info("identities were merged, rewriting the ids of %s", ', '.join(self._writers))
+            for writer in self._writers.values():
+                if writer.rows:
+                    writer.map_values(writer.path, id_columns, self._identities.canonical)
+        return rows
+
+
+def normalize_records(records: typing.Iterable[dict], outputs: typing.Dict[str, str], chunk_size: int = 10000,
+                      format: str = tables.JSON,
+                      identities: typing.Optional[IdentityIndex] = None) -> typing.Dict[str, int]:
+    """ writes the rows of each table to its output path (table -> path) and returns the rows per table """
+    normalizer = RecordNormalizer(outputs, chunk_size, format, identities)
+    try:
+        for record in records:
+            normalizer.add(record)
+    finally:
+        rows = normalizer.close()
+    return rows
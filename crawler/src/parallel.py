@@ -0,0 +1,65 @@
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+from . import files, log_utils, normalization, tables
+
+LOG = log_utils.configure_logger()
+
+# number of byte ranges per worker (smaller ranges balance the load better)
+RANGES_PER_WORKER = 4
+
+
+def byte_ranges(path: str, n: int) -> typing.List[typing.Tuple[int, int]]:
+    """ splits the file into n byte ranges of roughly the same size """
+    size = os.path.getsize(path)
+    n = max(1, min(n, size))
+    bounds = [size * i // n for i in range(n + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_range(path: str, start: int, end: int) -> typing.Iterator[dict]:
+    """ reads the records of all lines that start within [start, end) """
+    with open(path, 'rb') as f:
+        if start > 0:
+            # skip the line that started in the previous range
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield files.loads(line)
+
+
+def _normalize_range(input: str, start: int, end: int, outputs: typing.Dict[str, str], chunk_size: int,
+                     format: str) -> typing.Dict[str, int]:
+    return normalization.normalize_records(read_range(input, start, end), outputs, chunk_size, format)
+
+
+def normalize_parallel(input: str, outputs: typing.Dict[str, str], workers: int, chunk_size: int,
+                       format: str = tables.JSON) -> typing.Dict[str, int]:
+    """
+    Normalizes byte ranges of the input in `workers` processes and concatenates the partial outputs (table -> path)
+    in order. Returns the number of written rows per table.
+    """
+    ranges = byte_ranges(input, workers * RANGES_PER_WORKER)
+    parts = [{table: f"{output}.part{i}" for table, output in outputs.items()} for i in range(len(ranges))]
+    LOG.info("normalizing %d ranges of %s with %d workers", len(ranges), input, workers)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_normalize_range, input, start, end, part, chunk_size, format)
+                       for (start, end), part in zip(ranges, parts)]
+            rows = {table: 0 for table in outputs}
+            for future in futures:
+                for table, n in future.result().items():
+                    rows[table] += n
+        for table, output in outputs.items():
+            if rows[table]:
+                tables.FORMATS[format].concatenate([part[table] for part in parts], output)
+    finally:
+        for part in parts:
+            for path in part.values():
+                if os.path.exists(path):
+                    os.remove(path)
+    return rows
@@ -0,0 +1,140 @@
+import math
+import threading
+import time
+import typing
+from contextlib import contextmanager
+from datetime import datetime
+
+from . import log_utils
+
+LOG = log_utils.configure_logger()
+
+
+def parse_timestamp(timestamp: str) -> float:
+    """ converts github's ISO 8601 timestamps (e.g., '2022-06-02T14:00:00Z') into seconds since epoch """
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+
+
+class RateLimitBudget:
+    """ rate limit budget that can be shared by several clients running in different threads """
+    HEADER_REMAINING = 'x-ratelimit-remaining'
+    HEADER_RESET = 'x-ratelimit-reset'
+
+    def __init__(self, max_in_flight: int = 4, reserve: int = 10, pace_below: int = 1000):
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._reserve = reserve
+        # below this number of remaining points, the requests are spread over the time until the reset
+        self._pace_below = pace_below
+        self._remaining: typing.Optional[int] = None
+        self._reset_at: typing.Optional[float] = None
+        self._last_cost = 0
+        # monotonic time at which the next request may be sent
+        self._next_request_at = 0.
+
+    @property
+    def remaining(self) -> typing.Optional[int]:
+        return self._remaining
+
+    def seconds_until_reset(self) -> float:
+        with self._lock:
+            if self._reset_at is None:
+                return 0
+            return max(0., self._reset_at - time.time())
+
+    def _exhausted(self) -> bool:
+        with self._lock:
+            # the next request is likely to cost as much as the last one
+            return self._remaining is not None and self._remaining <= max(self._reserve, self._last_cost)
+
+    def pace(self) -> float:
+        """ the seconds between two requests so that the remaining points last until the reset, 0 if not paced """
+        with self._lock:
+            if self._remaining is None or self._reset_at is None or self._remaining > self._pace_below:
+                return 0.
+            available = self._remaining - self._reserve
+            if available <= 0:
+                return 0.
+            # every request costs at least one point
+            return max(1, self._last_cost) * max(0., self._reset_at - time.time()) / available
+
+    def wait(self):
+        """ blocks until the budget allows another request """
+        if self._exhausted():
+            seconds = self.seconds_until_reset()
+            if seconds > 0:
+                LOG.warning("rate limit budget exhausted, waiting %.0f seconds", seconds)
+                time.sleep(seconds)
+            with self._lock:
+                self._remaining = None
+        pace = self.pace()
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_request_at)
+            self._next_request_at = send_at + pace
+        if send_at > now:
+            LOG.debug("pacing requests, waiting %.1f seconds", send_at - now)
+            time.sleep(send_at - now)
+
+    @contextmanager
+    def slot(self):
+        self.wait()
+        with self._slots:
+            yield
+
+    def update(self, remaining: int, reset_at: float, cost: typing.Optional[int] = None):
+        with self._lock:
+            # responses of concurrent requests may arrive out of order
+            if self._reset_at is not None and reset_at == self._reset_at and self._remaining is not None:
+                remaining = min(remaining, self._remaining)
+            self._remaining = remaining
+            self._reset_at = reset_at
+            if cost is not None:
+                self._last_cost = cost
+        LOG.debug("rate limit: %d remaining, reset at %s", remaining, reset_at)
+
+    def update_from_headers(self, headers: typing.Optional[typing.Mapping[str, str]]):
+        if not headers or self.HEADER_REMAINING not in headers or self.HEADER_RESET not in headers:
+            return
+        self.update(int(headers[self.HEADER_REMAINING]), float(headers[self.HEADER_RESET]))
+
+    def update_from_response(self, rate_limit: typing.Optional[dict]):
+        """ registers the 'rateLimit { cost remaining resetAt }' field of a response """
+        if not rate_limit:
+            return
+        self.update(rate_limit['remaining'], parse_timestamp(rate_limit['resetAt']), rate_limit.get('cost'))
+
+
+class AdaptiveStepSize:
+    """
+    Adapts the number of records per page: shrinks it after failed (e.g., timed out) requests or slow responses and
+    grows it again while responses are fast. The cost of a page does not change the step size, github charges at
+    least one point per request, so smaller pages would cost more points per record (the budget paces the requests
+    instead).
+    """
+    def __init__(self, step_size: int = 100, min_step_size: int = 5, max_step_size: int = 100,
+                 target_latency: float = 5.):
+        self._max_step_size = max_step_size
+        self._min_step_size = min(min_step_size, max_step_size)
+        self._step_size = max(self._min_step_size, min(step_size, max_step_size))
+        self._target_latency = target_latency
+
+    @property
+    def value(self) -> int:
+        return self._step_size
+
+    def _set(self, step_size: int):
+        step_size = max(self._min_step_size, min(step_size, self._max_step_size))
+        if step_size != self._step_size:
+            LOG.info("changing step size from %d to %d", self._step_size, step_size)
+        self._step_size = step_size
+
+    def succeeded(self, latency: float, cost: typing.Optional[int] = None):
+        LOG.debug("page of %d records took %.2f seconds and cost %s points", self._step_size, latency, cost)
+        if latency > self._target_latency:
+            self._set(int(self._step_size * self._target_latency / latency))
+        elif latency < self._target_latency / 2:
+            self._set(math.ceil(self._step_size * 1.5))
+
+    def failed(self):
+        self._set(self._step_size // 2)
@@ -0,0 +1,151 @@
+import typing
+
+from . import log_utils
+
+LOG = log_utils.configure_logger()
+
+ASCENDING = 'asc'
+DESCENDING = 'desc'
+
+PathType = typing.Tuple[str, ...]
+
+
+def _path(path: str) -> PathType:
+    """ 'node/createdAt' -> ('node', 'createdAt') (the notation of data_access.AccessPath) """
+    return tuple(path.split('/'))
+
+
+def _get(record: dict, path: PathType):
+    for segment in path:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(segment)
+    return record
+
+
+def get_value(record: dict, path: str):
+    """ the value of the field at the '/'-separated path or None """
+    return _get(record, _path(path))
+
+
+def _lists(record, path: PathType) -> typing.Iterator[list]:
+    """ the lists at the path, '*' stands for every element of a list (e.g., 'reviewThreads/nodes/*/comments/nodes') """
+    if not path:
+        if isinstance(record, list):
+            yield record
+        return
+    segment, rest = path[0], path[1:]
+    if segment == '*':
+        for item in record if isinstance(record, list) else []:
+            yield from _lists(item, rest)
+    elif isinstance(record, dict):
+        yield from _lists(record.get(segment), rest)
+
+
+class RecordFilter:
+    """
+    Projection and filtering of the records of a page before they are passed on (see
+    DataCollectorBuilder.add_record_filter). Paths are '/'-separated, e.g., 'node/reviews/nodes'. A date range on a
+    field by which the records are ordered ends the pagination once a record passes the bound of the range.
+    """
+    def __init__(self):
+        self._excluded: typing.List[PathType] = []
+        self._truncated: typing.List[typing.Tuple[PathType, int]] = []
+        self._predicates: typing.List[typing.Callable[[dict], bool]] = []
+        self._item_predicates: typing.List[typing.Tuple[PathType, typing.Callable[[dict], bool]]] = []
+        self._date: typing.Optional[PathType] = None
+        self._since: typing.Optional[str] = None
+        self._until: typing.Optional[str] = None
+        self._order: typing.Optional[str] = None
+
+    def exclude(self, *paths: str) -> 'RecordFilter':
+        """ removes these fields """
+        self._excluded += [_path(path) for path in paths]
+        return self
+
+    def truncate(self, path: str, length: int) -> 'RecordFilter':
+        """ shortens the string field (e.g., a commit message) to `length` characters """
+        self._truncated.append((_path(path), length))
+        return self
+
+    def where(self, predicate: typing.Callable[[dict], bool]) -> 'RecordFilter':
+        """ keeps only the records for which the predicate holds """
+        self._predicates.append(predicate)
+        return self
+
+    def where_items(self, path: str, predicate: typing.Callable[[dict], bool]) -> 'RecordFilter':
+        """
+        keeps only the elements of the nested list (e.g., reviews of a PR) for which the predicate holds, '*' in the
+        path stands for every element of a list
+        """
+        self._item_predicates.append((_path(path), predicate))
+        return self
+
+    def date_range(self, path: str, since: typing.Optional[str] = None, until: typing.Optional[str] = None,
+                   order: typing.Optional[str] = None) -> 'RecordFilter':
+        """
+        keeps the records with since <= date < until (ISO 8601 timestamps or prefixes, e.g., '2022-06'), records
+        without a date are kept. With the order (ASCENDING or DESCENDING) of the records by the date, the
+        pagination stops after the page on which a record passes until (ascending) or since (descending).
+        """
+        self._date = _path(path)
+        self._since = since
+        self._until = until
+        self._order = order
+        return self
+
+    def _passed(self, date: str) -> bool:
+        """ true if no later record can be within the date range """
+        if self._order == ASCENDING:
+            return self._until is not None and date >= self._until
+        if self._order == DESCENDING:
+            return self._since is not None and date < self._since
+        return False
+
+    def _in_range(self, date: typing.Optional[str]) -> bool:
+        return date is None or ((self._since is None or date >= self._since) and
+                                (self._until is None or date < self._until))
+
+    def _project(self, record: dict) -> dict:
+        for path, predicate in self._item_predicates:
+            for items in _lists(record, path):
+                items[:] = [item for item in items if predicate(item)]
+        for path, length in self._truncated:
+            parent = _get(record, path[:-1]) if len(path) > 1 else record
+            if isinstance(parent, dict) and isinstance(parent.get(path[-1]), str):
+                parent[path[-1]] = parent[path[-1]][:length]
+        for path in self._excluded:
+            parent = _get(record, path[:-1]) if len(path) > 1 else record
+            if isinstance(parent, dict):
+                parent.pop(path[-1], None)
+        return record
+
+    def apply(self, records: typing.List[dict]) -> typing.Tuple[typing.List[dict], bool]:
+        """ returns the filtered and projected records of a page and whether the pagination should stop """
+        result = []
+        stop = False
+        for record in records:
+            if self._date is not None:
+                date = _get(record, self._date)
+                if date is not None and self._passed(date):
+                    stop = True
+                if not self._in_range(date):
+                    continue
+            if all(predicate(record) for predicate in self._predicates):
+                result.append(self._project(record))
+        if stop:
+            LOG.info("records passed the date range, stopping the pagination")
+        return result, stop
+
+
+def updated_window(path: str, since: typing.Optional[str], until: typing.Optional[str],
+                   backward: bool = False) -> typing.Tuple[dict, RecordFilter]:
+    """
+    query variables and filter for PRs updated in [since, until): with a lower bound the PRs are listed from the most
+    recently updated (stopping at since), otherwise from the least recently updated (stopping at until). `backward`
+    connections (last/before) are paginated in reverse order.
+    """
+    newest_first = since is not None
+    direction = 'DESC' if newest_first != backward else 'ASC'
+    return ({'orderBy': {'field': 'UPDATED_AT', 'direction': direction}},
+            RecordFilter().date_range(path, since, until, order=DESCENDING if newest_first else ASCENDING))
@@ -0,0 +1,76 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import typing
+
+from graphql import (GraphQLSchema, build_schema, build_client_schema, get_introspection_query,
+                     introspection_from_schema, print_schema)
+
+from . import log_utils
+from .constants import Files
+
+LOG = log_utils.configure_logger()
+
+_lock = threading.Lock()
+_schemas: typing.Dict[str, GraphQLSchema] = {}
+
+
+def _cache_path(path: str, content: bytes) -> str:
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{digest}.json")
+
+
+def _build(path: str) -> GraphQLSchema:
+    """ parses the schema or, much faster, rebuilds it from its introspection result cached next to it """
+    with open(path, 'rb') as f:
+        content = f.read()
+    cache_path = _cache_path(path, content)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r') as f:
+                return build_client_schema(json.load(f))
+        except Exception as ex:
+            LOG.warning("cannot load cached schema %s: %s", cache_path, ex)
+    LOG.info("parsing schema %s", path)
+    schema = build_schema(content.decode('utf-8'))
+    # written via a temporary file, so that other processes never read a partially written cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(introspection_from_schema(schema), f)
+        os.replace(tmp_path, cache_path)
+    except Exception as ex:
+        LOG.warning("cannot cache schema in %s: %s", cache_path, ex)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return schema
+
+
+def load(path: str = Files.SCHEMA_FILE) -> GraphQLSchema:
+    """ loads the local github schema (parsed once per file version and process) """
+    path = os.path.abspath(path)
+    with _lock:
+        if path not in _schemas:
+            _schemas[path] = _build(path)
+        return _schemas[path]
+
+
+def refresh(session, path: str = Files.SCHEMA_FILE):
+    """ downloads the current schema via introspection and replaces the local schema """
+    from gql import gql
+
+    LOG.info("downloading schema")
+    result = session.execute(gql(get_introspection_query(descriptions=True)))
+    content = print_schema(build_client_schema(result))
+    with open(path, 'w') as f:
+        f.write(content)
+        f.write('\n')
+    directory, name = os.path.split(os.path.abspath(path))
+    for cache_path in glob.glob(os.path.join(directory, f".{name}.*.json")):
+        os.remove(cache_path)
+    with _lock:
+        _schemas.pop(os.path.abspath(path), None)
+    LOG.info("stored schema in %s", path)
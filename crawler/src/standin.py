@@ -0,0 +1,396 @@
+import datetime
+import hashlib
+import json
+import multiprocessing
+import queue
+import random
+import threading
+import time
+import typing
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from graphql import (GraphQLEnumType, GraphQLList, GraphQLObjectType, GraphQLScalarType, execute, get_named_type,
+                     get_nullable_type, is_abstract_type, parse, validate)
+
+from . import log_utils, schema
+
+LOG = log_utils.configure_logger()
+
+# all synthetic timestamps are relative to this time
+EPOCH = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+# concrete types for abstract types (e.g., the author of a PR is an Actor)
+CONCRETE_TYPES = {'Actor': 'User', 'GitObject': 'Commit', 'RepositoryOwner': 'Organization', 'Assignee': 'User',
+                  'RequestedReviewer': 'User', 'Closer': 'PullRequest', 'Starrable': 'Repository'}
+
+
+class Sizes:
+    """ size of the synthetic repository: commits and PRs, the nested connections are (on average) of these sizes """
+    def __init__(self, commits: int = 2000, prs: int = 500, reviews: int = 3, review_threads: int = 2,
+                 comments: int = 3, labels: int = 2, users: int = 200, message_length: int = 200):
+        self.commits = commits
+        self.prs = prs
+        self.reviews = reviews
+        self.review_threads = review_threads
+        self.comments = comments
+        self.labels = labels
+        self.users = users
+        self.message_length = message_length
+
+
+class _Object:
+    """ a synthetic object, `key` identifies it and determines its values, `time` is its creation time (hours) """
+    def __init__(self, type_name: str, key: tuple, time: float = 0., index: int = 0):
+        self.type_name = type_name
+        self.key = key
+        self.time = time
+        self.index = index
+
+    @property
+    def seed(self) -> int:
+        return int.from_bytes(hashlib.blake2b(repr(self.key).encode(), digest_size=8).digest(), 'little')
+
+    @property
+    def id(self) -> str:
+        return json.dumps([self.type_name, self.key, self.time, self.index])
+
+    @classmethod
+    def from_id(cls, id: str) -> '_Object':
+        type_name, key, time, index = json.loads(id)
+        return cls(type_name, tuple(tuple(k) if isinstance(k, list) else k for k in key), time, index)
+
+
+class _Page:
+    """ a page of a connection: the objects of the positions [start, end) of `total` objects """
+    def __init__(self, objects: typing.List[_Object], start: int, end: int, total: int):
+        self.objects = objects
+        self.start = start
+        self.end = end
+        self.total = total
+
+
+def _timestamp(hours: float) -> str:
+    return (EPOCH + datetime.timedelta(hours=hours)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _hours(timestamp: str) -> float:
+    value = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return (value - EPOCH).total_seconds() / 3600
+
+
+def _window(total: int, args: dict) -> typing.Tuple[int, int]:
+    """ the positions of the page for first/after and last/before (cursors are positions) """
+    start = int(args['after']) if args.get('after') else 0
+    end = int(args['before']) if args.get('before') else total
+    if args.get('first') is not None:
+        end = min(end, start + args['first'])
+    if args.get('last') is not None:
+        start = max(start, end - args['last'])
+    return max(0, start), min(total, end)
+
+
+class Repository:
+    """
+    Resolves any query of the github schema against a synthetic repository. Commits are ordered from the most
+    recent one (one every 3 hours), PRs are created every 12 hours and are updated in a different order.
+    """
+    COMMIT_INTERVAL = 3.
+    PR_INTERVAL = 12.
+
+    def __init__(self, sizes: Sizes):
+        self.sizes = sizes
+        rng = random.Random(0)
+        self._updated = [self._pr_time(i) + rng.uniform(0, 24 * 90) for i in range(sizes.prs)]
+        self._order_by_update = sorted(range(sizes.prs), key=lambda i: self._updated[i])
+
+    def _pr_time(self, i: int) -> float:
+        return i * self.PR_INTERVAL
+
+    def _size(self, parent: _Object, mean: int) -> int:
+        """ between 0 and 2 * mean, depending on the parent """
+        return parent.seed % (2 * mean + 1)
+
+    def _commit(self, i: int) -> _Object:
+        return _Object('Commit', ('commit', i), (self.sizes.commits - i) * self.COMMIT_INTERVAL, i)
+
+    def _pr(self, i: int) -> _Object:
+        return _Object('PullRequest', ('pr', i), self._pr_time(i), i)
+
+    def _history(self, args: dict) -> typing.Tuple[int, typing.Callable[[int], _Object]]:
+        first, end = 0, self.sizes.commits
+        if args.get('until'):
+            first = max(first, int(self.sizes.commits - _hours(args['until']) / self.COMMIT_INTERVAL) + 1)
+        if args.get('since'):
+            end = min(end, int(self.sizes.commits - _hours(args['since']) / self.COMMIT_INTERVAL) + 1)
+        # the commits of an author are every n-th commit
+        stride = self.sizes.users if args.get('author') else 1
+        return max(0, (end - first + stride - 1) // stride), lambda i: self._commit(first + i * stride)
+
+    def _pull_requests(self, args: dict) -> typing.Tuple[int, typing.Callable[[int], _Object]]:
+        order = args.get('orderBy') or {}
+        indices = self._order_by_update if order.get('field') == 'UPDATED_AT' else range(self.sizes.prs)
+        if order.get('direction') == 'DESC':
+            indices = indices[::-1]
+        return self.sizes.prs, lambda i: self._pr(indices[i])
+
+    def _nested(self, parent: _Object, type_name: str, field: str, mean: int):
+        def create(i: int) -> _Object:
+            return _Object(type_name, parent.key + (field, i), parent.time + (i + 1) * 2., i)
+        return self._size(parent, mean), create
+
+    def connection(self, parent: typing.Optional[_Object], field: str, node_type: str,
+                   args: dict) -> typing.Tuple[int, typing.Callable[[int], _Object]]:
+        """ the number of objects of the connection and a function that creates the i-th object """
+        if field == 'history':
+            return self._history(args)
+        if field == 'pullRequests':
+            return self._pull_requests(args)
+        mean = {'reviews': self.sizes.reviews, 'reviewThreads': self.sizes.review_threads,
+                'comments': self.sizes.comments, 'labels': self.sizes.labels}.get(field, 2)
+        return self._nested(parent, node_type, field, mean)
+
+    def _user_index(self, obj: _Object) -> int:
+        return obj.seed % self.sizes.users
+
+    def scalar(self, obj: _Object, field: str, type_name: str):
+        seed = obj.seed ^ int.from_bytes(field.encode()[:8].ljust(8, b'\0'), 'little')
+        if obj.type_name == 'User' or field in ('login', 'databaseId'):
+            user = obj.key[-1] if obj.key and obj.key[0] == 'user' else self._user_index(obj)
+            if isinstance(user, str):
+                user = int(user[4:]) if user[4:].isdigit() else 0
+            values = {'login': f'user{user}', 'name': f'User {user}', 'email': f'user{user}@example.com',
+                      'databaseId': user + 1, 'id': _Object('User', ('user', user)).id}
+            if field in values:
+                return values[field]
+        if field == 'id':
+            return obj.id
+        if field == 'number':
+            return obj.index + 1
+        if field == 'updatedAt' and obj.type_name == 'PullRequest':
+            return _timestamp(self._updated[obj.index])
+        if field == 'message' or field == 'body':
+            return ('lorem ipsum ' * (self.sizes.message_length // 12 + 1))[:self.sizes.message_length]
+        if field in ('mergedAt', 'closedAt'):
+            return _timestamp(obj.time + 24 + seed % 500) if obj.index % 5 else None
+        if type_name in ('DateTime', 'GitTimestamp', 'PreciseDateTime'):
+            return _timestamp(obj.time + (1 if field in ('publishedAt', 'updatedAt') else 0))
+        if type_name == 'Int':
+            return seed % 100
+        if type_name == 'Float':
+            return (seed % 1000) / 10
+        if type_name == 'Boolean':
+            return False
+        if type_name == 'GitObjectID':
+            return hashlib.sha1(repr(obj.key).encode()).hexdigest()
+        if type_name == 'URI':
+            return f'https://example.com/{"/".join(map(str, obj.key))}'
+        if field == 'name' and obj.type_name == 'Label':
+            return f'component=C{seed % 10}'
+        return f'{field}-{seed % 100000}'
+
+    def resolve(self, parent, info, **args):
+        field = info.field_name
+        return_type = get_nullable_type(info.return_type)
+        named_type = get_named_type(return_type)
+        if isinstance(parent, dict):
+            return parent.get(field)
+        if isinstance(parent, _Page):
+            return self._resolve_page(parent, field)
+        if parent is None:
+            return self._resolve_root(field, named_type, args)
+        if field == 'pullRequest' and parent.type_name == 'Repository':
+            return self._pr(args['number'] - 1) if 0 < args['number'] <= self.sizes.prs else None
+        if named_type.name.endswith('Connection') and isinstance(named_type, GraphQLObjectType):
+            node_type = get_named_type(named_type.fields['nodes'].type) if 'nodes' in named_type.fields else None
+            total, create = self.connection(parent, field, self._concrete(node_type), args)
+            start, end = _window(total, args)
+            return _Page([create(i) for i in range(start, end)], start, end, total)
+        if isinstance(return_type, GraphQLList):
+            return [self._child(parent, field, named_type, i) for i in range(2)] \
+                if not isinstance(named_type, (GraphQLScalarType, GraphQLEnumType)) else []
+        if isinstance(named_type, GraphQLEnumType):
+            return 'MERGED' if 'MERGED' in named_type.values else next(iter(named_type.values))
+        if isinstance(named_type, GraphQLScalarType):
+            return self.scalar(parent, field, named_type.name)
+        return self._child(parent, field, named_type, 0)
+
+    def _concrete(self, named_type) -> str:
+        if named_type is None:
+            return 'Node'
+        if is_abstract_type(named_type):
+            return CONCRETE_TYPES.get(named_type.name, named_type.name)
+        return named_type.name
+
+    def _child(self, parent: _Object, field: str, named_type, i: int) -> _Object:
+        type_name = self._concrete(named_type)
+        if type_name == 'User':
+            return _Object('User', ('user', self._user_index(_Object('', parent.key + (field,)))))
+        if field == 'target' and parent.type_name == 'Ref':
+            return _Object('Commit', ('head',), self.sizes.commits * self.COMMIT_INTERVAL)
+        return _Object(type_name, parent.key + (field, i), parent.time, parent.index)
+
+    def _resolve_root(self, field: str, named_type, args: dict):
+        if field == 'rateLimit':
+            reset = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+            return {'cost': 1, 'remaining': 4999, 'limit': 5000, 'used': 1,
+                    'resetAt': reset.strftime('%Y-%m-%dT%H:%M:%SZ')}
+        if field == 'repository':
+            return _Object('Repository', ('repository',))
+        if field == 'user':
+            return _Object('User', ('user', args.get('login', 'user0')))
+        if field == 'node':
+            return _Object.from_id(args['id'])
+        return _Object(self._concrete(named_type), (field,))
+
+    def _resolve_page(self, page: _Page, field: str):
+        if field == 'nodes':
+            return page.objects
+        if field == 'edges':
+            return [{'node': obj, 'cursor': str(page.start + i + 1)} for i, obj in enumerate(page.objects)]
+        if field == 'pageInfo':
+            return {'hasNextPage': page.end < page.total, 'hasPreviousPage': page.start > 0,
+                    'startCursor': str(page.start), 'endCursor': str(page.end)}
+        if field == 'totalCount':
+            return page.total
+        return None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ POST /graphql executes the query, GET /stats returns and clears the request log """
+    server: 'StandInHTTPServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict, headers: typing.Optional[dict] = None):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.server.take_stats())
+        else:
+            self._reply(404, {})
+
+    def do_POST(self):
+        start = time.monotonic()
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        if server.latency:
+            time.sleep(server.rng_latency())
+        if server.error_rate and server.rng_error():
+            server.record(start, time.monotonic(), error=True)
+            self._reply(403, {'message': 'You have exceeded a secondary rate limit.'},
+                        {'Retry-After': f'{server.retry_after:g}'})
+            return
+        result = server.execute(request['query'], request.get('variables') or {})
+        server.record(start, time.monotonic())
+        self._reply(200, result)
+
+
+class StandInHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, repository: Repository, latency: float = 0., error_rate: float = 0.,
+                 retry_after: float = 0.):
+        super().__init__(address, StandInHandler)
+        self.repository = repository
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._schema = schema.load()
+        self._documents = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+        self._requests: typing.List[typing.Tuple[float, float, bool]] = []
+
+    def rng_latency(self) -> float:
+        with self._lock:
+            return self._rng.expovariate(1 / self.latency)
+
+    def rng_error(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def record(self, start: float, end: float, error: bool = False):
+        with self._lock:
+            self._requests.append((start, end, error))
+
+    def take_stats(self) -> dict:
+        with self._lock:
+            requests, self._requests = self._requests, []
+        return {'requests': [list(request) for request in requests]}
+
+    def execute(self, query: str, variables: dict) -> dict:
+        document = self._documents.get(query)
+        if document is None:
+            document = parse(query)
+            errors = validate(self._schema, document)
+            if errors:
+                return {'errors': [{'message': error.message} for error in errors]}
+            self._documents[query] = document
+        result = execute(self._schema, document, variable_values=variables, field_resolver=self.repository.resolve,
+                         type_resolver=lambda value, info, abstract_type: value.type_name)
+        response = {'data': result.data}
+        if result.errors:
+            response['errors'] = [{'message': error.message, 'path': error.path} for error in result.errors]
+        return response
+
+
+def serve(port: int, sizes: Sizes, latency: float = 0., error_rate: float = 0., retry_after: float = 0.,
+          ready: typing.Optional[typing.Any] = None):
+    """ runs the stand-in server on localhost:port until the process is terminated """
+    server = StandInHTTPServer(('127.0.0.1', port), Repository(sizes), latency, error_rate, retry_after)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+class StandInServer:
+    """ runs the stand-in server in its own process, so that it does not compete with the crawler for the GIL """
+    def __init__(self, sizes: Sizes, latency: float = 0., error_rate: float = 0., retry_after: float = 0.):
+        self._args = (sizes, latency, error_rate, retry_after)
+        self._process: typing.Optional[multiprocessing.Process] = None
+        self.port: typing.Optional[int] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}/graphql'
+
+    def start(self):
+        ready = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=serve, args=(0, *self._args, ready), daemon=True)
+        self._process.start()
+        while self.port is None:
+            try:
+                self.port = ready.get(timeout=1)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    raise RuntimeError(f"stand-in server exited with code {self._process.exitcode}")
+        LOG.info("stand-in server listening on %s", self.url)
+
+    def stats(self) -> dict:
+        """ the (start, end, error) times of all requests since the last call """
+        with urllib.request.urlopen(f'http://127.0.0.1:{self.port}/stats') as response:
+            return json.loads(response.read())
+
+    def stop(self):
+        if self._process:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self) -> 'StandInServer':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import typing
+from collections import OrderedDict
+
+from . import log_utils
+from .constants import Files
+
+LOG = log_utils.configure_logger()
+
+
+class TableSpec:
+    """ how the rows of a normalized table are stored: key and indexed columns (column -> field of the row) """
+    def __init__(self, name: str, columns: typing.Dict[str, str], key: typing.List[str],
+                 indexes: typing.List[typing.List[str]], integers: typing.Optional[typing.List[str]] = None):
+        self.name = name
+        self.columns = columns
+        self.key = key
+        self.indexes = indexes
+        self.integers = integers if integers else []
+
+    def create_statements(self) -> typing.List[str]:
+        columns = ['project TEXT NOT NULL'] + \
+                  [f"{column} {'INTEGER' if column in self.integers else 'TEXT'}" +
+                   (' NOT NULL' if column in self.key else '') for column in self.columns] + \
+                  ['data TEXT', f"PRIMARY KEY ({', '.join(['project'] + self.key)})"]
+        statements = [f"CREATE TABLE IF NOT EXISTS {self.name} ({', '.join(columns)})"]
+        for index in self.indexes:
+            statements.append(f"CREATE INDEX IF NOT EXISTS {self.name}_{'_'.join(index)} "
+                              f"ON {self.name} ({', '.join(index)})")
+        return statements
+
+    def upsert_statement(self) -> str:
+        columns = ['project'] + list(self.columns) + ['data']
+        updates = [f"{column} = excluded.{column}" for column in columns if column != 'project' and
+                   column not in self.key]
+        return f"INSERT INTO {self.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) " \
+               f"ON CONFLICT ({', '.join(['project'] + self.key)}) DO UPDATE SET {', '.join(updates)}"
+
+    def values(self, project: str, row: dict) -> tuple:
+        values = [project]
+        for column, field in self.columns.items():
+            value = row.get(field)
+            # NULLs are distinct in primary keys, so missing key values would never be deduplicated
+            values.append('' if value is None and column in self.key else value)
+        values.append(json.dumps(row))
+        return tuple(values)
+
+
+# storage of the normalized tables (by the name of the table in normalization.EXTRACTORS)
+TABLES: typing.Dict[str, TableSpec] = OrderedDict([
+    ('commits', TableSpec('commits', OrderedDict([
+        ('oid', 'oid'), ('committed_at', 'committedDate'), ('authored_at', 'authoredDate'),
+        ('author_login', 'authorLogin'), ('author_name', 'authorName'), ('author_email', 'authorEmail'),
+        ('committer_login', 'committerLogin'), ('additions', 'additions'), ('deletions', 'deletions'),
+        ('changed_files', 'changedFiles')]),
+        key=['oid'],
+        indexes=[['project', 'committed_at'], ['author_login', 'committed_at'], ['committer_login', 'committed_at']],
+        integers=['additions', 'deletions', 'changed_files'])),
+    ('pr-flat', TableSpec('prs', OrderedDict([
+        ('number', 'number'), ('title', 'title'), ('state', 'state'), ('author_login', 'authorLogin'),
+        ('created_at', 'createdAt'), ('updated_at', 'updatedAt'), ('closed_at', 'closedAt'),
+        ('merged_at', 'mergedAt')]),
+        key=['number'],
+        indexes=[['project', 'created_at'], ['author_login', 'created_at']],
+        integers=['number'])),
+    ('reviews', TableSpec('reviews', OrderedDict([
+        ('number', 'number'), ('reviewer_login', 'reviewerLogin'), ('author_login', 'authorLogin'),
+        ('state', 'state'), ('created_at', 'createdAt'), ('published_at', 'publishedAt')]),
+        key=['number', 'reviewer_login', 'created_at'],
+        indexes=[['project', 'created_at'], ['reviewer_login', 'created_at'], ['author_login', 'created_at']],
+        integers=['number'])),
+    ('threads', TableSpec('threads', OrderedDict([
+        ('number', 'number'), ('author_login', 'authorLogin'), ('created_at', 'createdAt'),
+        ('published_at', 'publishedAt'), ('path', 'path')]),
+        key=['number', 'author_login', 'created_at'],
+        indexes=[['project', 'created_at'], ['author_login', 'created_at']],
+        integers=['number'])),
+    ('comments', TableSpec('comments', OrderedDict([
+        ('number', 'number'), ('author_login', 'authorLogin'), ('created_at', 'createdAt'),
+        ('published_at', 'publishedAt')]),
+        key=['number', 'author_login', 'created_at'],
+        indexes=[['project', 'created_at'], ['author_login', 'created_at']],
+        integers=['number'])),
+    ('labels', TableSpec('labels', OrderedDict([('number', 'number'), ('name', 'name')]),
+                         key=['number', 'name'],
+                         indexes=[['name']],
+                         integers=['number'])),
+])
+
+
+def table_of(path: str) -> typing.Optional[str]:
+    """ the table of a file created by normalize.py (data/<table>_<input>.txt) """
+    name = os.path.basename(path)
+    for table in sorted(TABLES, key=len, reverse=True):
+        if name.startswith(table + '_'):
+            return table
+    return None
+
+
+class DataStore:
+    """
+    Normalized tables of all projects in a SQLite database. Rows are upserted by project and key, so downloading
+    data again does not create duplicates. The key, login and timestamp columns are indexed, the complete row is
+    kept as json in the column `data`.
+    """
+    def __init__(self, path: str = Files.STORE_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        for spec in TABLES.values():
+            for statement in spec.create_statements():
+                self._db.execute(statement)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self) -> 'DataStore':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, table: str, project: str, rows: typing.Iterable[dict]) -> int:
+        """ upserts the rows of the normalized table and returns the number of rows """
+        spec = TABLES[table]
+        with self._db:
+            n = self._db.execute("SELECT total_changes()").fetchone()[0]
+            self._db.executemany(spec.upsert_statement(), (spec.values(project, row) for row in rows))
+            n = self._db.execute("SELECT total_changes()").fetchone()[0] - n
+        LOG.info("upserted %d rows into %s", n, spec.name)
+        return n
+
+    def query(self, sql: str, parameters: typing.Sequence = ()) -> typing.List[dict]:
+        cursor = self._db.execute(sql, parameters)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def reviews_by(self, login: str, since: str = '', until: str = '9999') -> typing.List[dict]:
+        """ reviews of the reviewer in all projects in [since, until) (ISO 8601 prefixes, e.g., '2022') """
+        return self.query("SELECT * FROM reviews WHERE reviewer_login = ? AND created_at >= ? AND created_at < ? "
+                          "ORDER BY created_at", (login, since, until))
@@ -0,0 +1,196 @@
+import datetime
+import os
+import random
+import re
+import typing
+
+from . import files, log_utils
+from .constants import keys
+
+LOG = log_utils.configure_logger()
+
+CRAWLER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# flat PR tables of flink and kafka, the synthetic records draw their values and distributions from them
+SEED_FILES = (os.path.join(CRAWLER_DIR, 'pr_info_small.txt'),
+              os.path.join(CRAWLER_DIR, '..', 'notebooks', 'data', 'prs_kafka.txt'))
+
+PRS = 'prs'
+REVIEWS = 'reviews'
+COMMITS = 'commits'
+KINDS = (PRS, REVIEWS, COMMITS)
+
+LOGIN_COLUMNS = ('authorLogin', 'firstCommentAuthorLogin', 'firstReviewAuthorLogin', 'firstReviewThreadAuthorLogin')
+# e.g., '[FLINK-1234][runtime] ...' has the component 'runtime'
+COMPONENT_REGEX = re.compile(r'\[([a-z][\w.-]*)\]')
+
+
+def _hours(timestamp: str) -> float:
+    value = datetime.datetime.strptime(timestamp[:19], '%Y-%m-%dT%H:%M:%S')
+    return (value - datetime.datetime(1970, 1, 1)).total_seconds() / 3600
+
+
+def _timestamp(hours: float) -> str:
+    return (datetime.datetime(1970, 1, 1) + datetime.timedelta(hours=hours)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _share(prs: typing.List[dict], columns: typing.Tuple[str, str], default: float) -> float:
+    """ share of the PRs with a true flag (first column) or a value (second column) """
+    flag, value = columns
+    known = [bool(pr[flag]) if flag in pr else pr[value] is not None for pr in prs if flag in pr or value in pr]
+    return sum(known) / len(known) if known else default
+
+
+class Seeds:
+    """ values and distributions of real PRs """
+    def __init__(self, prs: typing.List[dict], users: int = 1000):
+        self.titles = [pr['title'] for pr in prs if pr.get('title')] or ['Synthetic PR']
+        self.states = [pr['state'] for pr in prs if pr.get('state')] or ['MERGED']
+        self.logins = sorted({pr[column] for pr in prs for column in LOGIN_COLUMNS if pr.get(column)})
+        # the seeds have few logins, the others are made up
+        self.logins += [f'user{i}' for i in range(users - len(self.logins))]
+        created = sorted(_hours(pr['createdAt']) for pr in prs if pr.get('createdAt'))
+        self.start = created[0] if created else _hours('2014-06-01T00:00:00Z')
+        self.intervals = [b - a for a, b in zip(created, created[1:])] or [12.]
+        self.durations = [_hours(pr['closedAt']) - _hours(pr['createdAt']) for pr in prs
+                          if pr.get('closedAt') and pr.get('createdAt')] or [48.]
+        self.review_rate = _share(prs, ('hasReviews', 'firstReviewCreatedAt'), 0.5)
+        self.thread_rate = _share(prs, ('hasThreadedReview', 'firstReviewThreadCreatedAt'), 0.5)
+        components = {component for title in self.titles for component in COMPONENT_REGEX.findall(title)}
+        self.components = sorted(components) or ['core']
+
+    @classmethod
+    def load(cls, paths: typing.Iterable[str] = SEED_FILES, users: int = 1000) -> 'Seeds':
+        prs = []
+        for path in paths:
+            if not os.path.exists(path):
+                LOG.warning("seed file %s does not exist", path)
+                continue
+            # the kafka PRs are downloaded records ({"node": {...}})
+            prs += [record.get(keys.NODE, record) for record in files.read_records(path)]
+        LOG.info("loaded %d seed PRs", len(prs))
+        return cls(prs, users)
+
+
+class RecordGenerator:
+    """
+    Generates downloaded records: PRs of get-prs-long, PRs with reviews of get-pr-reviews and commits of get-commits.
+    The nested connections have on average the given sizes (reviews and review threads only for the share of PRs
+    with reviews in the seeds).
+    """
+    def __init__(self, seeds: Seeds, seed: int = 0, comments: int = 3, reviews: int = 2, review_threads: int = 2,
+                 thread_comments: int = 2, labels: int = 1):
+        self._seeds = seeds
+        self._seed = seed
+        self._comments = comments
+        self._reviews = reviews
+        self._review_threads = review_threads
+        self._thread_comments = thread_comments
+        self._labels = labels
+
+    def _count(self, rng: random.Random, mean: int) -> int:
+        return rng.randint(0, 2 * mean)
+
+    def _entries(self, rng: random.Random, created: float, n: int) -> typing.List[dict]:
+        """ comments or reviews """
+        entries = []
+        for _ in range(n):
+            created += rng.expovariate(1 / 24)
+            entries.append({'createdAt': _timestamp(created), 'publishedAt': _timestamp(created),
+                            'author': {'login': rng.choice(self._seeds.logins)}})
+        return entries
+
+    def _pr(self, rng: random.Random, number: int, created: float) -> dict:
+        seeds = self._seeds
+        state = rng.choice(seeds.states)
+        closed = created + rng.choice(seeds.durations) if state != 'OPEN' else None
+        return {
+            'title': rng.choice(seeds.titles),
+            'state': state,
+            'number': number,
+            'createdAt': _timestamp(created),
+            'updatedAt': _timestamp(closed if closed is not None else created),
+            'mergedAt': _timestamp(closed) if state == 'MERGED' else None,
+            'closedAt': _timestamp(closed) if closed is not None else None,
+            'author': {'login': rng.choice(seeds.logins)},
+        }
+
+    def _reviews_of(self, rng: random.Random, created: float) -> typing.List[dict]:
+        if rng.random() >= self._seeds.review_rate:
+            return []
+        return self._entries(rng, created, rng.randint(1, 2 * self._reviews))
+
+    def _threads_of(self, rng: random.Random, created: float) -> typing.List[dict]:
+        if rng.random() >= self._seeds.thread_rate:
+            return []
+        return [{keys.COMMENTS: {keys.NODES: self._entries(rng, created, rng.randint(1, 2 * self._thread_comments))}}
+                for _ in range(rng.randint(1, 2 * self._review_threads))]
+
+    def _prs(self, n: int) -> typing.Iterator[typing.Tuple[random.Random, dict, float]]:
+        rng = random.Random(self._seed)
+        created = self._seeds.start
+        for number in range(1, n + 1):
+            created += rng.choice(self._seeds.intervals)
+            yield rng, self._pr(rng, number, created), created
+
+    def prs(self, n: int) -> typing.Iterator[dict]:
+        for rng, pr, created in self._prs(n):
+            # a label is set at most once per PR
+            components = rng.sample(self._seeds.components,
+                                    min(len(self._seeds.components), self._count(rng, self._labels)))
+            pr[keys.LABELS] = {keys.NODES: [{'name': f'component={component}'} for component in components]}
+            pr[keys.COMMENTS] = {keys.NODES: self._entries(rng, created, self._count(rng, self._comments))}
+            pr[keys.REVIEWS] = {keys.NODES: self._reviews_of(rng, created)}
+            pr[keys.REVIEW_THREADS] = {keys.NODES: self._threads_of(rng, created)}
+            yield {keys.NODE: pr}
+
+    def reviews(self, n: int) -> typing.Iterator[dict]:
+        for rng, pr, created in self._prs(n):
+            reviews = {keys.NODES: self._reviews_of(rng, created),
+                       'pageInfo': {'hasNextPage': False, 'endCursor': None}}
+            yield {keys.NODE: {keys.NUMBER: pr[keys.NUMBER], 'updatedAt': pr['updatedAt'],
+                               keys.AUTHOR: pr[keys.AUTHOR], keys.REVIEWS: reviews}}
+
+    def _user(self, rng: random.Random) -> dict:
+        i = rng.randrange(len(self._seeds.logins))
+        login = self._seeds.logins[i]
+        return {keys.USER: {'email': f'{login}@example.com', 'name': login, 'login': login, 'databaseId': i + 1}}
+
+    def commits(self, n: int) -> typing.Iterator[dict]:
+        """ from the most recent commit, three commits per PR """
+        rng = random.Random(self._seed)
+        interval = sum(self._seeds.intervals) / len(self._seeds.intervals) / 3
+        committed = self._seeds.start + n * interval
+        for _ in range(n):
+            committed -= rng.expovariate(1 / interval)
+            author = self._user(rng)
+            yield {
+                'message': rng.choice(self._seeds.titles),
+                'committedDate': _timestamp(committed),
+                'authoredDate': _timestamp(committed - rng.expovariate(1 / 24)),
+                'oid': '%040x' % rng.getrandbits(160),
+                'deletions': rng.randint(0, 200),
+                'additions': rng.randint(0, 500),
+                'changedFiles': rng.randint(1, 20),
+                keys.AUTHOR: author,
+                keys.COMMITTER: author if rng.random() < 0.5 else self._user(rng),
+            }
+
+    def records(self, kind: str, n: int) -> typing.Iterator[dict]:
+        return {PRS: self.prs, REVIEWS: self.reviews, COMMITS: self.commits}[kind](n)
+
+
+def generate(directory: str, kind: str, n: int, seed: int = 0) -> str:
+    """ the path of a file with n records of the kind, the file is only generated if it does not exist yet """
+    path = os.path.join(directory, f'{kind}_{n}_seed{seed}.txt')
+    if os.path.exists(path):
+        return path
+    generator = RecordGenerator(Seeds.load(), seed)
+    os.makedirs(directory, exist_ok=True)
+    LOG.info("generating %d %s records in %s", n, kind, path)
+    tmp = path + '.tmp'
+    writer = files.BlockWriter(tmp)
+    for record in generator.records(kind, n):
+        writer.write(files.dumps(record))
+    writer.close()
+    os.replace(tmp, path)
+    return path
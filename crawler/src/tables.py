@@ -0,0 +1,259 @@
+import abc
+import json
+import os
+import shutil
+import typing
+
+import pandas as pd
+
+from . import files, log_utils
+from .constants import keys
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+LOG = log_utils.configure_logger()
+
+JSON = 'json'
+PARQUET = 'parquet'
+
+# selects columns by the names of all columns (of a row or table)
+ColumnsSelector = typing.Callable[[typing.List[str]], typing.List[str]]
+
+
+class ColumnBuffer:
+    """ collects rows column by column, values missing in a row are None """
+    def __init__(self):
+        self.columns: typing.Dict[str, list] = {}
+        self.size = 0
+
+    def add(self, row: dict):
+        for key, value in row.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = [None] * self.size
+            column.append(value)
+        self.size += 1
+        for column in self.columns.values():
+            if len(column) < self.size:
+                column.append(None)
+
+    def rows(self) -> typing.Iterator[dict]:
+        names = list(self.columns)
+        for values in zip(*(self.columns[name] for name in names)):
+            yield dict(zip(names, values))
+
+    def clear(self):
+        self.columns = {}
+        self.size = 0
+
+
+class TableWriter(abc.ABC):
+    """
+    Writes rows in chunks of `chunk_size` rows, so that only one chunk is kept in memory. The file is only created
+    once the first chunk is written.
+    """
+    EXTENSION = ''
+
+    def __init__(self, path: str, chunk_size: int = 10000):
+        self.path = path
+        self.rows = 0
+        self._chunk_size = chunk_size
+        self._buffer = ColumnBuffer()
+
+    def add_rows(self, rows: typing.Iterable[dict]):
+        for row in rows:
+            self._buffer.add(row)
+        if self._buffer.size >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer.size:
+            self._write(self._buffer)
+            self.rows += self._buffer.size
+            self._buffer.clear()
+
+    @abc.abstractmethod
+    def _write(self, buffer: ColumnBuffer):
+        """ writes the rows of the buffer """
+
+    def _close(self):
+        pass
+
+    def close(self) -> int:
+        """ writes the remaining rows and returns the number of written rows """
+        self.flush()
+        self._close()
+        return self.rows
+
+    @classmethod
+    @abc.abstractmethod
+    def concatenate(cls, paths: typing.List[str], output: str):
+        """ concatenates the (existing) files written by writers of this type """
+
+    @classmethod
+    @abc.abstractmethod
+    def map_values(cls, path: str, columns: ColumnsSelector, function: typing.Callable[[typing.Any], typing.Any]):
+        """ replaces the values (except None) of the selected columns of a written file by function(value) """
+
+
+class JsonTableWriter(TableWriter):
+    """ writes json lines, every row of a chunk has the same columns """
+    EXTENSION = '.txt'
+
+    def __init__(self, path: str, chunk_size: int = 10000):
+        super().__init__(path, chunk_size)
+        self._f: typing.Optional[files.BlockWriter] = None
+
+    def _write(self, buffer: ColumnBuffer):
+        if not self._f:
+            self._f = files.BlockWriter(self.path)
+        for row in buffer.rows():
+            self._f.write(files.dumps(row))
+
+    def _close(self):
+        if self._f:
+            self._f.close()
+
+    @classmethod
+    def concatenate(cls, paths: typing.List[str], output: str):
+        with open(output, 'wb') as out:
+            for path in paths:
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        shutil.copyfileobj(f, out)
+
+    @classmethod
+    def map_values(cls, path: str, columns: ColumnsSelector, function: typing.Callable[[typing.Any], typing.Any]):
+        tmp = path + '.tmp'
+        writer = files.BlockWriter(tmp)
+        try:
+            for row in files.read_records(path):
+                for name in columns(list(row)):
+                    if row[name] is not None:
+                        row[name] = function(row[name])
+                writer.write(files.dumps(row))
+        finally:
+            writer.close()
+        os.replace(tmp, path)
+
+
+def _arrow_array(name: str, values: list) -> 'pa.Array':
+    """ timestamps for *At and *Date columns, categorical logins and integer PR numbers, otherwise inferred """
+    try:
+        if name.endswith('At') or name.endswith('Date'):
+            timestamps = pd.to_datetime(pd.Series(values, dtype=object), utc=True)
+            return pa.array(timestamps, type=pa.timestamp('ms', tz='UTC'))
+        if name.endswith('Login') or name == 'login':
+            return pa.array(values, type=pa.string()).dictionary_encode()
+        if name == keys.NUMBER:
+            return pa.array(values, type=pa.int64())
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError, TypeError):
+        LOG.debug("storing column %s as json", name)
+        return pa.array([None if value is None else json.dumps(value) for value in values], type=pa.string())
+
+
+def _unify(schemas: typing.List['pa.Schema']) -> 'pa.Schema':
+    """ merges the columns of all schemas, columns with conflicting types become strings """
+    types: typing.Dict[str, typing.List] = {}
+    for schema in schemas:
+        for field in schema:
+            types.setdefault(field.name, [])
+            if field.type != pa.null() and field.type not in types[field.name]:
+                types[field.name].append(field.type)
+    fields = []
+    for name, candidates in types.items():
+        if not candidates:
+            fields.append(pa.field(name, pa.null()))
+            continue
+        try:
+            fields.append(pa.unify_schemas([pa.schema([(name, t)]) for t in candidates],
+                                           promote_options='permissive').field(name))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _conform(table: 'pa.Table', schema: 'pa.Schema') -> 'pa.Table':
+    columns = []
+    for field in schema:
+        if field.name not in table.column_names:
+            columns.append(pa.nulls(len(table), field.type))
+        elif field.type == pa.string() and table.schema.field(field.name).type not in (pa.string(), pa.null()):
+            values = table.column(field.name).to_pylist()
+            columns.append(pa.array([None if value is None else json.dumps(value) for value in values], pa.string()))
+        else:
+            columns.append(table.column(field.name).cast(field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class ParquetTableWriter(TableWriter):
+    """
+    Writes a typed parquet file. Every chunk is first written to its own file, since the columns (and their types)
+    can differ between chunks. On closing, the chunks are merged into a single file with the union of all columns.
+    """
+    EXTENSION = '.parquet'
+
+    def __init__(self, path: str, chunk_size: int = 10000):
+        if pa is None:
+            raise ImportError("parquet output requires the 'pyarrow' package")
+        super().__init__(path, chunk_size)
+        self._chunks: typing.List[str] = []
+
+    def _write(self, buffer: ColumnBuffer):
+        table = pa.table({name: _arrow_array(name, values) for name, values in buffer.columns.items()})
+        chunk = f"{self.path}.chunk{len(self._chunks)}"
+        pq.write_table(table, chunk)
+        self._chunks.append(chunk)
+
+    def _close(self):
+        try:
+            if self._chunks:
+                self.concatenate(self._chunks, self.path)
+        finally:
+            for chunk in self._chunks:
+                if os.path.exists(chunk):
+                    os.remove(chunk)
+            self._chunks = []
+
+    @classmethod
+    def concatenate(cls, paths: typing.List[str], output: str):
+        paths = [path for path in paths if os.path.exists(path)]
+        schema = _unify([pq.read_schema(path) for path in paths])
+        with pq.ParquetWriter(output, schema) as writer:
+            for path in paths:
+                writer.write_table(_conform(pq.read_table(path), schema))
+
+    @classmethod
+    def map_values(cls, path: str, columns: ColumnsSelector, function: typing.Callable[[typing.Any], typing.Any]):
+        table = pq.read_table(path)
+        for name in columns(table.column_names):
+            column = table.column(name)
+            values = [None if value is None else function(value) for value in column.to_pylist()]
+            table = table.set_column(table.column_names.index(name), table.schema.field(name),
+                                     pa.array(values, type=column.type))
+        tmp = path + '.tmp'
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+
+
+FORMATS: typing.Dict[str, typing.Type[TableWriter]] = {
+    JSON: JsonTableWriter,
+    PARQUET: ParquetTableWriter,
+}
+
+
+def create_output_path(input_path: str, table: str, format: str = JSON) -> str:
+    """ data/<table>_<name of the downloaded file>.<extension of the format> """
+    filename = os.path.splitext(os.path.basename(files.strip_extension(input_path)))[0]
+    if filename.startswith('raw_'):
+        filename = filename[4:]
+    return f"data/{table}_{filename}{FORMATS[format].EXTENSION}"
+
+
+def create_writer(path: str, format: str = JSON, chunk_size: int = 10000) -> TableWriter:
+    return FORMATS[format](path, chunk_size=chunk_size)
@@ -1,90 +1,95 @@
 import typing
 
-import anytree
-
 from . import data_access
 from . import log_utils
 
 LOG = log_utils.configure_logger()
 
 
-class Cursor(anytree.NodeMixin):
+class Cursor:
+    """ a paginated connection of the query, connections nested in it are children of the cursor """
     default_has_next = 'hasNextPage'
     default_cursor_name = 'endCursor'
     default_variable_name = 'cursor'
 
     def __init__(self, access: data_access.AccessPath, variable_name: str = None, cursor_name: str = None,
                  has_next: str = None, parent: 'Cursor' = None):
-        super(Cursor, self).__init__()
-        self._access = access
-        self._variable_name = variable_name or self.default_variable_name
-        self._cursor_name = cursor_name or self.default_cursor_name
-        self._has_next = has_next or self.default_has_next
-        self._cursor_value = ''
+        self.access = access
+        self.variable_name = variable_name or self.default_variable_name
+        self.cursor_name = cursor_name or self.default_cursor_name
+        self.has_next_name = has_next or self.default_has_next
+        self.children: typing.List['Cursor'] = []
         self.parent = parent
-
-    def _page_info(self, data: dict) -> dict:
-        LOG.debug(f'Accessing "{self._access}"')
-        return self._access.run(data)
-
-    def has_next(self, data: dict) -> bool:
-        try:
-            return self._page_info(data)[self._has_next]
-        except IndexError:
-            return False
-
-    def next_cursor(self, data: dict) -> str:
-        self._cursor_value = self._page_info(data)[self._cursor_name]
-        return self._cursor_value
-
-    @property
-    def variable_name(self) -> str:
-        return self._variable_name
-
-    @property
-    def cursor_value(self) -> str:
-        return self._cursor_value
-
-    def reset_cursor_value(self):
-        self._cursor_value = ''
+        if parent is not None:
+            parent.children.append(self)
+
+    def post_order(self) -> typing.List['Cursor']:
+        cursors = []
+        for child in self.children:
+            cursors += child.post_order()
+        cursors.append(self)
+        return cursors
 
     def __str__(self):
-        string = f'Cursor(access={str(self._access)}, variable_name={self._variable_name}, ' +\
-               f'has_next={self._has_next}, cursor_name={self._cursor_name}, cursor_value={self._cursor_value}'
+        string = f'Cursor(access={str(self.access)}, variable_name={self.variable_name}, ' +\
+               f'has_next={self.has_next_name}, cursor_name={self.cursor_name}'
         if self.parent:
             return string + f', parent={self.parent.variable_name})'
         return string + ')'
 
 
 class CursorGenerator:
+    """
+    Determines the cursors of the next page: the first cursor in post-order (i.e., the innermost connection) with a
+    next page advances, its descendants start from the first page again and all other cursors keep their value.
+    The cursor tree is compiled once into a post-order list, where the descendants of the i-th cursor are the
+    cursors [first_descendant[i], i).
+    """
     def __init__(self, root: Cursor):
         self._root = root
+        self._cursors = root.post_order()
+        self._paths = [tuple(cursor.access.segments) for cursor in self._cursors]
+        self._first_descendant = []
+        for i, cursor in enumerate(self._cursors):
+            self._first_descendant.append(i - len(cursor.post_order()) + 1)
+        # the current value of each cursor, '' if unset
+        self._values = [''] * len(self._cursors)
+
+    def _page_info(self, i: int, data: dict) -> typing.Optional[dict]:
+        """ the page info of the i-th cursor or None if the connection does not exist (e.g., no edges) """
+        content = data
+        for segment in self._paths[i]:
+            try:
+                content = content[segment]
+            except IndexError:
+                return None
+            except KeyError:
+                LOG.error("cannot find segment '%s' of %s: %s", segment, self._cursors[i].access, content)
+                raise
+        return content
+
+    def restore(self, cursors: typing.Optional[typing.Dict[str, str]]):
+        """ continues from the given cursors (e.g., of a checkpoint), cursors that are not given are unset """
+        cursors = cursors or {}
+        self._values = [cursors.get(cursor.variable_name) or '' for cursor in self._cursors]
 
     def next_cursors(self, data: dict) -> typing.Optional[typing.Dict[str, str]]:
-        cursors = {}
-        looking_for_next_cursor = True
-        post_order_iter: typing.Iterator[Cursor] = anytree.PostOrderIter(self._root)
-        for node in post_order_iter:
-            LOG.debug(f'Accessing node {node}')
-            if looking_for_next_cursor and node.has_next(data):
-                LOG.debug(f'{node.variable_name}: found next cursor')
-                looking_for_next_cursor = False
-                cursors[node.variable_name] = node.next_cursor(data)
-
-                # we don't want to re-use the cursor of descendants
-                descendants: typing.Iterator[Cursor] = node.descendants
-                for descendant in descendants:
-                    descendant.reset_cursor_value()
-
-            elif node.cursor_value:
-                LOG.debug(f'{node.variable_name}: use previous cursor')
-                # only set cursor value if it exists otherwise leave cursor unset
-                cursors[node.variable_name] = node.cursor_value
-            else:
-                LOG.debug(f'{node.variable_name}: use no cursor')
-
-        if looking_for_next_cursor:
-            # we have not found any cursor that can be continued
+        for i, cursor in enumerate(self._cursors):
+            page_info = self._page_info(i, data)
+            if page_info is not None and page_info[cursor.has_next_name]:
+                self._values[i] = page_info[cursor.cursor_name]
+                # we don't want to re-use the cursors of descendants
+                for j in range(self._first_descendant[i], i):
+                    self._values[j] = ''
+                LOG.debug("%s: found next cursor", cursor.variable_name)
+                # only set cursors with a value, otherwise leave them unset
+                return {self._cursors[j].variable_name: value for j, value in enumerate(self._values) if value}
+        # we have not found any cursor that can be continued
+        return None
+
+    def end_cursors(self, data: dict) -> typing.Optional[typing.Dict[str, str]]:
+        """ the cursor after the page of the outermost connection (also after its last page) or None """
+        page_info = self._page_info(len(self._cursors) - 1, data)
+        if not page_info or not page_info.get(self._root.cursor_name):
             return None
-
-        return cursors
+        return {self._root.variable_name: page_info[self._root.cursor_name]}
@@ -0,0 +1,55 @@
+import typing
+
+from gql.transport.exceptions import TransportQueryError
+
+from . import log_utils, utils
+from .graphl_client import GraphQLClient
+
+LOG = log_utils.configure_logger()
+
+USER_FRAGMENT = """
+fragment userInfo on User {
+  login
+  id
+  name
+  company
+  createdAt
+}
+"""
+
+
+def _batch_query(size: int) -> str:
+    """ creates a query that looks up `size` users at once via aliases (user0, user1, ...) """
+    variables = ", ".join(f"$login{i}: String!" for i in range(size))
+    fields = "\n".join(f"  user{i}: user(login: $login{i}) {{\n    ...userInfo\n  }}" for i in range(size))
+    return f"query getUsers({variables}) {{\n{fields}\n}}\n{USER_FRAGMENT}"
+
+
+def get_users(client: GraphQLClient, logins: typing.Iterable[str], batch_size: int = 100) \
+        -> typing.Dict[str, typing.Optional[dict]]:
+    """ returns the user info for each login (None for unknown logins) """
+    logins = list(dict.fromkeys(logins))
+    users = {}
+    for start in range(0, len(logins), batch_size):
+        batch = logins[start:start + batch_size]
+        variables = {f'login{i}': login for i, login in enumerate(batch)}
+        try:
+            result = client.send_graphql_query(_batch_query(len(batch)), variable_values=variables)
+        except TransportQueryError as ex:
+            # unknown logins result in NOT_FOUND errors, the data of all other users is still returned
+            if not ex.data or any(error.get('type') != 'NOT_FOUND' for error in ex.errors or []):
+                raise
+            result = ex.data
+        for i, login in enumerate(batch):
+            users[login] = result.get(f'user{i}')
+            if not users[login]:
+                LOG.warning("cannot find user '%s'", login)
+        LOG.info("resolved %d of %d users", len(users), len(logins))
+    return users
+
+
+def get_user_id(client: GraphQLClient, login: str) -> str:
+    user = get_users(client, [login])[login]
+    if not user:
+        raise utils.NoSuchUser(f"Cannot find user: {login}")
+    return user['id']
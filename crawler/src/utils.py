@@ -19,6 +19,10 @@ class NoQuery(Exception):
     pass
 
 
+class NoSuchUser(Exception):
+    pass
+
+
 def load_secret() -> str:
     path = os.path.abspath(constants.FILE_NAME_SECRET)
     if not os.path.exists(path):
@@ -59,6 +63,13 @@ def no_such_pr_error(ex: TransportQueryError) -> bool:
         return False
 
 
+def error_type(ex: TransportQueryError) -> typing.Optional[str]:
+    try:
+        return ex.errors[0]['type']
+    except (TypeError, IndexError, KeyError):
+        return None
+
+
 def to_access_fun(path: str):
     def fun(data: dict) -> dict:
         content = data
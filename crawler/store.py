@@ -0,0 +1,48 @@
+import typing
+
+import click
+import pandas as pd
+
+from src import files, log_utils
+from src.constants import Files
+from src.store import DataStore, TABLES, table_of
+
+LOG = log_utils.configure_logger()
+
+
+@click.group(help="Stores the normalized tables of all projects in a local SQLite database")
+@click.option("--db", type=str, default=Files.STORE_DB, show_default=True, help="database")
+@click.pass_context
+def cli(ctx, db: str):
+    ctx.ensure_object(dict)
+    ctx.obj['db'] = db
+
+
+@cli.command(help="adds (or updates) the rows of normalized tables (e.g., data/reviews_pr-reviews_....txt)")
+@click.option("-p", "--project", type=str, required=True, help="project (e.g., apache/flink)")
+@click.option("-t", "--table", type=click.Choice(list(TABLES)),
+              help="table of the files (default: derived from the file names)")
+@click.argument("inputs", nargs=-1, required=True)
+@click.pass_context
+def ingest(ctx, project: str, table: typing.Optional[str], inputs: typing.Tuple[str]):
+    with DataStore(ctx.obj['db']) as store:
+        for input in inputs:
+            name = table if table else table_of(input)
+            if not name:
+                raise click.UsageError(f"cannot derive the table of '{input}', use '-t'")
+            LOG.info("adding %s to %s", input, name)
+            store.add(name, project, files.read_records(input))
+
+
+@cli.command(help="runs a SQL query (e.g., \"SELECT * FROM reviews WHERE reviewer_login = 'x'\")")
+@click.argument("sql", type=str)
+@click.pass_context
+def query(ctx, sql: str):
+    with DataStore(ctx.obj['db']) as store:
+        rows = store.query(sql)
+    with pd.option_context('display.max_rows', None, 'display.width', None):
+        print(pd.DataFrame(rows))
+
+
+if __name__ == '__main__':
+    cli()
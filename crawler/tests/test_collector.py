@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from src import jobs
+from src.backup import Checkpoint
+from src.collector import DataCollectorBuilder
+
+CRAWLER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# reviews by PR number
+REVIEWS = {1: ['a'], 2: ['b', 'c', 'd'], 3: ['e', 'f', 'g'], 4: ['h']}
+
+
+class Client:
+    """ answers the reviews query from REVIEWS: one PR per page (newest first), two reviews per page """
+    def __init__(self, fail_after: int = 0):
+        self.requests = 0
+        self._fail_after = fail_after
+
+    def send_graphql_query_with_retries(self, query: str, params: dict, max_retries: int = 5, on_retry=None) -> dict:
+        self.requests += 1
+        if self._fail_after and self.requests > self._fail_after:
+            raise ConnectionError("crashed")
+        number = int(params['cursorTop']) - 1 if params.get('cursorTop') else max(REVIEWS)
+        start = int(params.get('cursorReviews', 0))
+        reviews = REVIEWS[number]
+        return {'repository': {'pullRequests': {
+            'pageInfo': {'hasPreviousPage': number > 1, 'startCursor': str(number)},
+            'edges': [{'node': {'number': number, 'reviews': {
+                'pageInfo': {'hasNextPage': start + 2 < len(reviews), 'endCursor': str(start + 2)},
+                'nodes': [{'id': review} for review in reviews[start:start + 2]]}}}]}}}
+
+
+def collect(client: Client, checkpoint: Checkpoint, records: list, resume: bool = False):
+    builder = DataCollectorBuilder().add_client(client).add_step_size(1).add_checkpoint(checkpoint)
+    if resume:
+        builder = builder.enable_resume()
+    collector = jobs._pr_reviews(builder) \
+        .add_record_callback(lambda record: records.append(record) or True) \
+        .build()
+    collector.run()
+
+
+def reviews(records: list) -> list:
+    return [review['id'] for record in records for review in record['node']['reviews']['nodes']]
+
+
+@pytest.fixture(autouse=True)
+def crawler_dir(monkeypatch):
+    # the queries are loaded from the working directory
+    monkeypatch.chdir(CRAWLER_DIR)
+
+
+def test_resumed_nested_pages_keep_the_outer_cursor(tmp_path):
+    checkpoint = Checkpoint('reviews', directory=str(tmp_path))
+    records = []
+    # crashes after PR 4, the first resumed page (PR 3) has more reviews
+    with pytest.raises(ConnectionError):
+        collect(Client(fail_after=1), checkpoint, records)
+    assert checkpoint.load().cursors == {'cursorTop': '4'}
+    collect(Client(), checkpoint, records, resume=True)
+    assert reviews(records) == ['h', 'e', 'f', 'g', 'b', 'c', 'd', 'a']
+    assert checkpoint.load() is None
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+from gql.transport.exceptions import TransportQueryError
+
+from src.fanout import PullRequestFanOut
+
+CRAWLER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Client:
+    """ answers the batch query like github: PRs that do not exist are null and reported as NOT_FOUND errors """
+    def __init__(self, existing: set, error_type: str = 'NOT_FOUND'):
+        self._existing = existing
+        self._error_type = error_type
+
+    def send_graphql_query_with_retries(self, query: str, variables: dict, *args) -> dict:
+        prs = {}
+        errors = []
+        for name, number in variables.items():
+            if not name.startswith('number'):
+                continue
+            alias = f"pr{name[len('number'):]}"
+            if number in self._existing:
+                prs[alias] = {'number': number, 'reviews': {'pageInfo': {'hasNextPage': False, 'endCursor': None},
+                                                            'nodes': [{'state': 'APPROVED'}]}}
+            else:
+                prs[alias] = None
+                errors.append({'type': self._error_type, 'path': ['repository', alias],
+                               'message': f"Could not resolve to a PullRequest with the number of {number}."})
+        data = {'repository': prs}
+        if errors:
+            raise TransportQueryError(str(errors[0]), errors=errors, data=data)
+        return data
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def crawler_dir(monkeypatch):
+    # the queries are loaded from the working directory
+    monkeypatch.chdir(CRAWLER_DIR)
+
+
+def test_missing_prs_are_skipped():
+    fan_out = PullRequestFanOut('get-pr-reviews', lambda: Client({1, 3}))
+    records = fan_out.fetch([3, 2, 1])
+    assert [record['node']['number'] for record in records] == [3, 1]
+
+
+def test_other_errors_are_raised():
+    fan_out = PullRequestFanOut('get-pr-reviews', lambda: Client({1}, error_type='FORBIDDEN'))
+    with pytest.raises(TransportQueryError):
+        fan_out.fetch([2, 1])
@@ -0,0 +1,43 @@
+import pytest
+
+from src import files, normalization, tables
+from src.identities import IdentityIndex
+
+
+def commit(oid: str, login: str, email: str) -> dict:
+    user = {'login': login, 'email': email, 'name': login, 'databaseId': None}
+    return {'oid': oid, 'author': {'user': dict(user)}, 'committer': {'user': dict(user)}}
+
+
+# the third commit shows that a and b are the same person
+COMMITS = [commit('1', 'a', 'a@example.com'), commit('2', 'b', 'b@example.com'), commit('3', 'b', 'a@example.com')]
+
+
+def test_merge_changes_the_canonical_id():
+    index = IdentityIndex()
+    first = index.annotate({'authorLogin': 'a', 'authorEmail': 'a@example.com'})['authorId']
+    second = index.annotate({'authorLogin': 'b', 'authorEmail': 'b@example.com'})['authorId']
+    assert first != second
+    index.annotate({'authorLogin': 'b', 'authorEmail': 'a@example.com'})
+    assert index.canonical(first) == index.canonical(second)
+    assert index.merges == 1
+
+
+@pytest.mark.parametrize('format', [tables.JSON, tables.PARQUET])
+def test_ids_written_before_a_merge_are_canonical(tmp_path, format):
+    if format == tables.PARQUET:
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / f'commits{tables.FORMATS[format].EXTENSION}')
+    index = IdentityIndex()
+    # every row is written before the next one is annotated
+    rows = normalization.normalize_records([dict(c) for c in COMMITS], {'commits': path}, chunk_size=1,
+                                           format=format, identities=index)
+    assert rows == {'commits': 3}
+    if format == tables.PARQUET:
+        import pyarrow.parquet as pq
+        written = pq.read_table(path).to_pylist()
+    else:
+        written = list(files.read_records(path))
+    ids = {row[column] for row in written for column in ('authorId', 'committerId')}
+    assert len(ids) == 1
+    assert ids == {index.find(login='a')}
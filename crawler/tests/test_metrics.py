@@ -0,0 +1,16 @@
+from src.metrics import MetricsStore
+
+
+def pr(number: int, labels: list) -> dict:
+    return {'number': number, 'authorLogin': 'a', 'createdAt': '2022-06-01T00:00:00Z', 'closedAt': None,
+            'mergedAt': None, 'labels': labels}
+
+
+def test_duplicate_component_labels_count_once(tmp_path):
+    with MetricsStore(str(tmp_path / 'metrics.sqlite')) as store:
+        months = store.add_prs('a/b', [pr(1, ['component=runtime', 'component=runtime', 'bug']),
+                                       pr(2, ['component=runtime', 'component=sql'])])
+        store.update('a/b', months)
+        rows = {row['component']: row for row in store.monthly('a/b', components=True)}
+    assert set(rows) == {'runtime', 'sql'}
+    assert rows['runtime']['opened_prs'] == 2
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from src import rate_limit
+from src.rate_limit import AdaptiveStepSize, RateLimitBudget
+
+
+def budget_of(remaining: int, seconds_until_reset: float, cost: int = 1) -> RateLimitBudget:
+    result = RateLimitBudget(reserve=10, pace_below=1000)
+    result.update(remaining, time.time() + seconds_until_reset, cost)
+    return result
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    """ the seconds of every sleep of the rate limit module, which does not sleep """
+    seconds = []
+    monkeypatch.setattr(rate_limit.time, 'sleep', seconds.append)
+    return seconds
+
+
+@pytest.mark.parametrize('step_size', [5, 100])
+def test_step_converges_to_the_target_latency(step_size):
+    # every record takes 0.1 seconds, the target of 5 seconds is reached with 50 records
+    step = AdaptiveStepSize(step_size=step_size, max_step_size=100, target_latency=5.)
+    values = []
+    for _ in range(20):
+        step.succeeded(latency=step.value * 0.1, cost=1)
+        values.append(step.value)
+    assert len(set(values[-10:])) == 1
+    assert 25 <= step.value <= 50
+
+
+def test_cost_does_not_shrink_the_step():
+    # smaller pages would cost more points per record
+    step = AdaptiveStepSize(step_size=20, max_step_size=100)
+    step.succeeded(latency=1., cost=50)
+    assert step.value == 30
+
+
+def test_failures_halve_the_step():
+    step = AdaptiveStepSize(step_size=20, max_step_size=100)
+    step.failed()
+    assert step.value == 10
+
+
+def test_enough_points_are_not_paced(sleeps):
+    limit = budget_of(5000, 3600)
+    limit.wait()
+    limit.wait()
+    assert limit.pace() == 0
+    assert sleeps == []
+
+
+def test_few_points_are_spread_until_the_reset(sleeps):
+    # 490 points for 100 seconds, a request every 0.2 seconds
+    limit = budget_of(500, 100)
+    assert limit.pace() == pytest.approx(100 / 490, rel=0.01)
+    limit.wait()
+    assert sleeps == []
+    limit.wait()
+    assert len(sleeps) == 1
+    assert sleeps[0] == pytest.approx(100 / 490, rel=0.05)
+
+
+def test_pace_follows_the_cost_per_request():
+    assert budget_of(500, 100, cost=5).pace() == pytest.approx(5 * 100 / 490, rel=0.01)
+
+
+def test_exhausted_budget_waits_for_the_reset(sleeps):
+    budget_of(5, 30).wait()
+    assert sleeps[0] == pytest.approx(30, abs=1)
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+
+from src import jobs
+from src.record_filter import updated_window
+
+CONFIG = OrderedDict([('owner', 'apache'), ('repository', 'flink'), ('branch', 'master')])
+
+
+def authored(*logins: str) -> dict:
+    return {'nodes': [{'author': {'login': login}} for login in logins]}
+
+
+def pr(number: int, author: str, updated: str = '2022-06-01T00:00:00Z', reviews=(), thread_comments=()) -> dict:
+    return {'node': {'number': number, 'updatedAt': updated, 'author': {'login': author}, 'reviews': authored(*reviews),
+                     'reviewThreads': {'nodes': [{'comments': authored(*thread_comments)}]}}}
+
+
+def commit(oid: str, login: str, message: str) -> dict:
+    return {'oid': oid, 'message': message, 'author': {'user': {'login': login}}}
+
+
+def logins(nodes: list) -> list:
+    return [node['author']['login'] for node in nodes]
+
+
+def test_excluded_authors_are_dropped_from_records_and_reviews():
+    record_filter = jobs.Job('get-pr-reviews', CONFIG, exclude_authors=['flinkbot']).record_filter()
+    records, stop = record_filter.apply([pr(2, 'flinkbot'), pr(1, 'a', reviews=['flinkbot', 'b', 'flinkbot'])])
+    assert not stop
+    assert [record['node']['number'] for record in records] == [1]
+    assert logins(records[0]['node']['reviews']['nodes']) == ['b']
+
+
+def test_excluded_authors_are_dropped_from_the_comments_of_every_thread():
+    record_filter = jobs.Job('get-pr-review-threads', CONFIG, exclude_authors=['flinkbot']).record_filter()
+    records, _ = record_filter.apply([pr(1, 'a', thread_comments=['b', 'flinkbot'])])
+    assert logins(records[0]['node']['reviewThreads']['nodes'][0]['comments']['nodes']) == ['b']
+
+
+def test_fields_are_truncated_and_excluded():
+    job = jobs.Job('get-commits', CONFIG, exclude_authors=['dependabot'], exclude_fields=['author'],
+                   truncate={'message': 5})
+    records, _ = job.record_filter().apply([commit('1', 'a', 'FLINK-1 a long message'),
+                                            commit('2', 'dependabot', 'Bump')])
+    assert records == [{'oid': '1', 'message': 'FLINK'}]
+
+
+def test_time_window_is_kept():
+    job = jobs.Job('get-prs-long', CONFIG, since='2022-06-01', exclude_authors=['flinkbot'])
+    _, window = updated_window('node/updatedAt', job.since, job.until)
+    record_filter = job.record_filter(window)
+    records, stop = record_filter.apply([pr(3, 'a', '2022-07-01'), pr(2, 'flinkbot', '2022-06-15'),
+                                         pr(1, 'a', '2022-05-01')])
+    assert stop
+    assert [record['node']['number'] for record in records] == [3]
+
+
+def test_without_options_there_is_no_filter():
+    assert jobs.Job('get-commits', CONFIG).record_filter() is None
@@ -0,0 +1,46 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from src import schema
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'graphql',
+                           'schema.docs.graphql')
+
+
+@pytest.fixture
+def schema_file(tmp_path):
+    path = str(tmp_path / 'schema.docs.graphql')
+    shutil.copy(SCHEMA_FILE, path)
+    return path
+
+
+def cache_path(path: str) -> str:
+    with open(path, 'rb') as f:
+        return schema._cache_path(path, f.read())
+
+
+def fail_parsing(monkeypatch):
+    def parse(*args, **kwargs):
+        raise AssertionError("schema parsed again")
+    monkeypatch.setattr(schema, 'build_schema', parse)
+
+
+def test_second_load_uses_cache(schema_file, monkeypatch):
+    first = schema._build(schema_file)
+    fail_parsing(monkeypatch)
+    second = schema._build(schema_file)
+    assert set(second.type_map) == set(first.type_map)
+    assert second.query_type.fields.keys() == first.query_type.fields.keys()
+
+
+def test_corrupt_cache_is_replaced(schema_file, monkeypatch):
+    with open(cache_path(schema_file), 'w') as f:
+        f.write('{"__sche')
+    schema._build(schema_file)
+    with open(cache_path(schema_file)) as f:
+        json.load(f)
+    fail_parsing(monkeypatch)
+    assert schema._build(schema_file).query_type is not None
@@ -0,0 +1,77 @@
+import typing
+
+import pandas as pd
+
+# Contributor conversion: does a first-time contributor come back within a time window, and does the time to the
+# first review of the first PR make a difference? All functions work on sorted columns (sort + merge_asof) instead
+# of per-author loops. Tables with a 'project' column may contain several projects.
+
+
+def _keys(data: pd.DataFrame) -> typing.List[str]:
+    return ['project', 'login'] if 'project' in data.columns else ['login']
+
+
+def _first_review(prs: pd.DataFrame) -> pd.Series:
+    reviews = pd.to_datetime(prs['firstReviewCreatedAt'], utc=True) if 'firstReviewCreatedAt' in prs.columns \
+        else pd.Series(pd.NaT, index=prs.index, dtype='datetime64[ns, UTC]')
+    if 'firstReviewThreadCreatedAt' not in prs.columns:
+        return reviews
+    review_threads = pd.to_datetime(prs['firstReviewThreadCreatedAt'], utc=True)
+    return reviews.where(review_threads.isna() | (reviews <= review_threads), review_threads)
+
+
+def contributions(prs: pd.DataFrame, commits: typing.Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """ one row per PR (pr-flat table) and commit (commits table) with login, time and time to first review """
+    created = pd.to_datetime(prs['createdAt'], utc=True)
+    columns = {'login': prs['authorLogin'], 'at': created, 'number': prs['number'],
+               'timeToFirstReview': _first_review(prs) - created}
+    if 'project' in prs.columns:
+        columns['project'] = prs['project']
+    frames = [pd.DataFrame(columns)]
+    if commits is not None:
+        columns = {'login': commits['authorLogin'], 'at': pd.to_datetime(commits['authoredDate'], utc=True)}
+        if 'project' in commits.columns:
+            columns['project'] = commits['project']
+        frames.append(pd.DataFrame(columns))
+    data = pd.concat(frames, ignore_index=True)
+    data = data.loc[data['login'].notna() & data['at'].notna()]
+    return data.sort_values('at', kind='stable').reset_index(drop=True)
+
+
+def cohort(prs: pd.DataFrame, commits: typing.Optional[pd.DataFrame] = None, window: str = '180D',
+           min_gap: str = '1D', project: typing.Optional[str] = None) -> pd.DataFrame:
+    """
+    One row per contributor: first contribution, the first PR and its time to first review, the time until the next
+    contribution (at least `min_gap` later, so that e.g. the commit of the first PR does not count) and whether the
+    contributor returned within `window`.
+    """
+    if project is not None:
+        prs = prs.loc[prs['project'] == project]
+        commits = commits.loc[commits['project'] == project] if commits is not None else None
+    data = contributions(prs, commits)
+    keys = _keys(data)
+
+    # data is sorted by time, so the first row per contributor is the first contribution
+    first = data.drop_duplicates(keys)[keys + ['at']].rename(columns={'at': 'firstContribution'})
+    first_pr = data.loc[data['number'].notna()].drop_duplicates(keys)[keys + ['at', 'number', 'timeToFirstReview']] \
+        .rename(columns={'at': 'firstPr', 'number': 'firstPrNumber'})
+    result = first.merge(first_pr, on=keys, how='left')
+
+    # next contribution after the first one (+ min_gap) per contributor
+    result['_after'] = result['firstContribution'] + pd.Timedelta(min_gap)
+    result = result.sort_values('_after', kind='stable')
+    following = data[keys + ['at']].rename(columns={'at': 'nextContribution'})
+    result = pd.merge_asof(result, following, left_on='_after', right_on='nextContribution', by=keys,
+                           direction='forward', allow_exact_matches=True)
+    result = result.drop(columns='_after').sort_values('firstContribution', kind='stable').reset_index(drop=True)
+    result['timeToReturn'] = result['nextContribution'] - result['firstContribution']
+    result['returned'] = result['timeToReturn'] <= pd.Timedelta(window)
+    return result
+
+
+def return_rates(data: pd.DataFrame, windows: typing.List[str], review_bins: typing.List[str]) -> pd.DataFrame:
+    """ share of returning contributors per window (columns) by time to first review of the first PR (rows) """
+    bins = [pd.Timedelta(b) for b in review_bins]
+    groups = pd.cut(data['timeToFirstReview'], bins=bins)
+    return pd.DataFrame({window: (data['timeToReturn'] <= pd.Timedelta(window)).groupby(groups, observed=False).mean()
+                         for window in windows})
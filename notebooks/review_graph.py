@@ -0,0 +1,177 @@
+import typing
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Weighted reviewer -> author graph as in "github reviews - graph.ipynb": the weight of an edge is the number of PRs
+# of the author that the reviewer reviewed. Logins are interned to matrix indices, the (deduplicated) edges are kept
+# as integer arrays and summed up per month, so new reviews and time windows only touch the affected months.
+
+IGNORED_REVIEWERS = ('flinkbot',)
+
+
+def _month_numbers(timestamps: pd.Series) -> np.ndarray:
+    timestamps = pd.to_datetime(timestamps, utc=True)
+    return (timestamps.dt.year * 12 + timestamps.dt.month - 1).to_numpy(dtype=np.int64)
+
+
+def month_number(month: str) -> int:
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def month_name(number: int) -> str:
+    return f"{number // 12:04d}-{number % 12 + 1:02d}"
+
+
+class ReviewGraph:
+    """
+    Reviewer -> author adjacency in sparse matrices (one per month of the first review of a PR by a reviewer). Use
+    `add_reviews` with (new) rows of the normalized reviews table and `matrix`, `edges`, `top_reviewers` or
+    `centrality` with an optional month range [since, until) ('YYYY-MM').
+    """
+    def __init__(self, ignored_reviewers: typing.Iterable[str] = IGNORED_REVIEWERS):
+        self.logins: typing.List[str] = []
+        self._index: typing.Dict[str, int] = {}
+        self._ignored = set(ignored_reviewers)
+        self._seen: typing.Set[typing.Tuple[int, int, int]] = set()
+        # edges per month: chunks of (reviewer, author) index arrays, merged into a matrix on access
+        self._chunks: typing.Dict[int, typing.List[typing.Tuple[np.ndarray, np.ndarray]]] = {}
+        self._matrices: typing.Dict[int, sparse.csr_matrix] = {}
+
+    def __len__(self) -> int:
+        return len(self.logins)
+
+    def intern(self, logins: typing.Iterable[str]) -> np.ndarray:
+        """ matrix indices of the logins, unknown logins are added """
+        codes, uniques = pd.factorize(pd.Series(logins, dtype=object))
+        indices = np.empty(len(uniques), dtype=np.int64)
+        for i, login in enumerate(uniques):
+            index = self._index.get(login)
+            if index is None:
+                index = self._index[login] = len(self.logins)
+                self.logins.append(login)
+            indices[i] = index
+        return indices[codes]
+
+    def index_of(self, login: str) -> int:
+        return self._index[login]
+
+    @property
+    def months(self) -> typing.List[str]:
+        return [month_name(month) for month in sorted(set(self._chunks) | set(self._matrices))]
+
+    def add_reviews(self, reviews: pd.DataFrame) -> int:
+        """ adds the reviews (reviewerLogin, authorLogin, number, createdAt) and returns the number of new edges """
+        reviews = reviews.loc[reviews['reviewerLogin'].notna() & reviews['authorLogin'].notna() &
+                              (reviews['reviewerLogin'] != reviews['authorLogin']) &
+                              ~reviews['reviewerLogin'].isin(self._ignored)]
+        # every reviewer counts once per PR, dated by the first review
+        reviews = reviews.sort_values('createdAt', kind='stable') \
+            .drop_duplicates(['reviewerLogin', 'authorLogin', 'number'])
+        reviewers = self.intern(reviews['reviewerLogin'])
+        authors = self.intern(reviews['authorLogin'])
+        numbers = reviews['number'].to_numpy(dtype=np.int64)
+        new = np.fromiter(((key not in self._seen) for key in zip(reviewers, authors, numbers)), dtype=bool,
+                          count=len(numbers))
+        self._seen.update(zip(reviewers[new], authors[new], numbers[new]))
+        reviewers, authors, months = reviewers[new], authors[new], _month_numbers(reviews['createdAt'])[new]
+
+        order = np.argsort(months, kind='stable')
+        months, reviewers, authors = months[order], reviewers[order], authors[order]
+        boundaries = np.flatnonzero(np.diff(months)) + 1
+        for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(months)]):
+            if start < end:
+                self._chunks.setdefault(int(months[start]), []).append((reviewers[start:end], authors[start:end]))
+        return int(new.sum())
+
+    def _month_matrix(self, month: int) -> sparse.csr_matrix:
+        n = len(self.logins)
+        chunks = self._chunks.pop(month, [])
+        matrix = self._matrices.get(month)
+        if chunks:
+            rows = np.concatenate([reviewers for reviewers, _ in chunks])
+            columns = np.concatenate([authors for _, authors in chunks])
+            added = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, columns)), shape=(n, n))
+            matrix = added if matrix is None else self._resized(matrix) + added
+            self._matrices[month] = matrix
+        return self._resized(matrix) if matrix is not None else sparse.csr_matrix((n, n), dtype=np.int64)
+
+    def _resized(self, matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+        n = len(self.logins)
+        if matrix.shape != (n, n):
+            matrix = matrix.copy()
+            matrix.resize((n, n))
+        return matrix
+
+    def _month_range(self, since: typing.Optional[str], until: typing.Optional[str]) -> typing.List[int]:
+        first = month_number(since) if since else None
+        end = month_number(until) if until else None
+        return [month for month in sorted(set(self._chunks) | set(self._matrices))
+                if (first is None or month >= first) and (end is None or month < end)]
+
+    def matrix(self, since: typing.Optional[str] = None, until: typing.Optional[str] = None) -> sparse.csr_matrix:
+        """ weights (reviewer x author) of the months in [since, until) """
+        matrix = sparse.csr_matrix((len(self.logins), len(self.logins)), dtype=np.int64)
+        for month in self._month_range(since, until):
+            matrix = matrix + self._month_matrix(month)
+        return matrix
+
+    def rolling(self, months: int = 12) -> typing.Iterator[typing.Tuple[str, sparse.csr_matrix]]:
+        """ (month, weights of the `months` months up to and including it) for every month with reviews """
+        all_months = self._month_range(None, None)
+        if not all_months:
+            return
+        matrix = sparse.csr_matrix((len(self.logins), len(self.logins)), dtype=np.int64)
+        for month in range(all_months[0], all_months[-1] + 1):
+            matrix = matrix + self._month_matrix(month)
+            if month - months in self._matrices:
+                matrix = matrix - self._month_matrix(month - months)
+            matrix.eliminate_zeros()
+            yield month_name(month), matrix
+
+    def edges(self, since: typing.Optional[str] = None, until: typing.Optional[str] = None) -> pd.DataFrame:
+        """ source (reviewer), target (author) and weight, e.g., for networkx or a csv export """
+        matrix = self.matrix(since, until).tocoo()
+        logins = np.array(self.logins, dtype=object)
+        return pd.DataFrame({'source': logins[matrix.row], 'target': logins[matrix.col], 'weight': matrix.data}) \
+            .sort_values('weight', ascending=False, kind='stable').reset_index(drop=True)
+
+    def _ranking(self, values: np.ndarray, n: typing.Optional[int]) -> pd.Series:
+        ranking = pd.Series(values, index=pd.Index(self.logins, name='login')).sort_values(ascending=False,
+                                                                                              kind='stable')
+        ranking = ranking.loc[ranking > 0]
+        return ranking.head(n) if n else ranking
+
+    def top_reviewers(self, since: typing.Optional[str] = None, until: typing.Optional[str] = None,
+                      n: typing.Optional[int] = None) -> pd.Series:
+        """ number of reviewed PRs per reviewer """
+        return self._ranking(np.asarray(self.matrix(since, until).sum(axis=1)).ravel(), n)
+
+    def centrality(self, since: typing.Optional[str] = None, until: typing.Optional[str] = None,
+                   n: typing.Optional[int] = None, alpha: float = 0.85, tol: float = 1e-10,
+                   max_iter: int = 100) -> pd.Series:
+        """
+        PageRank of the reviewers, where every reviewed PR is a link from the author to the reviewer: reviewers of
+        many (central) authors rank high.
+        """
+        matrix = self.matrix(since, until)
+        # only logins with reviews in the time range take part
+        active = np.flatnonzero(np.asarray(matrix.sum(axis=0)).ravel() + np.asarray(matrix.sum(axis=1)).ravel())
+        links = matrix[active][:, active].T.tocsr().astype(np.float64)
+        size = len(active)
+        if not size:
+            return pd.Series(dtype=np.float64)
+        out_weights = np.asarray(links.sum(axis=1)).ravel()
+        dangling = out_weights == 0
+        transitions = sparse.diags(np.divide(1., out_weights, out=np.zeros(size), where=~dangling)) @ links
+        transitions = transitions.T.tocsr()
+        rank = np.full(size, 1. / size)
+        for _ in range(max_iter):
+            previous = rank
+            rank = alpha * (transitions @ rank + rank[dangling].sum() / size) + (1 - alpha) / size
+            if np.abs(rank - previous).sum() < size * tol:
+                break
+        ranks = np.zeros(len(self.logins))
+        ranks[active] = rank
+        return self._ranking(ranks, n)
@@ -1,7 +1,7 @@
 from matplotlib import pyplot as plt
 import pandas as pd
-import numpy as np
 import os
+import sqlite3
 
 
 PLOT_EXTENSION = 'svg'
@@ -22,47 +22,49 @@ def initialize_datetime(data: pd.DataFrame):
         if col.endswith('Date') or col.endswith('At'):
             data[col] = pd.to_datetime(data[col])
 
-def add_first_review_column(dataset: pd.DataFrame):
-    def min_review(row):
-        ts = np.nan
-        ts2 = np.nan
-        if isinstance(row['firstReviewThreadCreatedAt'], pd.Timestamp): 
-            ts = row['firstReviewThreadCreatedAt']
-        if isinstance(row['firstReviewCreatedAt'], pd.Timestamp):
-            ts2 = row['firstReviewCreatedAt']
-        if ts is np.nan:
-            return ts2
-        if ts2 is np.nan:
-            return ts
-        return min(ts, ts2)
+def load_table(fname: str) -> pd.DataFrame:
+    if os.path.splitext(fname)[1] == '.parquet':
+        return pd.read_parquet(fname)
+    data = pd.read_json(fname, lines=True)
+    initialize_datetime(data)
+    return data
 
+def load_metrics(fname: str, project: str, components: bool = False) -> pd.DataFrame:
+    table = 'monthly_components' if components else 'monthly'
+    with sqlite3.connect(fname) as db:
+        data = pd.read_sql_query(f"SELECT * FROM {table} WHERE project = ? ORDER BY month", db, params=(project,))
+    data['month'] = pd.to_datetime(data['month'])
+    return data
+
+def add_first_review_column(dataset: pd.DataFrame):
     assert 'firstReviewCreatedAt' in dataset.columns
     assert 'firstReviewThreadCreatedAt' in dataset.columns
-    return dataset.apply(min_review, axis=1)
+    reviews = pd.to_datetime(dataset['firstReviewCreatedAt'])
+    review_threads = pd.to_datetime(dataset['firstReviewThreadCreatedAt'])
+    # the earlier of both, NaT only if both are missing
+    return reviews.where(review_threads.isna() | (reviews <= review_threads), review_threads)
 
 def add_time_to_first_review_column(dataset: pd.DataFrame):
-    def time_to_first_review(row):
-        if row['createdAt'] is np.nan or row['createdAt'] is None:
-            return np.nan
-        if row['firstReview'] is np.nan or row['firstReview'] is None:
-            return np.nan
-        return pd.to_datetime(row['firstReview']) - pd.to_datetime(row['createdAt'])
-
     assert 'createdAt' in dataset.columns
     assert 'firstReview' in dataset.columns
-    return dataset.apply(time_to_first_review, axis=1)
+    return pd.to_datetime(dataset['firstReview']) - pd.to_datetime(dataset['createdAt'])
 
 def add_lifetime_column(dataset: pd.DataFrame):
-    def life_time(row):
-        if row['createdAt'] is np.nan or row['createdAt'] is None:
-            return np.nan
-        if row['closedAt'] is np.nan or row['closedAt'] is None:
-            return np.nan
-        return pd.to_datetime(row['closedAt']) - pd.to_datetime(row['createdAt'])
+    assert 'createdAt' in dataset.columns
+    assert 'closedAt' in dataset.columns
+    return pd.to_datetime(dataset['closedAt']) - pd.to_datetime(dataset['createdAt'])
+
+def add_merged_without_review_column(dataset: pd.DataFrame):
+    assert 'mergedAt' in dataset.columns
+    return dataset['mergedAt'].notna() & add_first_review_column(dataset).isna()
 
+def count_open_prs(dataset: pd.DataFrame, freq: str = 'D') -> pd.Series:
     assert 'createdAt' in dataset.columns
     assert 'closedAt' in dataset.columns
-    return dataset.apply(life_time, axis=1)
+    opened = pd.Series(1, index=pd.to_datetime(dataset['createdAt']).dropna())
+    closed = pd.Series(-1, index=pd.to_datetime(dataset['closedAt']).dropna())
+    # number of open PRs at the end of each period
+    return pd.concat([opened, closed]).sort_index().cumsum().resample(freq).last().ffill()
 
 def create_label_dataset(data: pd.DataFrame) -> pd.DataFrame:
     data = data.explode('labels')